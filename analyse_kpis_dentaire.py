@@ -13,37 +13,37 @@ from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+from kpi_vectorises import performance_par_groupe, rentabilite_par_minute, taux_fidelisation
+from mesures_performance import instrumenter_classe
+from nettoyage_donnees import charger_donnees_nettoyees, nettoyer_donnees
+from rfm import MoteurRFM
+from table_patients import agreger_patients
+
 # Configuration pour les graphiques
 plt.style.use('seaborn-v0_8')
 sns.set_palette("husl")
 
+@instrumenter_classe(prefixes=('nettoyer_', 'analyse_', 'generer_'))
 class AnalyseDentaire:
     def __init__(self, fichier_donnees="patients_mis_a_jour.xlsx"):
         """Initialisation de l'analyse"""
         print("🦷 Chargement des données dentaires...")
-        self.df = pd.read_excel(fichier_donnees)
+        self.df = charger_donnees_nettoyees(fichier_donnees)
         print(f"✅ Données chargées: {self.df.shape[0]} lignes, {self.df.shape[1]} colonnes")
         
-        # Nettoyage initial
-        self.nettoyer_donnees()
-        
     def nettoyer_donnees(self):
         """Nettoyage et préparation des données"""
         print("🧹 Nettoyage des données...")
-        
-        # Conversion des colonnes de dates
-        colonnes_dates = self.df.select_dtypes(include=['object']).columns
-        for col in colonnes_dates:
-            if 'date' in col.lower() or 'jour' in col.lower():
-                try:
-                    self.df[col] = pd.to_datetime(self.df[col], errors='coerce')
-                except:
-                    pass
-        
-        # Nettoyage des colonnes numériques
-        colonnes_numeriques = self.df.select_dtypes(include=[np.number]).columns
-        for col in colonnes_numeriques:
-            self.df[col] = pd.to_numeric(self.df[col], errors='coerce')
+        self.df = nettoyer_donnees(self.df)
+    
+    @property
+    def patients(self):
+        """Table de synthèse par patient, agrégée une fois pour toutes les analyses patients"""
+        if getattr(self, '_patients', None) is None or self._patients_df is not self.df:
+            self._patients = agreger_patients(self.df, col_patient='patient_id', col_date='date_soin',
+                                              col_montant='montant')
+            self._patients_df = self.df
+        return self._patients
     
     def analyse_performance_soins(self):
         """🦷 1. Performance des soins"""
@@ -53,8 +53,7 @@ class AnalyseDentaire:
         
         # Top 10 soins par chiffre d'affaires
         if 'type_soin' in self.df.columns and 'montant' in self.df.columns:
-            top_soins = self.df.groupby('type_soin')['montant'].agg(['sum', 'count', 'mean']).round(2)
-            top_soins.columns = ['CA_Total', 'Nombre_Actes', 'CA_Moyen']
+            top_soins = performance_par_groupe(self.df, 'type_soin', col_montant='montant').round(2)
             top_soins = top_soins.sort_values('CA_Total', ascending=False).head(10)
             
             print("\n📊 TOP 10 SOINS PAR CHIFFRE D'AFFAIRES:")
@@ -62,15 +61,15 @@ class AnalyseDentaire:
             
             # Rentabilité par minute (si durée disponible)
             if 'duree_soin' in self.df.columns:
-                rentabilite_minute = self.df.groupby('type_soin').apply(
-                    lambda x: (x['montant'].sum() / x['duree_soin'].sum()) if x['duree_soin'].sum() > 0 else 0
+                rentabilite_minute = rentabilite_par_minute(
+                    self.df, 'type_soin', col_montant='montant', col_duree='duree_soin'
                 ).round(2)
                 print("\n⏱️ RENTABILITÉ PAR MINUTE:")
                 print(rentabilite_minute.sort_values(ascending=False).head(10))
         
         # Nombre moyen de soins par patient
         if 'patient_id' in self.df.columns:
-            soins_par_patient = self.df.groupby('patient_id').size()
+            soins_par_patient = self.patients['frequence']
             print(f"\n👥 NOMBRE MOYEN DE SOINS PAR PATIENT: {soins_par_patient.mean():.2f}")
             print(f"📈 Médiane: {soins_par_patient.median():.0f}")
             print(f"🔝 Max: {soins_par_patient.max()}")
@@ -83,8 +82,7 @@ class AnalyseDentaire:
         
         if 'praticien' in self.df.columns and 'montant' in self.df.columns:
             # CA moyen par praticien
-            ca_praticien = self.df.groupby('praticien')['montant'].agg(['sum', 'count', 'mean']).round(2)
-            ca_praticien.columns = ['CA_Total', 'Nombre_Actes', 'CA_Moyen']
+            ca_praticien = performance_par_groupe(self.df, 'praticien', col_montant='montant').round(2)
             ca_praticien = ca_praticien.sort_values('CA_Total', ascending=False)
             
             print("\n💰 CA PAR PRATICIEN:")
@@ -92,10 +90,7 @@ class AnalyseDentaire:
             
             # Taux de fidélisation (patients revenus)
             if 'patient_id' in self.df.columns:
-                fidelisation = self.df.groupby(['praticien', 'patient_id']).size().reset_index()
-                fidelisation = fidelisation.groupby('praticien').apply(
-                    lambda x: (x[x[0] > 1].shape[0] / x.shape[0]) * 100
-                ).round(2)
+                fidelisation = taux_fidelisation(self.df, 'praticien', col_patient='patient_id').round(2)
                 
                 print("\n👥 TAUX DE FIDÉLISATION PAR PRATICIEN (%):")
                 print(fidelisation.sort_values(ascending=False))
@@ -108,13 +103,12 @@ class AnalyseDentaire:
         
         if 'patient_id' in self.df.columns:
             # Taux de rétention
-            visites_par_patient = self.df.groupby('patient_id').size()
-            patients_fideles = (visites_par_patient > 1).sum()
-            taux_retention = (patients_fideles / len(visites_par_patient)) * 100
+            patients_fideles = self.patients['fidele'].sum()
+            taux_retention = (patients_fideles / len(self.patients)) * 100
             
             print(f"\n📊 TAUX DE RÉTENTION: {taux_retention:.1f}%")
             print(f"👥 Patients fidèles (2+ visites): {patients_fideles}")
-            print(f"👤 Total patients: {len(visites_par_patient)}")
+            print(f"👤 Total patients: {len(self.patients)}")
             
             # Analyse RFM
             if 'date_soin' in self.df.columns:
@@ -124,38 +118,14 @@ class AnalyseDentaire:
         """Analyse RFM (Récence, Fréquence, Montant)"""
         print("\n📊 ANALYSE RFM:")
         
-        # Calcul RFM
-        rfm = self.df.groupby('patient_id').agg({
-            'date_soin': lambda x: (pd.Timestamp.now() - x.max()).days,  # Récence
-            'patient_id': 'count',  # Fréquence
-            'montant': 'sum'  # Montant
-        }).rename(columns={'date_soin': 'recence', 'patient_id': 'frequence', 'montant': 'montant'})
-        
-        # Segmentation RFM
-        rfm['R'] = pd.qcut(rfm['recence'], q=4, labels=['4', '3', '2', '1'])
-        rfm['F'] = pd.qcut(rfm['frequence'], q=4, labels=['1', '2', '3', '4'])
-        rfm['M'] = pd.qcut(rfm['montant'], q=4, labels=['1', '2', '3', '4'])
-        
-        rfm['RFM_Score'] = rfm['R'].astype(str) + rfm['F'].astype(str) + rfm['M'].astype(str)
-        
-        # Classification des segments
-        def segment_rfm(row):
-            if row['RFM_Score'] >= '444':
-                return 'VIP'
-            elif row['RFM_Score'] >= '333':
-                return 'Fidèle'
-            elif row['RFM_Score'] >= '222':
-                return 'Actif'
-            else:
-                return 'À risque'
-        
-        rfm['Segment'] = rfm.apply(segment_rfm, axis=1)
+        # Scores et segments RFM vectorisés, date de référence = dernier soin des données
+        rfm = MoteurRFM().ajuster_agregats(self.patients)
         
         print("\n📈 RÉPARTITION DES SEGMENTS:")
         print(rfm['Segment'].value_counts())
         
         print("\n💰 MONTANT MOYEN PAR SEGMENT:")
-        print(rfm.groupby('Segment')['montant'].mean().round(2))
+        print(rfm.groupby('Segment', observed=True)['montant'].mean().round(2))
     
     def analyse_paiements(self):
         """💰 4. Paiements et créances"""
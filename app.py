@@ -1,3 +1,6 @@
+import hashlib
+import os
+
 import streamlit as st
 import pandas as pd
 import plotly.express as px
@@ -5,6 +8,15 @@ import plotly.graph_objects as go
 from datetime import datetime
 from streamlit_option_menu import option_menu
 
+from cache_memoire import BUDGET_DEFAUT_MO, CacheLRU, Reservations
+from donnees_graphiques import histogramme, verifier_budget
+from lecture_flux import TAILLE_BLOC, lire_csv_par_blocs
+
+# Memory budget shared by parsed uploads and filter results (APP_CACHE_BUDGET_MB)
+CACHE_BUDGET_MB = int(os.environ.get('APP_CACHE_BUDGET_MB', BUDGET_DEFAUT_MO))
+# CSV uploads above this size are aggregated chunk by chunk instead of loaded whole
+STREAMING_THRESHOLD_MB = int(os.environ.get('APP_STREAMING_THRESHOLD_MB', 100))
+
 # Initialize session state for language
 if 'language' not in st.session_state:
     st.session_state['language'] = 'FR'
@@ -81,15 +93,203 @@ with lang_col2:
 # Main title
 st.title(get_text('title'))
 
+@st.cache_resource
+def get_cache():
+    """LRU cache shared across reruns and sessions, bounded by CACHE_BUDGET_MB"""
+    return CacheLRU(budget_octets=CACHE_BUDGET_MB * 1024**2)
+
+
+def get_holds():
+    """Cache entries this session is displaying: never evicted while it holds them,
+    released when it moves to another file or filter, or when the session ends"""
+    if 'cache_holds' not in st.session_state:
+        st.session_state['cache_holds'] = Reservations(get_cache())
+    return st.session_state['cache_holds']
+
+
+def upload_key(uploaded_file):
+    """Content hash of an upload, computed once per uploaded file"""
+    hashes = st.session_state.setdefault('upload_hashes', {})
+    file_id = getattr(uploaded_file, 'file_id', None)
+    if file_id is None or file_id not in hashes:
+        digest = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+        if file_id is None:
+            return digest
+        hashes[file_id] = digest
+    return hashes[file_id]
+
+
+def parse_upload(uploaded_file):
+    """Read the uploaded file and parse its dates (done once per file content)"""
+    if uploaded_file.name.endswith('.csv'):
+        df = pd.read_csv(uploaded_file)
+    else:
+        df = pd.read_excel(uploaded_file)
+    df['Date du soin'] = pd.to_datetime(df['Date du soin'])
+    return df
+
+
+def filter_data(df, start_date, end_date, clinics, practitioners, treatments):
+    """Rows matching the date range and the selected clinics, practitioners and treatments"""
+    dates = df['Date du soin']
+    mask = (dates >= pd.Timestamp(start_date)) & (dates < pd.Timestamp(end_date) + pd.Timedelta(days=1))
+    for column, values in [('Nom de la clinique', clinics),
+                           ('Nom complet praticien', practitioners),
+                           ('Type de soin normalisé', treatments)]:
+        if values:
+            mask &= df[column].isin(list(values))
+    if mask.all():
+        return df
+    return df.loc[mask]
+
+
+def is_streamed(uploaded_file):
+    """Large CSV exports go through the chunked reader"""
+    return uploaded_file.name.endswith('.csv') and uploaded_file.size > STREAMING_THRESHOLD_MB * 1024**2
+
+
+def gauge(value, title, axis_range, color, suffix=''):
+    return go.Figure(go.Indicator(
+        mode="gauge+number",
+        value=value,
+        number={'suffix': suffix},
+        title={'text': title},
+        gauge={'axis': {'range': axis_range}, 'bar': {'color': color}}
+    ))
+
+
+def show_chart(fig):
+    """Plotly chart, logged when its payload exceeds the per-figure budget"""
+    verifier_budget(fig)
+    st.plotly_chart(fig, use_container_width=True)
+
+
+def show_streamed_dashboard(holds, key, uploaded_file):
+    """Overview and analytics of a large CSV, computed from chunk-by-chunk aggregates.
+
+    The full table is never built: memory is bounded by one chunk plus the
+    capped (month, clinic, practitioner, treatment) cube. Patient-level pages need the
+    full table and are not available in this mode.
+    """
+    def aggregate():
+        uploaded_file.seek(0)
+        return lire_csv_par_blocs(uploaded_file)
+
+    stats = holds.tenir('upload', ('stream', key), aggregate)
+    st.caption(f"📦 {stats.nb_lignes:,} lignes agrégées par blocs de {TAILLE_BLOC:,}")
+
+    selected = option_menu(
+        menu_title=None,
+        options=[get_text('overview'), get_text('analytics'), get_text('insights')],
+        icons=['house', 'bar-chart', 'lightbulb'],
+        orientation='horizontal',
+    )
+
+    st.sidebar.header('Filters')
+    min_date, max_date = stats.periode()
+    start_date, end_date = st.sidebar.date_input(
+        get_text('filter_date'),
+        value=(min_date, max_date),
+        min_value=min_date,
+        max_value=max_date
+    )
+    clinic = st.sidebar.multiselect(get_text('filter_clinic'), stats.modalites('clinique'))
+    practitioner = st.sidebar.multiselect(get_text('filter_practitioner'), stats.modalites('praticien'))
+    treatment = st.sidebar.multiselect(get_text('filter_treatment'), stats.modalites('soin'))
+
+    filters = (start_date, end_date, frozenset(clinic), frozenset(practitioner), frozenset(treatment))
+    cube = holds.tenir('filter', ('stream-filter', key) + filters, lambda: stats.filtrer(*filters))
+    metrics = stats.metriques(cube)
+    patients = holds.tenir('patients', ('stream-patients', key) + filters, lambda: stats.nb_patients(*filters))
+
+    if selected == get_text('overview'):
+        st.subheader('1. ' + get_text('overview'))
+        col1, col2, col3, col4, col5 = st.columns(5)
+
+        with col1:
+            # Distinct patients of the filtered months, estimated from merged HLL sketches
+            # (an upper bound when several of clinic / practitioner / treatment are filtered)
+            st.metric('🧑‍🤝‍🧑 ' + get_text('total_patients'), f"{patients:,}",
+                      help=f"HyperLogLog, ±{stats.erreur_patients:.1%}, mois entiers")
+        with col2:
+            st.metric('💰 ' + get_text('total_revenue'), f"CHF {metrics['total_revenue']:,.2f}")
+        with col3:
+            st.metric('🏦 Montant payé', f"CHF {metrics['total_paid']:,.2f}")
+        with col4:
+            st.metric('📉 Reste à charge', f"CHF {metrics['remaining']:,.2f}")
+        with col5:
+            fig = gauge(metrics['avg_satisfaction'], "😃 Satisfaction moyenne", [1, 5], "darkblue")
+            fig.update_traces(gauge={'steps': [
+                {'range': [1, 2], 'color': "red"},
+                {'range': [2, 3], 'color': "orange"},
+                {'range': [3, 4], 'color': "yellow"},
+                {'range': [4, 5], 'color': "green"}
+            ]})
+            show_chart(fig)
+
+        st.subheader('2. Activité des soins')
+        col1, col2 = st.columns(2)
+
+        with col1:
+            monthly_treatments = stats.par('mois', 'nb_soins', cube).reset_index()
+            monthly_treatments.columns = ['Date du soin', 'Nombre de soins']
+            monthly_treatments['Date du soin'] = monthly_treatments['Date du soin'].astype(str)
+            fig = px.line(monthly_treatments, x='Date du soin', y='Nombre de soins',
+                          title='📅 Nombre de soins par mois')
+            show_chart(fig)
+
+        with col2:
+            top_treatments = stats.par('soin', 'nb_soins', cube).nlargest(5)
+            fig = px.bar(top_treatments, orientation='h',
+                         title='🦷 Top 5 des soins les plus fréquents')
+            show_chart(fig)
+
+        col3, col4, col5 = st.columns(3)
+
+        with col3:
+            fig = gauge(metrics['avg_duration'], "⏱️ Durée moyenne des soins (minutes)",
+                        [0, metrics['max_duration']], "darkblue")
+            show_chart(fig)
+
+        with col4:
+            fig = gauge(metrics['missed_rate'], "📆 Taux de rendez-vous manqués", [0, 100], "red", suffix="%")
+            show_chart(fig)
+
+        with col5:
+            st.metric('⏳ Paiements en retard', f"{metrics['late_payments']:,}",
+                      help=f"dont {metrics['late_payments_30d']:,} de plus de 30 jours")
+            st.metric('📅 Retard moyen (jours)', f"{metrics['avg_late_days']:.1f}")
+
+    elif selected == get_text('analytics'):
+        st.subheader(get_text('top_treatments'))
+        treatment_revenue = stats.par('soin', 'ca', cube).sort_values(ascending=False)
+        fig = px.bar(treatment_revenue, labels={'soin': 'Type de soin', 'value': 'Revenu (CHF)'})
+        show_chart(fig)
+
+        st.subheader(get_text('revenue_by_clinic'))
+        clinic_revenue = stats.par('clinique', 'ca', cube).sort_values(ascending=False)
+        fig = px.bar(clinic_revenue, labels={'clinique': 'Clinique', 'value': 'Revenu (CHF)'})
+        show_chart(fig)
+
+    else:
+        st.info(f"Fichier de plus de {STREAMING_THRESHOLD_MB} Mo : les analyses par patient "
+                "nécessitent la table complète et ne sont pas disponibles.")
+
+
 # File uploader
 uploaded_file = st.file_uploader(get_text('upload'), type=['xlsx', 'csv'])
 
 if uploaded_file is not None:
     try:
-        if uploaded_file.name.endswith('.csv'):
-            df = pd.read_csv(uploaded_file)
-        else:
-            df = pd.read_excel(uploaded_file)
+        cache = get_cache()
+        holds = get_holds()
+        key = upload_key(uploaded_file)
+        if is_streamed(uploaded_file):
+            show_streamed_dashboard(holds, key, uploaded_file)
+            st.stop()
+
+        # One parsed copy per file content, shared read-only by every session showing it
+        df = holds.tenir('upload', ('upload', key), lambda: parse_upload(uploaded_file))
 
         # Navigation menu
         selected = option_menu(
@@ -103,7 +303,6 @@ if uploaded_file is not None:
         st.sidebar.header('Filters')
 
         # Date filter
-        df['Date du soin'] = pd.to_datetime(df['Date du soin'])
         min_date = df['Date du soin'].min()
         max_date = df['Date du soin'].max()
         start_date, end_date = st.sidebar.date_input(
@@ -113,25 +312,23 @@ if uploaded_file is not None:
             max_value=max_date
         )
 
-        # Apply date filter
-        mask = (df['Date du soin'].dt.date >= start_date) & (df['Date du soin'].dt.date <= end_date)
-        df_filtered = df.loc[mask]
-
         # Other filters
+        def options(column):
+            return cache.obtenir(('options', key, column), lambda: df[column].unique())
+
+        clinic = practitioner = treatment = []
         if 'Nom de la clinique' in df.columns:
-            clinic = st.sidebar.multiselect(get_text('filter_clinic'), df['Nom de la clinique'].unique())
-            if clinic:
-                df_filtered = df_filtered[df_filtered['Nom de la clinique'].isin(clinic)]
+            clinic = st.sidebar.multiselect(get_text('filter_clinic'), options('Nom de la clinique'))
 
         if 'Nom complet praticien' in df.columns:
-            practitioner = st.sidebar.multiselect(get_text('filter_practitioner'), df['Nom complet praticien'].unique())
-            if practitioner:
-                df_filtered = df_filtered[df_filtered['Nom complet praticien'].isin(practitioner)]
+            practitioner = st.sidebar.multiselect(get_text('filter_practitioner'), options('Nom complet praticien'))
 
         if 'Type de soin normalisé' in df.columns:
-            treatment = st.sidebar.multiselect(get_text('filter_treatment'), df['Type de soin normalisé'].unique())
-            if treatment:
-                df_filtered = df_filtered[df_filtered['Type de soin normalisé'].isin(treatment)]
+            treatment = st.sidebar.multiselect(get_text('filter_treatment'), options('Type de soin normalisé'))
+
+        # Each filter combination is computed once, then served from the cache
+        filters = (start_date, end_date, frozenset(clinic), frozenset(practitioner), frozenset(treatment))
+        df_filtered = holds.tenir('filter', ('filter', key) + filters, lambda: filter_data(df, *filters))
 
         # Overview page
         if selected == get_text('overview'):
@@ -169,7 +366,7 @@ if uploaded_file is not None:
                                {'range': [4, 5], 'color': "green"}
                            ]}
                 ))
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(fig)
 
             # 2. Activité des soins
             st.subheader('2. Activité des soins')
@@ -182,14 +379,14 @@ if uploaded_file is not None:
                 monthly_treatments['Date du soin'] = monthly_treatments['Date du soin'].astype(str)
                 fig = px.line(monthly_treatments, x='Date du soin', y='Nombre de soins',
                              title='📅 Nombre de soins par mois')
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(fig)
 
             with col2:
                 # Soins les plus fréquents
                 top_treatments = df_filtered['Type de soin normalisé'].value_counts().head(5)
                 fig = px.bar(top_treatments, orientation='h',
                             title='🦷 Top 5 des soins les plus fréquents')
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(fig)
 
             col3, col4 = st.columns(2)
 
@@ -203,7 +400,7 @@ if uploaded_file is not None:
                     gauge={'axis': {'range': [0, df_filtered['Durée (minutes)'].max()]},
                            'bar': {'color': "darkblue"}}
                 ))
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(fig)
 
             with col4:
                 # Taux de rendez-vous manqués
@@ -216,7 +413,7 @@ if uploaded_file is not None:
                     gauge={'axis': {'range': [0, 100]},
                            'bar': {'color': "red"}}
                 ))
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(fig)
 
         # Analytics page
         elif selected == get_text('analytics'):
@@ -224,13 +421,13 @@ if uploaded_file is not None:
             st.subheader(get_text('top_treatments'))
             treatment_revenue = df_filtered.groupby('Type de soin normalisé')['Montant total (CHF)'].sum().sort_values(ascending=False)
             fig = px.bar(treatment_revenue, labels={'Type de soin normalisé': 'Type de soin', 'Montant total (CHF)': 'Revenu (CHF)'})
-            st.plotly_chart(fig, use_container_width=True)
+            show_chart(fig)
 
             # Revenue by Clinic
             st.subheader(get_text('revenue_by_clinic'))
             clinic_revenue = df_filtered.groupby('Nom de la clinique')['Montant total (CHF)'].sum().sort_values(ascending=False)
             fig = px.bar(clinic_revenue, labels={'Nom de la clinique': 'Clinique', 'Montant total (CHF)': 'Revenu (CHF)'})
-            st.plotly_chart(fig, use_container_width=True)
+            show_chart(fig)
 
         # Insights page
         elif selected == get_text('insights'):
@@ -251,30 +448,31 @@ if uploaded_file is not None:
                     gauge={'axis': {'range': [0, 100]},
                            'bar': {'color': "green"}}
                 ))
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(fig)
 
             with col2:
                 # Répartition hommes/femmes
                 gender_dist = df_filtered['Sexe'].value_counts()
                 fig = px.pie(values=gender_dist.values, names=gender_dist.index,
                             title='👥 Répartition hommes/femmes')
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(fig)
 
             col3, col4 = st.columns(2)
 
             with col3:
                 # Visites moyennes par patient
                 visits_per_patient = df_filtered.groupby('PatientID').size()
-                fig = px.histogram(visits_per_patient, title='📈 Distribution des visites par patient',
-                                  labels={'value': 'Nombre de visites', 'count': 'Nombre de patients'})
-                st.plotly_chart(fig, use_container_width=True)
+                # Binned on the server: only bin edges and counts reach the browser
+                fig = histogramme(visits_per_patient, titre='📈 Distribution des visites par patient',
+                                  etiquette_x='Nombre de visites', etiquette_y='Nombre de patients')
+                show_chart(fig)
 
             with col4:
                 # Répartition par canton
                 canton_dist = df_filtered['Canton clinique'].value_counts()
                 fig = px.bar(canton_dist, title='🗺️ Répartition par canton',
                             labels={'index': 'Canton', 'value': 'Nombre de patients'})
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(fig)
 
             # 5. Performances individuelles
             st.subheader('5. Performances individuelles')
@@ -286,7 +484,7 @@ if uploaded_file is not None:
                 fig = px.bar(hourly_revenue, orientation='h',
                             title='💸 Revenu horaire moyen par praticien',
                             labels={'Nom complet praticien': 'Praticien', 'value': 'CHF/h'})
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(fig)
 
             with col2:
                 # Satisfaction par praticien
@@ -294,14 +492,14 @@ if uploaded_file is not None:
                 fig = px.bar(satisfaction_by_pract, orientation='h',
                             title='🌟 Satisfaction moyenne par praticien',
                             labels={'Nom complet praticien': 'Praticien', 'value': 'Note /5'})
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(fig)
 
             # Montant moyen par soin
             avg_amount_by_treatment = df_filtered.groupby('Type de soin normalisé')['Montant total (CHF)'].mean().sort_values(ascending=False)
             st.subheader('🧾 Montant moyen par type de soin')
             fig = px.bar(avg_amount_by_treatment,
                         labels={'Type de soin normalisé': 'Type de soin', 'value': 'Montant moyen (CHF)'})
-            st.plotly_chart(fig, use_container_width=True)
+            show_chart(fig)
             practitioner_performance = df_filtered.groupby('Nom complet praticien').agg({
                 'Montant total (CHF)': 'sum',
                 'PatientID': 'nunique',
@@ -313,7 +511,7 @@ if uploaded_file is not None:
                 go.Bar(name='Nombre de patients', x=practitioner_performance.index, y=practitioner_performance['PatientID'])
             ])
             fig.update_layout(barmode='group')
-            st.plotly_chart(fig, use_container_width=True)
+            show_chart(fig)
 
     except Exception as e:
         st.error(f"Error processing file: {str(e)}")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Cache des figures PNG adressé par contenu
+Auteur: Assistant IA
+Date: 2024
+
+Une figure est rangée sous le nom de l'empreinte de ses agrégats et de ses
+paramètres de rendu (visualisations/cache/<empreinte>.png). Une relance sur
+des données inchangées retrouve l'image au lieu de la retracer, y compris
+quand les données reviennent à un état déjà rendu. Le fichier publié
+(visualisations/performance_soins.png...) est un lien physique vers l'entrée
+du cache, ou une copie si le système de fichiers ne le permet pas.
+
+Les entrées sont évincées par âge (dernière utilisation) ou par taille
+totale, les moins récemment utilisées d'abord.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+DOSSIER_FIGURES = "visualisations"
+AGE_MAX_JOURS = 30
+TAILLE_MAX_MO = 200
+
+
+class CacheFigures:
+    """Fichiers PNG indexés par empreinte, avec compteurs de succès et d'échecs"""
+
+    def __init__(self, dossier=os.path.join(DOSSIER_FIGURES, "cache"),
+                 age_max_jours=AGE_MAX_JOURS, taille_max_mo=TAILLE_MAX_MO):
+        self.dossier = dossier
+        self.age_max_jours = age_max_jours
+        self.taille_max_mo = taille_max_mo
+        self.succes = 0
+        self.echecs = 0
+        os.makedirs(dossier, exist_ok=True)
+
+    def chemin(self, empreinte):
+        return os.path.join(self.dossier, f"{empreinte}.png")
+
+    def lire(self, empreinte):
+        """Chemin de l'image en cache (marquée comme récemment utilisée), ou None"""
+        chemin = self.chemin(empreinte)
+        if not os.path.exists(chemin):
+            self.echecs += 1
+            return None
+        # La date de modification sert de date de dernière utilisation pour l'éviction
+        os.utime(chemin)
+        self.succes += 1
+        return chemin
+
+    def ecrire(self, empreinte, enregistrer):
+        """Enregistre une image via `enregistrer(chemin)` ; l'entrée n'apparaît qu'une fois complète"""
+        descripteur, temporaire = tempfile.mkstemp(suffix=".png", dir=self.dossier)
+        os.close(descripteur)
+        try:
+            enregistrer(temporaire)
+            # mkstemp crée le fichier en 0600 ; les figures publiées doivent rester lisibles
+            os.chmod(temporaire, 0o644)
+            os.replace(temporaire, self.chemin(empreinte))
+        except BaseException:
+            if os.path.exists(temporaire):
+                os.remove(temporaire)
+            raise
+        return self.chemin(empreinte)
+
+    @staticmethod
+    def publier(source, destination):
+        """Expose une entrée du cache sous son nom de figure (lien physique ou copie)"""
+        if os.path.exists(destination):
+            if os.path.samefile(source, destination):
+                return destination
+            os.remove(destination)
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copy2(source, destination)
+        return destination
+
+    def entrees(self):
+        """[(chemin, taille, dernière utilisation)] des images en cache, les plus anciennes d'abord"""
+        entrees = []
+        for nom in os.listdir(self.dossier):
+            if not nom.endswith(".png") or nom.startswith("tmp"):
+                continue
+            chemin = os.path.join(self.dossier, nom)
+            infos = os.stat(chemin)
+            entrees.append((chemin, infos.st_size, infos.st_mtime))
+        return sorted(entrees, key=lambda e: e[2])
+
+    def evincer(self, age_max_jours=None, taille_max_mo=None):
+        """Supprime les entrées inutilisées depuis `age_max_jours`, puis les plus
+        anciennes tant que le cache dépasse `taille_max_mo`. Renvoie le nombre supprimé."""
+        age_max_jours = self.age_max_jours if age_max_jours is None else age_max_jours
+        taille_max_mo = self.taille_max_mo if taille_max_mo is None else taille_max_mo
+
+        entrees = self.entrees()
+        occupation = sum(taille for _, taille, _ in entrees)
+        limite_age = time.time() - age_max_jours * 86400 if age_max_jours is not None else None
+        supprimees = 0
+        for chemin, taille, utilisation in entrees:
+            trop_vieille = limite_age is not None and utilisation < limite_age
+            trop_gros = taille_max_mo is not None and occupation > taille_max_mo * 1024**2
+            if not (trop_vieille or trop_gros):
+                break
+            os.remove(chemin)
+            occupation -= taille
+            supprimees += 1
+        return supprimees
+
+    def vider(self):
+        for chemin, _, _ in self.entrees():
+            os.remove(chemin)
+
+    def statistiques(self):
+        """Succès, échecs et occupation du cache, pour l'affichage ou les logs"""
+        entrees = self.entrees()
+        total = self.succes + self.echecs
+        return {
+            'succes': self.succes,
+            'echecs': self.echecs,
+            'entrees': len(entrees),
+            'occupation_mo': sum(taille for _, taille, _ in entrees) / 1024**2,
+            'taux_succes': self.succes / total if total else 0.0,
+        }
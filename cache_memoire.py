@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Cache LRU en mémoire borné par un budget en octets
+Auteur: Assistant IA
+Date: 2024
+
+Les entrées (DataFrames, tableaux, résultats de filtres...) sont mesurées à
+l'insertion ; quand le budget est dépassé, les entrées les moins récemment
+utilisées sont évincées. Une même valeur rangée sous plusieurs clés (ex.
+filtre sans effet) est comptée une fois, tant qu'une de ses clés reste en
+cache. Le cache est protégé par un verrou : une même
+instance peut être partagée entre les sessions Streamlit (st.cache_resource).
+
+Une entrée acquise (acquerir) porte un compteur de références et n'est pas
+évincée tant qu'un consommateur la tient : les sessions qui affichent le même
+fichier partagent un seul exemplaire en lecture seule, au lieu d'en recalculer
+un chacune après une éviction. Reservations tient les entrées d'une session et
+les libère avec elle.
+"""
+
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+BUDGET_DEFAUT_MO = 512
+
+
+def taille_objet(valeur):
+    """Estimation de la mémoire occupée par une valeur mise en cache (octets)"""
+    if isinstance(valeur, pd.DataFrame):
+        return int(valeur.memory_usage(deep=True).sum())
+    if isinstance(valeur, (pd.Series, pd.Index)):
+        return int(valeur.memory_usage(deep=True))
+    if isinstance(valeur, np.ndarray):
+        return int(valeur.nbytes)
+    if isinstance(valeur, (list, tuple, set, frozenset)):
+        return sys.getsizeof(valeur) + sum(taille_objet(v) for v in valeur)
+    if isinstance(valeur, dict):
+        return sys.getsizeof(valeur) + sum(taille_objet(k) + taille_objet(v) for k, v in valeur.items())
+    return sys.getsizeof(valeur)
+
+
+class _Entree:
+    __slots__ = ('valeur', 'taille', 'references')
+
+    def __init__(self, valeur, taille):
+        self.valeur = valeur
+        self.taille = taille
+        self.references = 0
+
+
+class CacheLRU:
+    """Cache clé -> valeur, évincé par ancienneté d'utilisation au-delà du budget
+
+    Les entrées tenues par au moins un consommateur ne sont jamais évincées ;
+    elles comptent dans l'occupation, qui peut alors dépasser le budget.
+    """
+
+    def __init__(self, budget_octets=BUDGET_DEFAUT_MO * 1024**2):
+        self.budget_octets = budget_octets
+        self._entrees = OrderedDict()  # clé -> _Entree
+        self._objets = {}  # id(valeur) -> [taille, nombre de clés] : une valeur est comptée une fois
+        self._calculs = {}  # clé -> verrou du calcul en cours
+        self._verrou = threading.Lock()
+        self.occupation = 0
+        self.succes = 0
+        self.echecs = 0
+
+    def __contains__(self, cle):
+        with self._verrou:
+            return cle in self._entrees
+
+    def __len__(self):
+        return len(self._entrees)
+
+    def lire(self, cle, defaut=None):
+        """Valeur en cache (marquée comme récemment utilisée), ou `defaut`"""
+        with self._verrou:
+            if cle not in self._entrees:
+                self.echecs += 1
+                return defaut
+            self._entrees.move_to_end(cle)
+            self.succes += 1
+            return self._entrees[cle].valeur
+
+    def _taille(self, valeur):
+        with self._verrou:
+            # Un objet déjà en cache sous une autre clé n'est pas mesuré de nouveau
+            objet = self._objets.get(id(valeur))
+            if objet is not None:
+                return objet[0]
+        return taille_objet(valeur)
+
+    def _compter(self, entree):
+        """Ajoute une clé à sa valeur ; la valeur n'est comptée qu'à sa première clé (verrou déjà pris)"""
+        objet = self._objets.setdefault(id(entree.valeur), [entree.taille, 0])
+        if objet[1] == 0:
+            self.occupation += objet[0]
+        objet[1] += 1
+
+    def _decompter(self, entree):
+        """Retire une clé de sa valeur ; la mémoire n'est rendue qu'avec sa dernière clé (verrou déjà pris)"""
+        objet = self._objets[id(entree.valeur)]
+        objet[1] -= 1
+        if objet[1] == 0:
+            del self._objets[id(entree.valeur)]
+            self.occupation -= objet[0]
+
+    def ecrire(self, cle, valeur):
+        """Insère une valeur ; une valeur plus grosse que le budget n'est gardée que si elle est tenue"""
+        taille = self._taille(valeur)
+        with self._verrou:
+            self._inserer(cle, valeur, taille)
+            self._evincer()
+        return valeur
+
+    def _inserer(self, cle, valeur, taille, tenue=False):
+        """Remplace la valeur d'une clé, en conservant ses références (verrou déjà pris)"""
+        ancienne = self._entrees.pop(cle, None)
+        references = 0
+        if ancienne is not None:
+            self._decompter(ancienne)
+            references = ancienne.references
+        if taille > self.budget_octets and not (references or tenue):
+            return None
+        entree = self._entrees[cle] = _Entree(valeur, taille)
+        entree.references = references
+        self._compter(entree)
+        return entree
+
+    def obtenir(self, cle, calculer):
+        """Valeur en cache, ou calculée par `calculer()` puis mise en cache"""
+        sentinelle = object()
+        valeur = self.lire(cle, sentinelle)
+        if valeur is sentinelle:
+            valeur = self._calculer(cle, calculer, acquerir=False)
+        return valeur
+
+    def acquerir(self, cle, calculer):
+        """Comme obtenir(), mais l'entrée est tenue (non évincée) jusqu'à liberer(cle)"""
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is not None:
+                entree.references += 1
+                self._entrees.move_to_end(cle)
+                self.succes += 1
+                return entree.valeur
+            self.echecs += 1
+        return self._calculer(cle, calculer, acquerir=True)
+
+    def _calculer(self, cle, calculer, acquerir):
+        """Calcule une valeur absente, une seule fois même si plusieurs sessions la demandent ensemble"""
+        with self._verrou:
+            verrou_cle = self._calculs.setdefault(cle, threading.Lock())
+        try:
+            with verrou_cle:
+                with self._verrou:
+                    # Une valeur calculée entre-temps par une autre session est partagée
+                    entree = self._entrees.get(cle)
+                    if entree is not None:
+                        entree.references += acquerir
+                        self._entrees.move_to_end(cle)
+                        return entree.valeur
+                # Calculée hors du verrou global : les autres clés restent accessibles
+                valeur = calculer()
+                taille = self._taille(valeur)
+                with self._verrou:
+                    entree = self._inserer(cle, valeur, taille, tenue=acquerir)
+                    if entree is None:
+                        # Valeur plus grosse que le budget, que personne ne tient
+                        return valeur
+                    entree.references += acquerir
+                    self._evincer()
+                    return valeur
+        finally:
+            with self._verrou:
+                if self._calculs.get(cle) is verrou_cle:
+                    del self._calculs[cle]
+
+    def liberer(self, cle):
+        """Rend une entrée acquise ; évinçable dès que plus personne ne la tient"""
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is not None and entree.references > 0:
+                entree.references -= 1
+                self._evincer()
+
+    def _evincer(self):
+        if self.occupation <= self.budget_octets:
+            return
+        for cle, entree in list(self._entrees.items()):
+            if self.occupation <= self.budget_octets:
+                break
+            if not entree.references:
+                del self._entrees[cle]
+                self._decompter(entree)
+
+    def vider(self):
+        """Oublie toutes les entrées, y compris celles tenues (leurs détenteurs gardent leur valeur)"""
+        with self._verrou:
+            self._entrees.clear()
+            self._objets.clear()
+            self.occupation = 0
+
+    def statistiques(self):
+        """Occupation et taux de succès, pour l'affichage ou les logs"""
+        total = self.succes + self.echecs
+        with self._verrou:
+            tenues = [e for e in self._entrees.values() if e.references]
+            tailles_tenues = {id(e.valeur): e.taille for e in tenues}
+        return {
+            'entrees': len(self._entrees),
+            'entrees_tenues': len(tenues),
+            'references': sum(e.references for e in tenues),
+            'occupation_mo': self.occupation / 1024**2,
+            'occupation_tenue_mo': sum(tailles_tenues.values()) / 1024**2,
+            'budget_mo': self.budget_octets / 1024**2,
+            'taux_succes': self.succes / total if total else 0.0,
+        }
+
+
+def _liberer_toutes(cache, tenues):
+    for cle in tenues.values():
+        cache.liberer(cle)
+    tenues.clear()
+
+
+class Reservations:
+    """Entrées d'un cache tenues par un consommateur (une session Streamlit)
+
+    Chaque emplacement (ex. 'fichier', 'filtre') tient au plus une clé :
+    tenir une nouvelle clé rend la précédente. Toutes sont rendues par
+    liberer_tout(), ou quand l'objet est détruit avec sa session.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._tenues = {}  # emplacement -> clé
+        self._finaliseur = weakref.finalize(self, _liberer_toutes, cache, self._tenues)
+
+    def tenir(self, emplacement, cle, calculer):
+        """Valeur de `cle` (calculée au besoin), tenue jusqu'au changement d'emplacement"""
+        if self._tenues.get(emplacement) == cle:
+            return self.cache.obtenir(cle, calculer)
+        valeur = self.cache.acquerir(cle, calculer)
+        ancienne = self._tenues.get(emplacement)
+        self._tenues[emplacement] = cle
+        if ancienne is not None:
+            self.cache.liberer(ancienne)
+        return valeur
+
+    def liberer_tout(self):
+        _liberer_toutes(self.cache, self._tenues)
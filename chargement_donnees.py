@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Chargement partagé des données du cabinet dentaire avec cache colonnaire
+Auteur: Assistant IA
+Date: 2024
+
+Le classeur Excel est converti une seule fois en fichier Arrow IPC (Feather)
+typé, rangé dans un dossier `.cache/` à côté du fichier source. Les
+chargements suivants lisent ce fichier en mémoire mappée. Le cache est
+reconstruit automatiquement dès que le fichier Excel change (mtime + SHA-256).
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from mesures_performance import instrumenter
+
+FICHIER_DONNEES = os.path.join("data", "patients_mis_a_jour.xlsx")
+DOSSIER_CACHE = ".cache"
+
+# À incrémenter quand le format du cache change, pour invalider les anciens fichiers
+VERSION_CACHE = 1
+
+
+def empreinte_fichier(chemin, taille_bloc=1 << 20):
+    """Empreinte SHA-256 du contenu d'un fichier"""
+    sha = hashlib.sha256()
+    with open(chemin, "rb") as f:
+        for bloc in iter(lambda: f.read(taille_bloc), b""):
+            sha.update(bloc)
+    return sha.hexdigest()
+
+
+def chemins_cache(chemin, suffixe="brut"):
+    """Chemins (données, métadonnées) du cache associé à un fichier source"""
+    dossier = os.path.join(os.path.dirname(os.path.abspath(chemin)), DOSSIER_CACHE)
+    base = os.path.join(dossier, f"{os.path.basename(chemin)}.{suffixe}")
+    return base + ".feather", base + ".json"
+
+
+def _lire_meta(chemin_meta):
+    try:
+        with open(chemin_meta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _ecrire_atomique(chemin, ecrire):
+    """Écrit via un fichier temporaire pour ne jamais laisser un cache tronqué"""
+    tmp = f"{chemin}.{os.getpid()}.tmp"
+    try:
+        ecrire(tmp)
+        os.replace(tmp, chemin)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _ecrire_meta(chemin_meta, meta):
+    def ecrire(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+    _ecrire_atomique(chemin_meta, ecrire)
+
+
+def signature_source(chemin, empreinte=None):
+    """Signature (mtime, taille, empreinte) du fichier source"""
+    stat = os.stat(chemin)
+    return {
+        "version": VERSION_CACHE,
+        "mtime_ns": stat.st_mtime_ns,
+        "taille": stat.st_size,
+        "sha256": empreinte or empreinte_fichier(chemin),
+    }
+
+
+def source_inchangee(chemin, meta):
+    """Vrai si la signature `meta` (signature_source) décrit toujours le fichier source
+
+    Le mtime et la taille suffisent dans le cas courant ; l'empreinte n'est
+    recalculée que si le mtime a bougé (copie, checkout git...), ce qui évite
+    une reconstruction quand le contenu est identique. Dans ce cas, le mtime
+    de `meta` est mis à jour : à l'appelant de la réécrire.
+    """
+    if meta is None or meta.get("version") != VERSION_CACHE:
+        return False
+
+    stat = os.stat(chemin)
+    if stat.st_size != meta.get("taille"):
+        return False
+    if stat.st_mtime_ns == meta.get("mtime_ns"):
+        return True
+
+    if empreinte_fichier(chemin) != meta.get("sha256"):
+        return False
+    meta["mtime_ns"] = stat.st_mtime_ns
+    return True
+
+
+def cache_valide(chemin, suffixe="brut"):
+    """Vrai si le cache correspond toujours au fichier source"""
+    chemin_donnees, chemin_meta = chemins_cache(chemin, suffixe)
+    meta = _lire_meta(chemin_meta)
+    if meta is None or not os.path.exists(chemin_donnees):
+        return False
+
+    mtime = meta.get("mtime_ns")
+    if not source_inchangee(chemin, meta):
+        return False
+    if meta["mtime_ns"] != mtime:
+        try:
+            _ecrire_meta(chemin_meta, meta)
+        except OSError:
+            pass
+    return True
+
+
+def typer_colonnes(df):
+    """Rend les colonnes texte compatibles Arrow (types mixtes -> chaînes)"""
+    for col in df.columns:
+        if df[col].dtype == object:
+            type_infere = pd.api.types.infer_dtype(df[col], skipna=True)
+            if type_infere.startswith("mixed"):
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def ecrire_cache(df, chemin, suffixe="brut", empreinte=None):
+    """Écrit un DataFrame dans le cache Feather associé au fichier source"""
+    chemin_donnees, chemin_meta = chemins_cache(chemin, suffixe)
+    os.makedirs(os.path.dirname(chemin_donnees), exist_ok=True)
+    meta = signature_source(chemin, empreinte)
+
+    # Non compressé : indispensable pour relire le fichier en mémoire mappée
+    _ecrire_atomique(
+        chemin_donnees,
+        lambda tmp: feather.write_feather(df, tmp, compression="uncompressed"),
+    )
+    _ecrire_meta(chemin_meta, meta)
+
+
+def lire_cache(chemin, suffixe="brut", chaines_arrow=False):
+    """Lit le cache Feather en mémoire mappée
+
+    Avec chaines_arrow=True, les colonnes de chaînes Arrow (dtype
+    'string[pyarrow]', stockées en large_string) sont restituées sans passer
+    par des objets Python. Elles sont recopiées hors du fichier mappé : un
+    tampon partagé avec le fichier garderait tout le fichier en mémoire.
+    """
+    chemin_donnees, _ = chemins_cache(chemin, suffixe)
+    table = feather.read_table(chemin_donnees, memory_map=True)
+    if not chaines_arrow:
+        return table.to_pandas()
+
+    positions = None
+    for i, champ in enumerate(table.schema):
+        if champ.type == pa.large_string():
+            if positions is None:
+                positions = pa.array(np.arange(table.num_rows))
+            table = table.set_column(i, champ, table.column(i).take(positions))
+    df = table.to_pandas(types_mapper={pa.large_string(): pd.StringDtype('pyarrow')}.get)
+    # Les tampons intermédiaires (positions, table recopiée) sont rendus au système
+    del table, positions
+    pa.default_memory_pool().release_unused()
+    return df
+
+
+def lire_source(chemin):
+    """Lecture directe du fichier source (Excel ou CSV)"""
+    if str(chemin).lower().endswith(".csv"):
+        return pd.read_csv(chemin)
+    return pd.read_excel(chemin)
+
+
+@instrumenter('chargement')
+def charger_donnees(chemin=FICHIER_DONNEES, utiliser_cache=True):
+    """Charge le fichier de données en passant par le cache colonnaire
+
+    Si le cache est absent ou périmé, le fichier source est relu puis le cache
+    reconstruit. Une erreur d'écriture du cache (disque en lecture seule...)
+    n'empêche pas le chargement.
+    """
+    if not utiliser_cache:
+        return lire_source(chemin)
+
+    if cache_valide(chemin):
+        try:
+            return lire_cache(chemin)
+        except Exception as e:
+            print(f"⚠️ Cache illisible, reconstruction: {e}")
+
+    df = typer_colonnes(lire_source(chemin))
+    try:
+        ecrire_cache(df, chemin)
+    except Exception as e:
+        print(f"⚠️ Impossible d'écrire le cache: {e}")
+    return df
+
+
+def invalider_cache(chemin=FICHIER_DONNEES):
+    """Supprime tous les fichiers de cache associés au fichier source"""
+    dossier = os.path.dirname(chemins_cache(chemin)[0])
+    if not os.path.isdir(dossier):
+        return
+    prefixe = os.path.basename(chemin) + "."
+    for nom in os.listdir(dossier):
+        if nom.startswith(prefixe):
+            os.remove(os.path.join(dossier, nom))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Cohortes d'acquisition : rétention et revenus par mois depuis la première visite
+Auteur: Assistant IA
+Date: 2024
+
+Chaque patient appartient à la cohorte du mois de sa première visite. Les
+mois sont convertis en entiers, les patients en codes : le premier mois de
+chaque patient est obtenu en un seul passage (np.minimum.at), puis chaque
+soin est placé dans la cellule (cohorte, mois depuis l'acquisition) d'une
+matrice aplatie. Les effectifs et les revenus de toutes les cellules sont
+comptés par np.bincount, sans groupby ni boucle sur les cohortes. Les paires
+(patient, mois actif) distinctes sont marquées dans un tableau de booléens
+plutôt que triées, tant que ce tableau reste sous MARQUAGE_MAX_OCTETS.
+
+Les cellules postérieures au dernier mois des données ne sont pas
+observables : elles valent NaN (triangle supérieur droit des matrices).
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from kpi_vectorises import _codes
+from montants import montant_chf
+
+# Taille maximale du tableau de marquage patients × mois (au-delà : tri par np.unique)
+MARQUAGE_MAX_OCTETS = 256 * 1024 * 1024
+
+
+class Cohortes(NamedTuple):
+    """Matrices cohorte (mois d'acquisition) × mois depuis l'acquisition"""
+    nouveaux: pd.Series  # patients acquis chaque mois (taille des cohortes), mois sans acquisition compris
+    patients: pd.DataFrame  # patients actifs de la cohorte, par mois depuis l'acquisition
+    retention: pd.DataFrame  # patients actifs / taille de la cohorte (%)
+    revenus: pd.DataFrame  # CA de la cohorte, par mois depuis l'acquisition
+
+    def __len__(self):
+        return len(self.patients)
+
+
+def _mois(dates):
+    """Mois entiers (années * 12 + mois) d'une colonne de dates"""
+    return dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[M]').astype(np.int64)
+
+
+def _distincts(cles, nb_cles):
+    """Valeurs distinctes et triées d'entiers de [0, nb_cles)"""
+    if nb_cles > MARQUAGE_MAX_OCTETS:
+        return np.unique(cles)
+    vues = np.zeros(nb_cles, dtype=bool)
+    vues[cles] = True
+    return np.flatnonzero(vues)
+
+
+def _matrice(valeurs, acquises, nb_mois, observable, index):
+    """Matrice carrée aplatie -> DataFrame des cohortes acquises, cellules non observables à NaN"""
+    matrice = pd.DataFrame(valeurs.reshape(nb_mois, nb_mois), index=index, columns=pd.RangeIndex(nb_mois))
+    matrice = matrice.where(observable)
+    matrice.columns.name = 'mois_depuis_acquisition'
+    return matrice.loc[acquises]
+
+
+def cohortes(df, col_patient='patientid', col_date='date_du_soin', col_montant='montant_total_chf'):
+    """Cohortes d'acquisition mensuelles d'un lot de soins (lignes sans patient ou sans date ignorées)"""
+    patients, _ = _codes(df[col_patient], trier=False)
+    dates = df[col_date]
+    connu = (patients >= 0) & dates.notna().to_numpy()
+    patients = patients[connu]
+    if len(patients) == 0:
+        vide = pd.DataFrame(dtype=float)
+        return Cohortes(pd.Series(dtype=np.int64), vide, vide, vide)
+
+    mois = _mois(dates[connu])
+    origine = mois.min()
+    mois -= origine
+    nb_mois = int(mois.max()) + 1
+
+    # Mois d'acquisition de chaque patient, en un passage sur les soins
+    acquisition = np.full(patients.max() + 1, nb_mois, dtype=np.int64)
+    np.minimum.at(acquisition, patients, mois)
+    cohorte = acquisition[patients]
+    cellule = cohorte * nb_mois + (mois - cohorte)
+
+    # Un patient compte une fois par mois actif : paires (patient, mois) distinctes
+    paires = _distincts(patients * nb_mois + mois, len(acquisition) * nb_mois)
+    cohorte_paire = acquisition[paires // nb_mois]
+    actifs = np.bincount(cohorte_paire * nb_mois + (paires % nb_mois - cohorte_paire),
+                         minlength=nb_mois * nb_mois)
+    montants = montant_chf(df, col_montant).to_numpy(dtype=np.float64)[connu]
+    revenus = np.bincount(cellule, weights=np.nan_to_num(montants), minlength=nb_mois * nb_mois)
+
+    libelles = pd.Index(
+        (np.arange(nb_mois) + origine).astype('datetime64[M]').astype(str), name='cohorte'
+    )
+    # Au mois 0, les patients actifs d'une cohorte sont exactement ses nouveaux patients
+    nouveaux = pd.Series(actifs.reshape(nb_mois, nb_mois)[:, 0], index=libelles, name='nouveaux_patients')
+    # Seules les cohortes qui ont acquis au moins un patient ont une ligne dans les matrices
+    acquises = nouveaux.to_numpy() > 0
+    observable = np.add.outer(np.arange(nb_mois), np.arange(nb_mois)) < nb_mois
+
+    effectifs = _matrice(actifs.astype(np.float64), acquises, nb_mois, observable, libelles)
+    return Cohortes(
+        nouveaux=nouveaux,
+        patients=effectifs,
+        retention=effectifs.div(nouveaux[acquises], axis=0) * 100,
+        revenus=_matrice(revenus, acquises, nb_mois, observable, libelles),
+    )
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Balance âgée des créances patients (0-30, 31-60, 61-90, 90+ jours)
+Auteur: Assistant IA
+Date: 2024
+
+Une créance est un soin dont le montant payé n'atteint pas le montant
+total : son solde est montant_total_chf - montant_payé_chf, son âge le
+nombre de jours entre la date du soin et la date de référence. La tranche
+d'âge de toutes les créances est calculée une seule fois (np.digitize),
+puis chaque dimension (patient, clinique, praticien, cabinet) est cumulée
+par un np.bincount sur (groupe, tranche) : aucun groupby ni filtre par
+tranche.
+
+BalanceAgee garde un instantané : les créances ouvertes et leurs balances
+par dimension, persistés dans un dossier. L'enregistrement d'un paiement ne
+retranche des balances que les créances concernées ; la balance complète
+n'est recalculée que si la date de référence change. Comme pour le RFM, la
+date de référence par défaut est celle du dernier soin des données : deux
+calculs sur les mêmes données donnent la même balance.
+
+charger_balance() associe l'instantané au fichier de soins dont il est tiré
+(comme le cache Feather) : tant que le fichier ne change pas, la balance est
+relue telle quelle ; s'il change, l'instantané est mis à jour à partir des
+soins relus (paiements des créances connues, créances des soins ajoutés)
+plutôt que reconstruit.
+
+Usage: python creances.py [fichier_donnees] [dossier_instantane]
+"""
+
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from chargement_donnees import signature_source, source_inchangee
+from kpi_vectorises import _codes
+from montants import montant_chf
+from nettoyage_donnees import FICHIER_DONNEES, VERSION_SCHEMA, charger_donnees_nettoyees
+
+DOSSIER_CREANCES = os.path.join("data", "creances")
+
+TRANCHES_AGE = ['0-30', '31-60', '61-90', '90+']
+# Âge maximal (jours, inclus) de chaque tranche sauf la dernière
+BORNES_AGE = [30, 60, 90]
+
+# Dimension de la balance -> colonne des soins
+DIMENSIONS_CREANCES = {
+    'patient': 'patientid',
+    'clinique': 'nom_de_la_clinique',
+    'praticien': 'nom_complet_praticien',
+    'cabinet': 'cabinet',
+}
+
+# En dessous d'un demi-centime, une créance est soldée
+SOLDE_MIN = 0.005
+
+
+def soldes_soins(df):
+    """Solde restant dû de chaque soin"""
+    return montant_chf(df, 'montant_total_chf') - montant_chf(df, 'montant_payé_chf')
+
+
+def creances_ouvertes(df, dimensions=None):
+    """Soins dont le solde est positif : colonnes des dimensions, date_du_soin et solde
+
+    L'index des soins est conservé : il identifie la créance lors des paiements.
+    """
+    colonnes = [c for c in (dimensions or DIMENSIONS_CREANCES).values() if c in df.columns]
+    solde = soldes_soins(df)
+    ouvertes = (solde > SOLDE_MIN).to_numpy()
+    return df.loc[ouvertes, colonnes + ['date_du_soin']].assign(solde=solde[ouvertes])
+
+
+def tranches_age(dates, date_reference):
+    """Indice de tranche (0 à 3) de chaque date ; une date inconnue est classée dans la plus ancienne"""
+    ecart = np.datetime64(date_reference, 'ns') - dates.to_numpy(dtype='datetime64[ns]')
+    ages = ecart / np.timedelta64(1, 'D')
+    tranches = np.digitize(ages, BORNES_AGE, right=True)
+    tranches[np.isnan(ages)] = len(BORNES_AGE)
+    return tranches
+
+
+def _balance(codes, libelles, tranches, soldes, colonne):
+    """Soldes cumulés par (groupe, tranche) : un seul bincount"""
+    nb_tranches = len(TRANCHES_AGE)
+    connu = codes >= 0
+    cellules = np.bincount(codes[connu] * nb_tranches + tranches[connu], weights=soldes[connu],
+                           minlength=len(libelles) * nb_tranches).reshape(len(libelles), nb_tranches)
+    table = pd.DataFrame(cellules, index=pd.Index(libelles, name=colonne), columns=TRANCHES_AGE)
+    table['total'] = cellules.sum(axis=1)
+    return table[table['total'] > SOLDE_MIN]
+
+
+def balances_agees(creances, date_reference, dimensions=None):
+    """Balance âgée de chaque dimension, et la balance globale sous la clé 'total'
+
+    Les tranches d'âge sont calculées une fois pour toutes les dimensions.
+    """
+    dimensions = dimensions or DIMENSIONS_CREANCES
+    tranches = tranches_age(creances['date_du_soin'], date_reference)
+    soldes = creances['solde'].to_numpy(dtype=np.float64)
+
+    totaux = np.bincount(tranches, weights=soldes, minlength=len(TRANCHES_AGE))
+    resultat = {
+        'total': pd.Series(np.append(totaux, totaux.sum()), index=TRANCHES_AGE + ['total'], name='solde'),
+    }
+    for nom, colonne in dimensions.items():
+        if colonne in creances.columns:
+            codes, libelles = _codes(creances[colonne])
+            resultat[nom] = _balance(codes, libelles, tranches, soldes, colonne)
+    return resultat
+
+
+class BalanceAgee:
+    """Instantané de la balance âgée, mis à jour paiement par paiement"""
+
+    def __init__(self, creances, date_reference, balances=None, dimensions=None):
+        self.creances = creances
+        self.date_reference = pd.Timestamp(date_reference)
+        self.dimensions = dict(dimensions or DIMENSIONS_CREANCES)
+        self.balances = balances if balances is not None else balances_agees(
+            creances, self.date_reference, self.dimensions)
+
+    @classmethod
+    def construire(cls, df, date_reference=None, dimensions=None):
+        """Balance complète des soins ; date de référence par défaut : dernier soin des données"""
+        if date_reference is None:
+            date_reference = df['date_du_soin'].max().normalize()
+        return cls(creances_ouvertes(df, dimensions), date_reference, dimensions=dimensions)
+
+    def rapport(self, date_reference=None):
+        """Balances par dimension (et 'total') ; recalculées seulement si la date de référence change"""
+        if date_reference is not None and pd.Timestamp(date_reference) != self.date_reference:
+            self.date_reference = pd.Timestamp(date_reference)
+            self.balances = balances_agees(self.creances, self.date_reference, self.dimensions)
+        return self.balances
+
+    def enregistrer_paiements(self, paiements):
+        """Impute des paiements (Series indexée comme les soins -> montant versé)
+
+        Seules les créances payées sont retranchées des balances ; un paiement
+        au-delà du solde est plafonné au solde. Renvoie le montant imputé.
+        """
+        paiements = paiements.groupby(level=0).sum()
+        lignes = paiements.index.intersection(self.creances.index)
+        if len(lignes) == 0:
+            return 0.0
+        soldes = self.creances.loc[lignes, 'solde']
+        imputes = np.minimum(paiements.loc[lignes].to_numpy(dtype=np.float64), soldes.to_numpy())
+
+        # Le delta des balances est celui des seules créances payées
+        delta = balances_agees(self.creances.loc[lignes].assign(solde=imputes), self.date_reference,
+                               self.dimensions)
+        self.balances['total'] = self.balances['total'] - delta['total']
+        for nom, table in self.balances.items():
+            if nom == 'total':
+                continue
+            # Seules les lignes des groupes payés sont modifiées ; les groupes soldés sont retirés
+            groupes = delta[nom].index
+            restants = table.loc[groupes].to_numpy() - delta[nom][table.columns].to_numpy()
+            table.loc[groupes] = restants
+            if (restants[:, table.columns.get_loc('total')] <= SOLDE_MIN).any():
+                self.balances[nom] = table[table['total'] > SOLDE_MIN]
+
+        self.creances.loc[lignes, 'solde'] = soldes - imputes
+        self.creances = self.creances[self.creances['solde'] > SOLDE_MIN]
+        return float(imputes.sum())
+
+    def ajouter_soins(self, df):
+        """Ajoute les créances de nouveaux soins (leur index ne doit pas déjà être connu)"""
+        nouvelles = creances_ouvertes(df, self.dimensions)
+        if nouvelles.index.isin(self.creances.index).any():
+            raise ValueError("Soins déjà présents dans la balance")
+        delta = balances_agees(nouvelles, self.date_reference, self.dimensions)
+        self.balances['total'] = self.balances['total'] + delta['total']
+        for nom, table in self.balances.items():
+            if nom != 'total':
+                self.balances[nom] = table.add(delta[nom], fill_value=0)
+        self.creances = pd.concat([self.creances, nouvelles])
+        return len(nouvelles)
+
+    def actualiser(self, df, nb_soins):
+        """Met la balance à jour avec une nouvelle version des soins dont elle est tirée
+
+        Les `nb_soins` premières lignes de `df` sont les soins déjà connus : la
+        baisse du solde de leurs créances est imputée comme un paiement, les
+        lignes suivantes sont des soins nouveaux. La date de référence devient
+        le dernier soin de `df`. Renvoie False, sans rien modifier, si les
+        soins connus ne correspondent plus aux créances (lignes supprimées ou
+        déplacées, solde en hausse, créance soldée rouverte) : la balance doit
+        alors être reconstruite.
+        """
+        if len(df) < nb_soins:
+            return False
+        connus = df.index[:nb_soins]
+        if not self.creances.index.isin(connus).all():
+            return False
+        lignes = self.creances.index
+        for colonne in self.creances.columns.drop('solde'):
+            avant = self.creances[colonne].astype(object)
+            apres = df.loc[lignes, colonne].astype(object)
+            if not (avant.eq(apres) | (avant.isna() & apres.isna())).all():
+                return False
+
+        soldes = soldes_soins(df.iloc[:nb_soins])
+        rouvertes = ~connus.isin(lignes) & (soldes > SOLDE_MIN).to_numpy()
+        paiements = self.creances['solde'] - soldes.loc[lignes]
+        if rouvertes.any() or (paiements < -SOLDE_MIN).any():
+            return False
+
+        self.enregistrer_paiements(paiements[paiements > 0])
+        if len(df) > nb_soins:
+            self.ajouter_soins(df.iloc[nb_soins:])
+        self.rapport(df['date_du_soin'].max().normalize())
+        return True
+
+    def sauvegarder(self, dossier=DOSSIER_CREANCES, source=None):
+        """Écrit l'instantané : créances ouvertes, balances et date de référence
+
+        `source` : signature du fichier de soins (charger_balance), pour
+        reconnaître un instantané périmé.
+        """
+        os.makedirs(dossier, exist_ok=True)
+        self.creances.to_parquet(os.path.join(dossier, 'creances.parquet'))
+        for nom, table in self.balances.items():
+            table = table.to_frame('solde') if nom == 'total' else table
+            table.to_parquet(os.path.join(dossier, f'balance_{nom}.parquet'))
+        with open(os.path.join(dossier, 'balance.json'), 'w', encoding='utf-8') as f:
+            json.dump({'date_reference': self.date_reference.isoformat(), 'dimensions': self.dimensions,
+                       'balances': list(self.balances), 'source': source}, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def charger(cls, dossier=DOSSIER_CREANCES):
+        """Relit un instantané écrit par sauvegarder(), sans recalcul"""
+        with open(os.path.join(dossier, 'balance.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        balances = {nom: pd.read_parquet(os.path.join(dossier, f'balance_{nom}.parquet'))
+                    for nom in meta['balances']}
+        balances['total'] = balances['total']['solde']
+        creances = pd.read_parquet(os.path.join(dossier, 'creances.parquet'))
+        return cls(creances, meta['date_reference'], balances, meta['dimensions'])
+
+
+def _lire_source_instantane(dossier):
+    try:
+        with open(os.path.join(dossier, 'balance.json'), encoding='utf-8') as f:
+            return json.load(f).get('source') or {}
+    except (OSError, ValueError):
+        return {}
+
+
+def charger_balance(chemin=FICHIER_DONNEES, df=None, dossier=None):
+    """Balance âgée d'un fichier de données, lue dans son instantané s'il est à jour
+
+    L'instantané (par défaut dans `creances/`, à côté du fichier) porte la
+    signature du fichier source. Si le fichier a changé, il est mis à jour à
+    partir des soins relus (BalanceAgee.actualiser), et reconstruit seulement
+    si ces soins ne prolongent pas ceux de l'instantané. `df` : soins
+    nettoyés du même fichier, s'ils sont déjà chargés.
+    """
+    dossier = dossier or os.path.join(os.path.dirname(os.path.abspath(chemin)), 'creances')
+    source = _lire_source_instantane(dossier)
+    connu = (source.get('fichier') == os.path.abspath(chemin)
+             and source.get('version_schema') == VERSION_SCHEMA)
+    if connu and source_inchangee(chemin, source.get('signature')):
+        try:
+            return BalanceAgee.charger(dossier)
+        except Exception as e:
+            print(f"⚠️ Instantané des créances illisible, reconstruction: {e}")
+            connu = False
+
+    if df is None:
+        df = charger_donnees_nettoyees(chemin)
+    balance = None
+    if connu:
+        try:
+            balance = BalanceAgee.charger(dossier)
+            if not balance.actualiser(df, source['nb_soins']):
+                balance = None
+        except Exception as e:
+            print(f"⚠️ Instantané des créances illisible, reconstruction: {e}")
+            balance = None
+    if balance is None:
+        balance = BalanceAgee.construire(df)
+
+    try:
+        balance.sauvegarder(dossier, {
+            'fichier': os.path.abspath(chemin),
+            'version_schema': VERSION_SCHEMA,
+            'nb_soins': len(df),
+            'signature': signature_source(chemin),
+        })
+    except Exception as e:
+        print(f"⚠️ Impossible d'écrire l'instantané des créances: {e}")
+    return balance
+
+
+def afficher_rapport(balances, date_reference, nb_lignes=10):
+    """Rapport texte de la balance âgée (totaux, cliniques, praticiens, patients)"""
+    print(f"\n📅 BALANCE ÂGÉE DES CRÉANCES au {date_reference:%Y-%m-%d} (CHF):")
+    print(balances['total'].round(2).to_string())
+    for nom, titre in [('clinique', "PAR CLINIQUE"), ('praticien', "PAR PRATICIEN"),
+                       ('patient', "PATIENTS LES PLUS EXPOSÉS (90+ jours)")]:
+        if nom in balances:
+            table = balances[nom].sort_values(['90+', 'total'], ascending=False)
+            print(f"\n🧾 {titre}:")
+            print(table.head(nb_lignes).round(2).to_string())
+
+
+if __name__ == "__main__":
+    fichier = sys.argv[1] if len(sys.argv) > 1 else FICHIER_DONNEES
+    dossier = sys.argv[2] if len(sys.argv) > 2 else None
+    try:
+        debut = time.perf_counter()
+        balance = charger_balance(fichier, dossier=dossier)
+        afficher_rapport(balance.rapport(), balance.date_reference)
+        print(f"\n✅ Balance âgée de {fichier} en {time.perf_counter() - debut:.2f} s")
+    except Exception as e:
+        print(f"❌ Erreur lors du calcul de la balance âgée: {e}")
+        sys.exit(1)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Cube de KPIs pré-agrégé du cabinet dentaire
+Auteur: Assistant IA
+Date: 2024
+
+Les lignes de soins sont agrégées une seule fois au grain
+(cabinet, clinique, praticien, type de soin, mois). Les pages et les rapports
+répondent ensuite par cumul des cellules du cube : le coût d'une interaction
+dépend du nombre de cellules, plus du nombre de lignes.
+
+Le nombre de patients distincts n'est pas additif : chaque cellule garde
+l'ensemble de ses patients (codes entiers), et les ensembles sont fusionnés
+lors des cumuls. Avec `erreur_patients`, chaque cellule garde à la place un
+sketch HyperLogLog : les unions coûtent O(cellules) quelle que soit la taille
+de la patientèle, pour une erreur relative bornée. Le mode exact reste le
+mode par défaut (rapports audités).
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from hyperloglog import SketchesHLL, empreintes, precision_pour_erreur
+from montants import a_colonne, montant_chf
+
+DIMENSIONS_CUBE = ['cabinet', 'nom_de_la_clinique', 'nom_complet_praticien',
+                   'type_de_soin_normalisé', 'Année-Mois']
+
+COLONNE_MOIS = 'Année-Mois'
+
+
+def codes_mois(dates):
+    """Mois d'une série de dates sous forme d'entier AAAAMM (NaN si date manquante)"""
+    return dates.dt.year * 100 + dates.dt.month
+
+
+def libelles_mois(codes):
+    """AAAAMM -> 'AAAA-MM'"""
+    return codes.map(lambda v: f"{int(v) // 100}-{int(v) % 100:02d}" if pd.notna(v) else np.nan)
+
+
+def mesures_lignes(df):
+    """Mesures additives calculées ligne à ligne, selon les colonnes disponibles"""
+    mesures = pd.DataFrame({'nb_actes': np.ones(len(df), dtype=np.int64)}, index=df.index)
+
+    if a_colonne(df, 'montant_total_chf'):
+        montant = montant_chf(df, 'montant_total_chf')
+        mesures['ca_total'] = montant.fillna(0)
+        mesures['nb_montants'] = montant.notna()
+
+        if 'retard' in df.columns:
+            retard = df['retard'].fillna(False).astype(bool)
+            mesures['nb_retards'] = retard
+            mesures['montant_retard'] = montant.where(retard, 0).fillna(0)
+
+        if a_colonne(df, 'montant_payé_chf'):
+            impaye = montant - montant_chf(df, 'montant_payé_chf')
+            en_impaye = impaye > 0
+            mesures['nb_impayes'] = en_impaye
+            mesures['montant_impaye'] = impaye.where(en_impaye, 0)
+
+    if 'retard_paiement_jours' in df.columns:
+        delai = df['retard_paiement_jours']
+        mesures['somme_delai'] = delai.fillna(0)
+        mesures['nb_delai'] = delai.notna()
+
+    if 'type_de_patient' in df.columns:
+        mesures['nb_vip'] = df['type_de_patient'] == 'VIP'
+
+    return mesures.astype({col: np.int64 for col in mesures.columns if mesures[col].dtype == bool})
+
+
+def ajouter_ratios(resultat):
+    """Indicateurs dérivés des mesures additives (moyennes, taux)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if 'ca_total' in resultat:
+            resultat['ca_moyen'] = resultat['ca_total'] / resultat['nb_montants']
+        if 'nb_retards' in resultat:
+            resultat['taux_retard'] = resultat['nb_retards'] / resultat['nb_actes']
+        if 'somme_delai' in resultat:
+            resultat['delai_moyen'] = resultat['somme_delai'] / resultat['nb_delai']
+        if 'nb_vip' in resultat:
+            resultat['taux_vip'] = resultat['nb_vip'] / resultat['nb_actes']
+        if 'montant_impaye' in resultat:
+            resultat['impaye_moyen'] = resultat['montant_impaye'] / resultat['nb_impayes']
+    return resultat
+
+
+class CubeKPI:
+    """Agrégats de KPIs par cellule, cumulables sur n'importe quel sous-ensemble de dimensions"""
+
+    def __init__(self, cellules, dimensions, mesures, patients_cellules, patients, sketches=None):
+        self.cellules = cellules
+        self.dimensions = dimensions
+        self.mesures = mesures
+        # Mode exact : paires (cellule, code patient) uniques, triées par cellule
+        self.patients_cellules = patients_cellules
+        self.patients = patients
+        # Mode approché : un sketch HLL par cellule (les paires valent alors None)
+        self.sketches = sketches
+
+    @property
+    def erreur_patients(self):
+        """Erreur relative type du nombre de patients (None si comptage exact)"""
+        return None if self.sketches is None else self.sketches.erreur
+
+    @classmethod
+    def construire(cls, df, dimensions=None, col_patient='patientid', erreur_patients=None):
+        """Construit le cube à partir des lignes de soins (un seul groupby)
+
+        `erreur_patients` (ex. 0.01) remplace le comptage exact des patients par
+        des sketches HLL dont l'erreur relative type ne dépasse pas cette valeur.
+        """
+        dimensions = [d for d in (dimensions or DIMENSIONS_CUBE)
+                      if d in df.columns or (d == COLONNE_MOIS and 'date_du_soin' in df.columns)]
+
+        cles = [codes_mois(df['date_du_soin']).rename(d) if d == COLONNE_MOIS and d not in df.columns
+                else df[d] for d in dimensions]
+        mesures = mesures_lignes(df)
+
+        # dropna=False : une valeur manquante sur une dimension ne doit pas faire perdre la ligne
+        groupes = mesures.groupby(cles, observed=True, dropna=False, sort=True)
+        cellules = groupes.sum().reset_index()
+        cellule_par_ligne = groupes.ngroup().to_numpy()
+
+        if COLONNE_MOIS in dimensions and COLONNE_MOIS not in df.columns:
+            cellules[COLONNE_MOIS] = libelles_mois(cellules[COLONNE_MOIS])
+
+        if col_patient in df.columns:
+            codes, patients = pd.factorize(df[col_patient])
+        else:
+            codes, patients = np.full(len(df), -1), pd.Index([])
+        connu = codes >= 0
+
+        if erreur_patients is not None:
+            # Chaque identifiant n'est haché qu'une fois
+            empreintes_lignes = empreintes(patients)[codes[connu]]
+            sketches = SketchesHLL.construire(cellule_par_ligne[connu], empreintes_lignes,
+                                              len(cellules), precision_pour_erreur(erreur_patients))
+            return cls(cellules, dimensions, list(mesures.columns), None, None, sketches)
+
+        # Une paire (cellule, patient) est encodée en un seul entier : cellule * base + patient
+        base = max(len(patients), 1)
+        paires = np.unique(cellule_par_ligne[connu].astype(np.int64) * base + codes[connu])
+        patients_cellules = (paires // base, paires % base)
+
+        return cls(cellules, dimensions, list(mesures.columns), patients_cellules, patients)
+
+    def _masque(self, filtres):
+        """Masque des cellules retenues par des filtres {dimension: valeur ou liste de valeurs}"""
+        masque = np.ones(len(self.cellules), dtype=bool)
+        for dimension, valeur in filtres.items():
+            colonne = self.cellules[dimension]
+            if isinstance(valeur, (list, tuple, set, np.ndarray, pd.Index)):
+                masque &= colonne.isin(list(valeur)).to_numpy()
+            else:
+                masque &= (colonne == valeur).to_numpy()
+        return masque
+
+    def _nb_patients(self, groupe_par_cellule, nb_groupes):
+        """Patients distincts par groupe, par fusion des ensembles (ou des sketches) des cellules"""
+        if self.sketches is not None:
+            return np.rint(self.sketches.estimer_groupes(groupe_par_cellule, nb_groupes)).astype(np.int64)
+        cellule, patient = self.patients_cellules
+        groupe = groupe_par_cellule[cellule]
+        retenu = groupe >= 0
+        base = max(len(self.patients), 1)
+        paires = np.unique(groupe[retenu] * base + patient[retenu])
+        return np.bincount(paires // base, minlength=nb_groupes)
+
+    def cumuler(self, par=None, **filtres):
+        """Cumule les cellules filtrées, par dimension(s) ou au total
+
+        Renvoie un DataFrame indexé par les valeurs de `par` (trié, sans valeur
+        manquante, comme un groupby), ou une Series si `par` vaut None.
+        """
+        masque = self._masque(filtres)
+        retenues = self.cellules[masque]
+        groupe_par_cellule = np.full(len(self.cellules), -1, dtype=np.int64)
+
+        if par is None:
+            resultat = retenues[self.mesures].sum()
+            groupe_par_cellule[masque] = 0
+            resultat['nb_patients'] = self._nb_patients(groupe_par_cellule, 1)[0]
+            return ajouter_ratios(resultat)
+
+        groupes = retenues.groupby(par, observed=True, sort=True)
+        resultat = groupes[self.mesures].sum()
+        groupe_par_cellule[masque] = groupes.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+        resultat['nb_patients'] = self._nb_patients(groupe_par_cellule, len(resultat))
+        return ajouter_ratios(resultat)
+
+    def valeurs(self, dimension, **filtres):
+        """Valeurs distinctes d'une dimension parmi les cellules filtrées"""
+        return self.cellules.loc[self._masque(filtres), dimension].dropna().unique()
+
+    def fusionner(self, autre):
+        """Nouveau cube fusionnant celui-ci avec un cube de mêmes dimensions (ex. un delta)
+
+        Le coût dépend du nombre de cellules et de paires (cellule, patient),
+        pas du nombre de lignes de soins déjà agrégées.
+        """
+        cellules = pd.concat([self.cellules, autre.cellules], ignore_index=True)
+        groupes = cellules.groupby(self.dimensions, observed=True, dropna=False, sort=True)
+        fusion = groupes[self.mesures].sum().reset_index()
+        nouvelle_cellule = groupes.ngroup().to_numpy()
+
+        if (self.sketches is None) != (autre.sketches is None):
+            raise ValueError("Fusion d'un cube exact et d'un cube à sketches HLL")
+        if self.sketches is not None:
+            sketches = self.sketches.concatener(autre.sketches).regrouper(nouvelle_cellule, len(fusion))
+            return CubeKPI(fusion, self.dimensions, self.mesures, None, None, sketches)
+
+        # Les codes patients existants restent stables, les nouveaux sont ajoutés à la suite
+        patients = self.patients.append(autre.patients.difference(self.patients))
+        codes_autre = patients.get_indexer(autre.patients)
+
+        cellule, patient = self.patients_cellules
+        cellule_autre, patient_autre = autre.patients_cellules
+        base = max(len(patients), 1)
+        paires = np.unique(np.concatenate([
+            nouvelle_cellule[cellule] * base + patient,
+            nouvelle_cellule[len(self.cellules) + cellule_autre] * base + codes_autre[patient_autre],
+        ]))
+
+        return CubeKPI(fusion, self.dimensions, self.mesures, (paires // base, paires % base), patients)
+
+    @classmethod
+    def assembler(cls, cubes):
+        """Cube réunissant des cubes aux cellules disjointes (ex. un par mois et par cabinet)
+
+        Les cellules sont mises bout à bout, sans regroupement : le coût ne
+        dépend que de la taille des cubes assemblés.
+        """
+        premier = cubes[0]
+        if any(c.dimensions != premier.dimensions or (c.sketches is None) != (premier.sketches is None)
+               for c in cubes):
+            raise ValueError("Assemblage de cubes de dimensions ou de modes différents")
+        cellules = pd.concat([c.cellules for c in cubes], ignore_index=True)
+        decalages = np.cumsum([0] + [len(c.cellules) for c in cubes[:-1]])
+
+        if premier.sketches is not None:
+            sketches = SketchesHLL(
+                np.concatenate([c.sketches.sketch + d for c, d in zip(cubes, decalages)]),
+                np.concatenate([c.sketches.registre for c in cubes]),
+                np.concatenate([c.sketches.rang for c in cubes]),
+                len(cellules), premier.sketches.precision)
+            return cls(cellules, premier.dimensions, premier.mesures, None, None, sketches)
+
+        patients = pd.Index(pd.unique(np.concatenate([c.patients.to_numpy(dtype=object) for c in cubes])))
+        cellule = np.concatenate([c.patients_cellules[0] + d for c, d in zip(cubes, decalages)])
+        patient = np.concatenate([patients.get_indexer(c.patients)[c.patients_cellules[1]] for c in cubes])
+        return cls(cellules, premier.dimensions, premier.mesures, (cellule, patient), patients)
+
+    def sauvegarder(self, dossier):
+        """Écrit le cube dans un dossier (cellules, paires et patients, ou sketches)"""
+        os.makedirs(dossier, exist_ok=True)
+        self.cellules.to_parquet(os.path.join(dossier, 'cellules.parquet'), index=False)
+        with open(os.path.join(dossier, 'cube.json'), 'w', encoding='utf-8') as f:
+            json.dump({'dimensions': self.dimensions, 'mesures': self.mesures,
+                       'sketches': self.sketches is not None}, f, ensure_ascii=False, indent=2)
+        if self.sketches is not None:
+            self.sketches.sauvegarder(os.path.join(dossier, 'sketches.npz'))
+            return
+        pd.DataFrame({'patient': self.patients}).to_parquet(os.path.join(dossier, 'patients.parquet'), index=False)
+        cellule, patient = self.patients_cellules
+        np.savez(os.path.join(dossier, 'paires.npz'), cellule=cellule, patient=patient)
+
+    @classmethod
+    def charger(cls, dossier):
+        """Relit un cube écrit par sauvegarder()"""
+        with open(os.path.join(dossier, 'cube.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        cellules = pd.read_parquet(os.path.join(dossier, 'cellules.parquet'))
+        if meta.get('sketches'):
+            sketches = SketchesHLL.charger(os.path.join(dossier, 'sketches.npz'))
+            return cls(cellules, meta['dimensions'], meta['mesures'], None, None, sketches)
+        patients = pd.Index(pd.read_parquet(os.path.join(dossier, 'patients.parquet'))['patient'])
+        paires = np.load(os.path.join(dossier, 'paires.npz'))
+        return cls(cellules, meta['dimensions'], meta['mesures'], (paires['cellule'], paires['patient']), patients)
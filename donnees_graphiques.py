@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Données des graphiques Plotly préparées côté serveur
+Auteur: Assistant IA
+Date: 2024
+
+px.histogram envoie au navigateur chaque valeur brute (des mégaoctets de
+JSON pour un million de lignes), puis le navigateur calcule les classes.
+Ici les classes sont calculées avec numpy (un seul passage, sans tri) et
+seules leurs bornes et leurs effectifs sont transmis.
+
+Chaque figure affichée peut aussi être pesée : celles dont le JSON dépasse
+le budget par figure (BUDGET_FIGURE_KO, 512 Ko par défaut) sont signalées
+sur le logger « donnees_graphiques ».
+"""
+
+import json
+import logging
+import math
+import os
+from typing import NamedTuple
+
+import numpy as np
+import plotly.graph_objects as go
+
+NB_CLASSES = 30
+BUDGET_FIGURE_OCTETS = int(os.environ.get('BUDGET_FIGURE_KO', 512)) * 1024
+
+journal = logging.getLogger("donnees_graphiques")
+
+
+class Classes(NamedTuple):
+    """Histogramme précalculé : nb_classes + 1 bornes, nb_classes effectifs"""
+    bornes: np.ndarray
+    effectifs: np.ndarray
+
+    def __len__(self):
+        return len(self.effectifs)
+
+
+def _largeur_ronde(largeur):
+    """Plus petite largeur « ronde » (1, 2, 2.5 ou 5 × 10^k) au moins égale à `largeur`"""
+    puissance = 10.0 ** math.floor(math.log10(largeur))
+    for facteur in (1, 2, 2.5, 5, 10):
+        if facteur * puissance >= largeur:
+            return facteur * puissance
+    return 10 * puissance
+
+
+def classer(valeurs, nb_classes=NB_CLASSES):
+    """Répartit les valeurs en au plus ~nb_classes classes de largeur ronde
+
+    Les valeurs manquantes ou infinies sont ignorées. Des valeurs entières
+    ont des classes de largeur entière, centrées sur les entiers.
+    """
+    valeurs = np.asarray(valeurs, dtype=np.float64)
+    valeurs = valeurs[np.isfinite(valeurs)]
+    if len(valeurs) == 0:
+        return Classes(np.empty(0), np.empty(0, dtype=np.int64))
+
+    minimum, maximum = valeurs.min(), valeurs.max()
+    entieres = bool(np.all(valeurs == np.floor(valeurs)))
+    largeur = _largeur_ronde((maximum - minimum) / nb_classes) if maximum > minimum else 1.0
+    if entieres:
+        largeur = max(1.0, math.ceil(largeur))
+        debut = math.floor(minimum / largeur) * largeur - 0.5
+    else:
+        debut = math.floor(minimum / largeur) * largeur
+
+    indices = ((valeurs - debut) // largeur).astype(np.int64)
+    effectifs = np.bincount(indices)
+    bornes = debut + largeur * np.arange(len(effectifs) + 1)
+    return Classes(bornes, effectifs)
+
+
+def figure_histogramme(classes, titre=None, etiquette_x=None, etiquette_y="count"):
+    """Barres jointives d'un histogramme précalculé (rendu équivalent à px.histogram)"""
+    gauches, droites = classes.bornes[:-1], classes.bornes[1:]
+    fig = go.Figure(go.Bar(
+        x=(gauches + droites) / 2,
+        y=classes.effectifs,
+        width=droites - gauches,
+        customdata=np.column_stack([gauches, droites]),
+        hovertemplate="%{customdata[0]:.4g} – %{customdata[1]:.4g}<br>%{y}<extra></extra>",
+    ))
+    fig.update_layout(title=titre, bargap=0, xaxis_title=etiquette_x, yaxis_title=etiquette_y)
+    return fig
+
+
+def histogramme(valeurs, nb_classes=NB_CLASSES, titre=None, etiquette_x=None, etiquette_y="count"):
+    """Histogramme classé côté serveur, à la place de px.histogram sur les valeurs brutes"""
+    return figure_histogramme(classer(valeurs, nb_classes), titre, etiquette_x, etiquette_y)
+
+
+def taille_figure(fig):
+    """Octets du JSON de la figure, tel qu'envoyé au navigateur"""
+    return len(fig.to_json().encode('utf-8'))
+
+
+def verifier_budget(fig, nom=None, budget_octets=BUDGET_FIGURE_OCTETS):
+    """Pèse la figure et signale celles qui dépassent le budget ; renvoie sa taille"""
+    taille = taille_figure(fig)
+    if taille > budget_octets:
+        nom = nom or fig.layout.title.text or "figure sans titre"
+        journal.warning(json.dumps({
+            'figure': nom,
+            'octets': taille,
+            'budget_octets': budget_octets,
+            'traces': len(fig.data),
+        }, ensure_ascii=False))
+    return taille
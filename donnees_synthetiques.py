@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Génération de données synthétiques au schéma de patients_mis_a_jour.xlsx
+Auteur: Assistant IA
+Date: 2024
+
+Les 33 colonnes du classeur sont reproduites, dans le même ordre, avec leurs
+distributions observées. Le nombre de cabinets, de praticiens, de patients
+et d'années est paramétrable :
+
+- chaque patient a un parcours : une première visite tirée selon la
+  saisonnalité mensuelle, puis un nombre géométrique de revisites espacées
+  d'écarts gamma (~95 jours en moyenne, comme dans le classeur) ;
+- chaque patient est rattaché à un cabinet (90 % de ses soins), chaque
+  praticien exerce dans un seul cabinet ;
+- le tarif dépend du type de soin, montant payé = total × taux de
+  remboursement, nb_visites_patient et type_de_patient découlent des visites.
+
+Tout est tiré en bloc avec numpy ; les libellés sont des codes de
+catégories. generer_patients() renvoie les types bruts de pd.read_excel
+(benchmarks) ; ecrire_entrepot() écrit année par année un entrepôt Parquet
+partitionné par mois et par cabinet, lisible par EntrepotSoins.
+
+Usage: python donnees_synthetiques.py sortie[.csv] [--cabinets N] [--praticiens N]
+                                      [--patients N] [--annees N] [--soins-par-patient X]
+                                      [--graine N] [--agregats]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+DATE_FIN = '2025-06-01'
+GRAINE = 42
+
+# (type de soin, catégorie, normalisé, tarif moyen, écart-type, durée) ; normalisé None : tiré au hasard
+SOINS = [
+    ('Carie', 'Curatif', 'carie', 194.0, 36.0, 30),
+    ('Chirurgie complexe', 'Curatif', 'chirurgie', 1976.0, 594.0, 90),
+    ('Conseils d’hygiène', 'Préventif', 'consultation', 81.0, 12.0, 20),
+    ('Consultation devis', 'Pré-consultation', 'consultation', 0.0, 0.0, 20),
+    ('Contrôle annuel', 'Préventif', 'contrôle annuel', 150.0, 29.0, 30),
+    ('Détartrage', 'Préventif', 'détartrage', 143.0, 23.0, 30),
+    ('Extraction', 'Curatif', 'extraction', 271.0, 74.0, 45),
+    ('Formule Clean', 'Préventif', None, 140.0, 0.0, 40),
+    ('Formule Complète', 'Préventif', None, 190.0, 0.0, 50),
+    ('Formule Shiny - Clinique + Maison', 'Esthétique', None, 750.0, 0.0, 60),
+    ('Formule Shiny - Maison', 'Esthétique', None, 390.0, 0.0, 30),
+    ('Implant', 'Curatif', 'implant', 3278.0, 740.0, 60),
+    ('Pose appareil', 'Esthétique', 'pose appareil', 2281.0, 696.0, 60),
+    ('Suivi orthodontique', 'Esthétique', 'suivi orthodontique', 349.0, 87.0, 40),
+]
+POIDS_SOINS = [217, 346, 338, 581, 535, 323, 539, 1383, 1738, 1276, 1723, 530, 333, 338]
+NORMALISES = ['blanchiment', 'carie', 'chirurgie', 'consultation', 'contrôle annuel', 'couronne',
+              'détartrage', 'extraction', 'implant', 'pose appareil', 'suivi orthodontique', 'urgence']
+NORMALISES_FORMULES = ['blanchiment', 'carie', 'consultation', 'contrôle annuel',
+                       'couronne', 'détartrage', 'implant', 'urgence']
+
+# Cabinets du classeur : cabinet -> (cliniques, canton)
+CABINETS = {
+    'Genève Cornavin': (['Cornavin'], 'Genève'),
+    'Genève Eaux-Vives': (['Eaux-Vives'], 'Genève'),
+    'Genève Meyrin': (['Meyrin'], 'Genève'),
+    'Yverdon': (['Yverdon', 'Bessières', 'Sallaz'], 'Vaud'),
+}
+# Villes des cabinets supplémentaires : (ville, canton)
+VILLES = [('Lausanne', 'Vaud'), ('Sion', 'Valais'), ('Fribourg', 'Fribourg'), ('Neuchâtel', 'Neuchâtel'),
+          ('Nyon', 'Vaud'), ('Montreux', 'Vaud'), ('Bienne', 'Berne'), ('Berne', 'Berne'),
+          ('Martigny', 'Valais'), ('Bulle', 'Fribourg'), ('Carouge', 'Genève'), ('Vevey', 'Vaud')]
+
+TYPES_PRATICIENS = ['Médecin dentiste', 'Hygiéniste', 'Orthodontiste', 'Chirurgien dentiste', 'Endodontiste']
+POIDS_PRATICIENS = [43, 18, 10, 6, 1]
+PRATICIENS_PAR_CABINET = 20
+
+ASSURANCES = ['Helsana', 'Aucune', 'Assura', 'CSS', 'Swica']
+POIDS_ASSURANCES = [23, 21, 19, 19, 18]
+PAIEMENTS = ['TWINT', 'Facture', 'Carte', 'Espèces']
+POIDS_PAIEMENTS = [32, 24, 24, 20]
+FORMULES = ['Aucune', 'Formule Clean', 'Formule Complète', 'Formule Shiny - Maison',
+            'Formule Shiny - Clinique + Maison']
+POIDS_FORMULES = [40, 15, 15, 15, 15]
+TYPES_PATIENTS = ['Nouveau', 'Occasionnel', 'Fidèle']
+
+PRENOMS = ['Alexandre', 'Camille', 'Chloé', 'David', 'Élodie', 'Julien', 'Laura', 'Lucas', 'Léa',
+           'Marc', 'Marie', 'Mathieu', 'Nicolas', 'Nora', 'Paul', 'Sarah', 'Sophie', 'Thomas',
+           'Valérie', 'Yann']
+NOMS = ['Bernard', 'Bonvin', 'Costa', 'Dubois', 'Favre', 'Fischer', 'Gerber', 'Girard', 'Keller',
+        'Martin', 'Meier', 'Muller', 'Perret', 'Rey', 'Rochat', 'Roth', 'Schmid', 'Vuille',
+        'Weber', 'Zufferey']
+RUES = ['Rue de Lausanne 15', 'Avenue de Vaudagne 1', 'Rue des Eaux-Vives 23', 'Route de Meyrin 40',
+        'Chemin des Pâquis 8', 'Avenue de la Gare 12']
+LOCALITES = ['1201 Genève', '1217 Meyrin', '1227 Carouge', '1260 Nyon', '1004 Lausanne',
+             '1400 Yverdon', '1800 Vevey']
+ADRESSES = [f"{rue}, {localite}" for rue in RUES for localite in LOCALITES]
+HEURES = [f"{h:02d}:{m:02d}" for h in range(8, 20) for m in (0, 15, 30, 45)]
+SATISFACTIONS = [3.0, 4.0, 5.0]
+POIDS_SATISFACTIONS = [11.6, 40.0, 42.7]
+
+# Parcours patients
+SOINS_PAR_PATIENT = 1.23
+INTERVALLE_REVISITE_JOURS = 95
+FIDELITE_CABINET = 0.9
+# Poids relatifs des mois (janvier à décembre) : creux de l'été et des fêtes
+SAISONNALITE = [1.10, 1.05, 1.10, 1.00, 1.00, 0.95, 0.70, 0.65, 1.10, 1.10, 1.05, 0.85]
+
+
+def _tirer(rng, nb_valeurs, taille, poids=None):
+    """Codes tirés dans un référentiel de `nb_valeurs` libellés"""
+    p = None if poids is None else np.asarray(poids, dtype=float) / np.sum(poids)
+    return rng.choice(nb_valeurs, size=taille, p=p)
+
+
+def _categorie(codes, libelles):
+    return pd.Categorical.from_codes(codes, categories=libelles)
+
+
+def referentiel_cabinets(nb_cabinets=len(CABINETS)):
+    """Cabinet -> (cliniques, canton) : les cabinets du classeur, puis un par ville"""
+    cabinets = dict(list(CABINETS.items())[:nb_cabinets])
+    for i in range(nb_cabinets - len(cabinets)):
+        ville, canton = VILLES[i % len(VILLES)]
+        nom = f"{ville} {i // len(VILLES) + 1}"
+        cabinets[nom] = ([nom], canton)
+    return cabinets
+
+
+class Referentiels:
+    """Sites et praticiens d'une génération, indexés par codes"""
+
+    def __init__(self, rng, cabinets, nb_praticiens):
+        if nb_praticiens < len(cabinets):
+            raise ValueError(f"Il faut au moins un praticien par cabinet ({len(cabinets)})")
+        self.cabinets = list(cabinets)
+        self.cantons = sorted({canton for _, canton in cabinets.values()})
+        cliniques = [(i, clinique, self.cantons.index(canton))
+                     for i, (noms, canton) in enumerate(cabinets.values()) for clinique in noms]
+        self.cliniques = [clinique for _, clinique, _ in cliniques]
+        self.cabinet_clinique = np.array([cabinet for cabinet, _, _ in cliniques])
+        self.canton_clinique = np.array([canton for _, _, canton in cliniques])
+        # Taille relative des cabinets (les patients s'y répartissent)
+        self.poids_cabinets = rng.lognormal(0, 0.4, len(cabinets))
+
+        # Praticiens répartis à tour de rôle entre les cabinets, puis rangés par cabinet
+        self.cabinet_praticien = np.sort(np.arange(nb_praticiens) % len(cabinets))
+        self.type_praticien = _tirer(rng, len(TYPES_PRATICIENS), nb_praticiens, POIDS_PRATICIENS)
+        prenoms = _tirer(rng, len(PRENOMS), nb_praticiens)
+        noms = _tirer(rng, len(NOMS), nb_praticiens)
+        self.dentistes, self.noms_complets = [], []
+        for i in range(nb_praticiens):
+            titre = '' if TYPES_PRATICIENS[self.type_praticien[i]] == 'Hygiéniste' else 'Dr '
+            prenom, nom = PRENOMS[prenoms[i]], NOMS[noms[i]]
+            self.dentistes.append(f"{titre}{prenom} {nom} {i + 1}")
+            self.noms_complets.append(f"{titre}{nom} {prenom} {i + 1}")
+
+    @staticmethod
+    def _dans_groupe(rng, groupe_par_element, groupes):
+        """Un élément tiré uniformément dans le groupe de chaque ligne (éléments rangés par groupe)"""
+        debut = np.searchsorted(groupe_par_element, groupes, side='left')
+        fin = np.searchsorted(groupe_par_element, groupes, side='right')
+        return debut + (rng.random(len(groupes)) * (fin - debut)).astype(np.int64)
+
+    def clinique(self, rng, cabinets):
+        return self._dans_groupe(rng, self.cabinet_clinique, cabinets)
+
+    def praticien(self, rng, cabinets):
+        return self._dans_groupe(rng, self.cabinet_praticien, cabinets)
+
+
+def _calendrier(rng, nb_patients, debut, fin, soins_par_patient, intervalle, saisonnalite):
+    """(patient, jour depuis `debut`) de chaque soin, triés par patient puis par jour"""
+    jours = np.arange(debut, fin + 1, dtype='datetime64[D]')
+    poids = np.asarray(saisonnalite, dtype=float)[jours.astype('datetime64[M]').astype(np.int64) % 12]
+    acceptation = poids / poids.max()
+
+    # Les revisites refusées par la saisonnalité sont compensées en amont
+    revisites = (soins_par_patient - 1) / acceptation.mean()
+    nb_soins = rng.geometric(1 / (1 + revisites), nb_patients)
+    patient = np.repeat(np.arange(nb_patients), nb_soins)
+    premier = np.ones(len(patient), dtype=bool)
+    premier[1:] = patient[1:] != patient[:-1]
+
+    # Jour de chaque soin = première visite + somme des écarts précédents du patient
+    ecarts = np.ceil(rng.gamma(2.0, intervalle / 2, len(patient))).astype(np.int64)
+    ecarts[premier] = rng.choice(len(jours), nb_patients, p=poids / poids.sum())
+    cumul = np.cumsum(ecarts)
+    jour = cumul - np.repeat(cumul[premier] - ecarts[premier], nb_soins)
+
+    garde = jour < len(jours)
+    garde[garde] &= premier[garde] | (rng.random(int(garde.sum())) < acceptation[jour[garde]])
+    return patient[garde], jour[garde]
+
+
+def _patients(rng, nb_patients, patient, ref):
+    """Attributs constants de chaque patient (codes), visites comprises"""
+    visites = np.bincount(patient, minlength=nb_patients)
+    largeur = max(5, len(str(nb_patients)))
+    return {
+        'identifiant': np.array([f"P{i:0{largeur}d}" for i in range(1, nb_patients + 1)], dtype=object),
+        'nom': _tirer(rng, len(NOMS), nb_patients),
+        'prénom': _tirer(rng, len(PRENOMS), nb_patients),
+        'sexe': _tirer(rng, 2, nb_patients),
+        'âge': rng.integers(18, 81, nb_patients),
+        'assurance': _tirer(rng, len(ASSURANCES), nb_patients, POIDS_ASSURANCES),
+        'formule': _tirer(rng, len(FORMULES), nb_patients, POIDS_FORMULES),
+        'adresse': _tirer(rng, len(ADRESSES), nb_patients),
+        'cabinet': _tirer(rng, len(ref.cabinets), nb_patients, ref.poids_cabinets),
+        'visites': visites,
+        # Nouveau : 1 visite, Occasionnel : 2 à 4, Fidèle : 5 et plus
+        'type': np.searchsorted([2, 5], visites, side='right'),
+    }
+
+
+def _soins(rng, patient, jour, patients, ref, debut):
+    """DataFrame des soins (libellés en catégories) pour des lignes (patient, jour)"""
+    nb_lignes = len(patient)
+
+    cabinet = patients['cabinet'][patient]
+    ailleurs = rng.random(nb_lignes) >= FIDELITE_CABINET
+    cabinet[ailleurs] = _tirer(rng, len(ref.cabinets), int(ailleurs.sum()), ref.poids_cabinets)
+    clinique = ref.clinique(rng, cabinet)
+    praticien = ref.praticien(rng, cabinet)
+
+    soin = _tirer(rng, len(SOINS), nb_lignes, POIDS_SOINS)
+    types_soins, categories, normalises, tarifs, ecarts, durees = (list(c) for c in zip(*SOINS))
+    libelles_categories = sorted(set(categories))
+    code_categorie = np.array([libelles_categories.index(c) for c in categories])
+    code_normalise = np.array([-1 if n is None else NORMALISES.index(n) for n in normalises])[soin]
+    formule = code_normalise < 0
+    code_normalise[formule] = np.array([NORMALISES.index(n) for n in NORMALISES_FORMULES])[
+        _tirer(rng, len(NORMALISES_FORMULES), int(formule.sum()))]
+    duree = np.array(durees)[soin]
+
+    # Montants : tarif bruité, remboursement partiel, reste à charge
+    montant = np.maximum(np.array(tarifs)[soin] + np.array(ecarts)[soin] * rng.standard_normal(nb_lignes), 0)
+    montant = montant.round(2)
+    taux = rng.uniform(40, 100, nb_lignes).round(2)
+    taux[rng.random(nb_lignes) < 0.05] = 0.0
+    paye = (montant * taux / 100).round(2)
+
+    satisfaction = np.array(SATISFACTIONS)[_tirer(rng, len(SATISFACTIONS), nb_lignes, POIDS_SATISFACTIONS)]
+    satisfaction[rng.random(nb_lignes) < 0.057] = np.nan
+    jours_retard = rng.integers(5, 31, nb_lignes).astype(float)
+    sans_retard = rng.random(nb_lignes) < 0.007
+    jours_retard[sans_retard] = np.nan
+    retard = np.where(rng.random(nb_lignes) < 0.95, True, False).astype(object)
+    retard[sans_retard] = np.nan
+
+    visites = patients['visites'][patient]
+    return pd.DataFrame({
+        'patientid': patients['identifiant'][patient],
+        'nom': _categorie(patients['nom'][patient], NOMS),
+        'prénom': _categorie(patients['prénom'][patient], PRENOMS),
+        'sexe': _categorie(patients['sexe'][patient], ['Homme', 'Femme']),
+        'âge': patients['âge'][patient],
+        'assurance': _categorie(patients['assurance'][patient], ASSURANCES),
+        'date_du_soin': (debut + jour.astype('timedelta64[D]')).astype('datetime64[ns]'),
+        'heure_début': _categorie(_tirer(rng, len(HEURES), nb_lignes), HEURES),
+        'durée_minutes': duree,
+        'type_de_soin': _categorie(soin, types_soins),
+        'catégorie_soin': _categorie(code_categorie[soin], libelles_categories),
+        'dentiste': _categorie(praticien, ref.dentistes),
+        'type_de_praticien': _categorie(ref.type_praticien[praticien], TYPES_PRATICIENS),
+        'cabinet': _categorie(cabinet, ref.cabinets),
+        'montant_total_chf': montant,
+        'montant_payé_chf': paye,
+        'reste_à_charge_chf': (montant - paye).round(2),
+        'taux_de_remboursement_%': taux,
+        'revenu_horaire_chf/h': (montant / duree * 60).round(2),
+        'méthode_de_paiement': _categorie(_tirer(rng, len(PAIEMENTS), nb_lignes, POIDS_PAIEMENTS), PAIEMENTS),
+        'satisfaction_1-5': satisfaction,
+        'nb_visites_patient': visites,
+        'patient_fidèle': np.where(visites >= 2, 'Oui', 'Non').astype(object),
+        'type_de_patient': _categorie(patients['type'][patient], TYPES_PATIENTS),
+        'type_de_soin_normalisé': _categorie(code_normalise, NORMALISES),
+        'formule': _categorie(patients['formule'][patient], FORMULES),
+        'canton_clinique': _categorie(ref.canton_clinique[clinique], ref.cantons),
+        'nom_de_la_clinique': _categorie(clinique, ref.cliniques),
+        'nom_complet_praticien': _categorie(praticien, ref.noms_complets),
+        'rdv_manqué': rng.random(nb_lignes) < 0.14,
+        'adresse_complete': _categorie(patients['adresse'][patient], ADRESSES),
+        'retard_paiement_jours': jours_retard,
+        'retard': retard,
+    })
+
+
+class GenerateurSoins:
+    """Parcours de soins synthétiques, produits en bloc ou tranche par tranche de dates"""
+
+    def __init__(self, nb_patients, nb_cabinets=len(CABINETS), nb_praticiens=None, annees=1,
+                 fin=DATE_FIN, soins_par_patient=SOINS_PAR_PATIENT,
+                 intervalle_revisite=INTERVALLE_REVISITE_JOURS, saisonnalite=SAISONNALITE, seed=GRAINE):
+        self.rng = np.random.default_rng(seed)
+        self.fin = np.datetime64(fin, 'D')
+        self.debut = np.datetime64((pd.Timestamp(self.fin) - pd.DateOffset(years=annees)).date(), 'D')
+        nb_praticiens = nb_praticiens or PRATICIENS_PAR_CABINET * nb_cabinets
+        self.ref = Referentiels(self.rng, referentiel_cabinets(nb_cabinets), nb_praticiens)
+        patient, jour = _calendrier(self.rng, nb_patients, self.debut, self.fin,
+                                    soins_par_patient, intervalle_revisite, saisonnalite)
+        self.patients = _patients(self.rng, nb_patients, patient, self.ref)
+        # Soins rangés par date : une tranche de dates est une plage contiguë
+        ordre = np.argsort(jour, kind='stable')
+        self.patient, self.jour = patient[ordre], jour[ordre]
+
+    def __len__(self):
+        return len(self.jour)
+
+    def soins(self, debut=None, fin=None):
+        """Soins datés de [debut, fin[ (toute la période par défaut)"""
+        def position(date, defaut):
+            if date is None:
+                return defaut
+            return np.searchsorted(self.jour, (np.datetime64(date, 'D') - self.debut).astype(np.int64))
+
+        i, j = position(debut, 0), position(fin, len(self.jour))
+        return _soins(self.rng, self.patient[i:j], self.jour[i:j], self.patients, self.ref, self.debut)
+
+    def par_annee(self):
+        """Soins année civile par année civile"""
+        premiere = self.debut.astype('datetime64[Y]').astype(int) + 1970
+        derniere = self.fin.astype('datetime64[Y]').astype(int) + 1970
+        for annee in range(premiere, derniere + 1):
+            yield annee, self.soins(f"{annee}-01-01", f"{annee + 1}-01-01")
+
+
+def generer_patients(nb_lignes, seed=GRAINE, categories=False, colonnes=None, **parametres):
+    """DataFrame d'environ `nb_lignes` soins aux types bruts de pd.read_excel
+
+    Les paramètres de GenerateurSoins (cabinets, praticiens, années...) sont
+    acceptés ; le nombre de patients découle de `soins_par_patient`. Pour
+    les benchmarks à plusieurs millions de lignes : categories=True garde
+    les libellés en catégories, et `colonnes` fait produire les soins mois
+    par mois, réduits à ces colonnes (la mémoire de pointe est celle d'un
+    mois de soins complets).
+    """
+    parametres.setdefault('soins_par_patient', SOINS_PAR_PATIENT)
+    nb_patients = max(1, round(nb_lignes / parametres['soins_par_patient']))
+    generateur = GenerateurSoins(nb_patients, seed=seed, **parametres)
+    # Les visites postérieures à la fin de la période sont perdues : une
+    # seconde génération corrige le nombre de patients
+    if len(generateur) and abs(len(generateur) / nb_lignes - 1) > 0.01:
+        nb_patients = max(1, round(nb_patients * nb_lignes / len(generateur)))
+        generateur = GenerateurSoins(nb_patients, seed=seed, **parametres)
+    if colonnes is None:
+        df = generateur.soins()
+    else:
+        mois = list(pd.date_range(str(generateur.debut), str(generateur.fin), freq='MS'))
+        bornes = [None] + [m for m in mois if m > pd.Timestamp(generateur.debut)] + [None]
+        df = pd.concat([generateur.soins(debut, fin)[list(colonnes)] for debut, fin in zip(bornes[:-1], bornes[1:])],
+                       ignore_index=True)
+    if categories:
+        return df
+    # Texte en object, comme à la lecture du classeur
+    for colonne in df.select_dtypes('category').columns:
+        df[colonne] = df[colonne].astype(object)
+    return df
+
+
+def ecrire_entrepot(dossier, nb_patients, agregats=False, **parametres):
+    """Écrit les soins générés dans un entrepôt partitionné par mois et par cabinet
+
+    Une année est générée et écrite à la fois : la mémoire dépend du volume
+    annuel, pas de l'historique. Avec `agregats`, chaque année passe par
+    EntrepotSoins.ingerer (cube de KPIs et table patients mis à jour) ;
+    sinon seules les partitions sont écrites, et le premier ingerer()
+    reconstruit le cube et la table patients à partir de ces partitions.
+    """
+    from ingestion_incrementale import EntrepotSoins
+    from nettoyage_donnees import nettoyer_donnees
+
+    generateur = GenerateurSoins(nb_patients, **parametres)
+    entrepot = EntrepotSoins(dossier)
+    os.makedirs(dossier, exist_ok=True)
+    print(f"🏭 {len(generateur):,} soins, {nb_patients:,} patients, {len(generateur.ref.cabinets)} cabinets")
+    for annee, df in generateur.par_annee():
+        if df.empty:
+            continue
+        if agregats:
+            entrepot.ingerer(df, identifiant=f"synthetique-{annee}", source=f"synthétique {annee}")
+        else:
+            entrepot.ajouter_partitions(nettoyer_donnees(df))
+            print(f"   {annee}: {len(df):,} soins")
+    return generateur
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    arguments = sys.argv[2:]
+
+    def option(nom, defaut, type_valeur=int):
+        if nom not in arguments:
+            return defaut
+        return type_valeur(arguments[arguments.index(nom) + 1])
+
+    sortie = sys.argv[1]
+    nb_cabinets = option('--cabinets', len(CABINETS))
+    annees = option('--annees', 1)
+    parametres = dict(
+        nb_cabinets=nb_cabinets,
+        nb_praticiens=option('--praticiens', None),
+        annees=annees,
+        soins_par_patient=option('--soins-par-patient', SOINS_PAR_PATIENT, float),
+        seed=option('--graine', GRAINE),
+    )
+    nb_patients = option('--patients', 2_000 * nb_cabinets * annees)
+
+    debut = time.perf_counter()
+    if sortie.lower().endswith('.csv'):
+        df = GenerateurSoins(nb_patients, **parametres).soins()
+        df.to_csv(sortie, index=False)
+        print(f"✅ {len(df):,} soins ({df['patientid'].nunique():,} patients) écrits dans {sortie}")
+    else:
+        ecrire_entrepot(sortie, nb_patients, agregats='--agregats' in arguments, **parametres)
+        print(f"✅ Entrepôt écrit dans {sortie}")
+    print(f"⏱️ {time.perf_counter() - debut:.1f} s")
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Export Parquet des soins nettoyés et des tables de KPIs, pour la BI
+Auteur: Assistant IA
+Date: 2024
+
+Chaque table est un dataset Parquet partitionné à la Hive (dossiers
+annee=.../cabinet=...) : un outil de BI, pyarrow, DuckDB ou Spark ne lit
+que les colonnes et les partitions demandées, sans réanalyser l'Excel.
+Les colonnes sont encodées par dictionnaire et chaque groupe de lignes
+porte ses statistiques min/max : les soins sont triés par date, un filtre
+sur date_du_soin saute donc les groupes hors période.
+
+L'export complet est écrit à côté puis substitué au précédent : un
+lecteur ne voit jamais un export à moitié écrit.
+
+Usage: python export_parquet.py [fichier_donnees] [dossier_export]
+"""
+
+import json
+import os
+import shutil
+import sys
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from chargement_donnees import typer_colonnes
+from cube_kpi import CubeKPI
+from kpi_vectorises import taux_fidelisation
+from mesures_performance import instrumenter
+from montants import montants_chf
+from nettoyage_donnees import FICHIER_DONNEES, charger_donnees_nettoyees
+from rfm import MoteurRFM
+
+DOSSIER_EXPORT = os.path.join("data", "export")
+
+# Snappy : lu par tous les consommateurs visés (Power BI compris), contrairement à zstd
+OPTIONS_PARQUET = {'compression': 'snappy', 'use_dictionary': True, 'write_statistics': True}
+# Des groupes de lignes modestes rendent les statistiques plus sélectives
+LIGNES_PAR_GROUPE = 100_000
+
+DIMENSIONS_EXPORT = ['cabinet', 'type_de_soin', 'dentiste', 'nom_de_la_clinique', 'Année-Mois']
+
+MESURES_ACTIVITE = ['nb_actes', 'nb_montants', 'ca_total', 'ca_moyen', 'nb_patients']
+MESURES_IMPAYES = ['nb_actes', 'nb_retards', 'taux_retard', 'montant_retard', 'delai_moyen',
+                   'nb_impayes', 'montant_impaye', 'impaye_moyen']
+
+# Table de KPIs -> (dimension du cube, mesures) ; toutes sont partitionnées par cabinet
+TABLES_CUBE = {
+    'kpi_top_soins': ('type_de_soin', MESURES_ACTIVITE),
+    'kpi_praticiens': ('dentiste', MESURES_ACTIVITE),
+    'kpi_impayes': ('type_de_soin', MESURES_IMPAYES),
+    'kpi_clinique': ('nom_de_la_clinique', MESURES_ACTIVITE + ['taux_vip']),
+    'kpi_mensuel': ('Année-Mois', MESURES_ACTIVITE + ['montant_impaye']),
+}
+
+
+def _valeur_partition(serie):
+    """Valeurs de partition en texte, les manquantes regroupées sous « inconnu »"""
+    return serie.astype(object).where(serie.notna(), 'inconnu').astype(str)
+
+
+def table_soins(df):
+    """Soins nettoyés, triés par date, avec les colonnes de partition annee et cabinet
+
+    Les montants sont exportés en CHF, comme dans les données d'origine.
+    """
+    df = montants_chf(df.sort_values('date_du_soin', kind='stable'))
+    return df.assign(
+        annee=_valeur_partition(df['date_du_soin'].dt.year.astype('Int64')),
+        cabinet=_valeur_partition(df['cabinet']),
+    )
+
+
+def tables_kpis(df, cube):
+    """Tables de KPIs du rapport : nom -> (DataFrame, colonnes de partition)"""
+    tables = {}
+    for nom, (dimension, mesures) in TABLES_CUBE.items():
+        kpi = cube.cumuler(['cabinet', dimension])[mesures].reset_index()
+        kpi['cabinet'] = _valeur_partition(kpi['cabinet'])
+        tables[nom] = (kpi, ['cabinet'])
+
+    # Fidélisation : part des patients revenus chez le même dentiste, par cabinet
+    fidelisation = pd.concat({
+        cabinet: taux_fidelisation(lignes, 'dentiste')
+        for cabinet, lignes in df.groupby('cabinet', observed=True)
+    }, names=['cabinet', 'dentiste']).rename('taux_fidelisation_pct').reset_index()
+    fidelisation['cabinet'] = _valeur_partition(fidelisation['cabinet'])
+    tables['kpi_fidelisation'] = (fidelisation, ['cabinet'])
+
+    # RFM : un patient peut consulter dans plusieurs cabinets, la table est partitionnée par segment
+    rfm = MoteurRFM().ajuster(df).reset_index()
+    rfm['Segment'] = _valeur_partition(rfm['Segment'])
+    tables['kpi_rfm'] = (rfm, ['Segment'])
+    return tables
+
+
+def ecrire_table(df, dossier, partitions, ordre=False):
+    """Écrit un DataFrame en dataset Parquet partitionné (Hive) ; renvoie le nombre de fichiers"""
+    table = pa.Table.from_pandas(typer_colonnes(df), preserve_index=False)
+    fichiers = []
+    ds.write_dataset(
+        table,
+        dossier,
+        format='parquet',
+        partitioning=ds.partitioning(pa.schema([table.schema.field(c) for c in partitions]), flavor='hive'),
+        file_options=ds.ParquetFileFormat().make_write_options(**OPTIONS_PARQUET),
+        basename_template='part-{i}.parquet',
+        max_rows_per_group=LIGNES_PAR_GROUPE,
+        max_partitions=max(1024, len(df[partitions].drop_duplicates())),
+        preserve_order=ordre,
+        file_visitor=lambda fichier: fichiers.append(fichier.path),
+    )
+    return len(fichiers)
+
+
+def _remplacer_dossier(provisoire, dossier):
+    """Substitue le nouvel export à l'ancien (deux renommages)"""
+    ancien = f"{dossier}.ancien-{os.getpid()}"
+    if os.path.exists(dossier):
+        os.rename(dossier, ancien)
+    os.rename(provisoire, dossier)
+    shutil.rmtree(ancien, ignore_errors=True)
+
+
+@instrumenter('export_parquet', lignes=lambda resultat, args: len(args[0]))
+def exporter(df, dossier=DOSSIER_EXPORT, cube=None):
+    """Exporte les soins nettoyés et les tables de KPIs ; renvoie le manifeste de l'export"""
+    if cube is None:
+        cube = CubeKPI.construire(df, dimensions=DIMENSIONS_EXPORT)
+
+    tables = {'soins': (table_soins(df), ['annee', 'cabinet'])}
+    tables.update(tables_kpis(df, cube))
+
+    provisoire = f"{dossier.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(provisoire, ignore_errors=True)
+    os.makedirs(provisoire)
+    manifeste = {'date_export': datetime.now().isoformat(timespec='seconds'), 'tables': {}}
+    try:
+        for nom, (table, partitions) in tables.items():
+            nb_fichiers = ecrire_table(table, os.path.join(provisoire, nom), partitions, ordre=nom == 'soins')
+            manifeste['tables'][nom] = {
+                'lignes': len(table),
+                'fichiers': nb_fichiers,
+                'partitions': partitions,
+                'colonnes': [str(c) for c in table.columns],
+            }
+            print(f"   {nom:<18} {len(table):>10,} lignes, {nb_fichiers} fichier(s)")
+        with open(os.path.join(provisoire, 'manifeste.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifeste, f, ensure_ascii=False, indent=2)
+        _remplacer_dossier(provisoire, dossier)
+    except Exception:
+        shutil.rmtree(provisoire, ignore_errors=True)
+        raise
+    return manifeste
+
+
+def lire_table(nom, dossier=DOSSIER_EXPORT, colonnes=None, filtre=None):
+    """Relit une table exportée (seules les colonnes et partitions utiles sont lues)
+
+    `filtre` est une expression pyarrow, par ex. ds.field('cabinet') == 'Eaux-Vives'.
+    """
+    dataset = ds.dataset(os.path.join(dossier, nom), format='parquet', partitioning='hive')
+    return dataset.to_table(columns=colonnes, filter=filtre).to_pandas()
+
+
+if __name__ == "__main__":
+    fichier = sys.argv[1] if len(sys.argv) > 1 else FICHIER_DONNEES
+    dossier = sys.argv[2] if len(sys.argv) > 2 else DOSSIER_EXPORT
+    try:
+        print(f"📦 Export Parquet de {fichier} vers {dossier}")
+        exporter(charger_donnees_nettoyees(fichier), dossier)
+        print(f"✅ Export terminé: {dossier}")
+    except Exception as e:
+        print(f"❌ Erreur lors de l'export: {e}")
+        sys.exit(1)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Comptage approché de patients distincts par sketches HyperLogLog
+Auteur: Assistant IA
+Date: 2024
+
+Un sketch HLL de précision p garde, pour chacun de ses 2^p registres, le rang
+maximal (position du premier bit à 1) des empreintes qui y tombent. L'union
+de deux sketches est le maximum registre par registre : les sketches se
+fusionnent sans revenir aux lignes, et l'erreur type vaut 1.04 / sqrt(2^p).
+
+Les sketches sont stockés en forme creuse : un triplet (sketch, registre,
+rang) par registre non vide. Un sketch de cellule de cube qui ne voit que
+quelques patients n'occupe que quelques entrées, et jamais plus de 2^p.
+Les cardinalités sont estimées par l'estimateur amélioré d'Ertl, à partir
+de l'histogramme des rangs de chaque sketch.
+"""
+
+import numpy as np
+import pandas as pd
+
+ERREUR_DEFAUT = 0.01
+PRECISION_MIN = 4
+PRECISION_MAX = 18
+
+
+def precision_pour_erreur(erreur):
+    """Plus petite précision dont l'erreur type ne dépasse pas `erreur` (relative)"""
+    precision = int(np.ceil(np.log2((1.04 / erreur) ** 2)))
+    return min(max(precision, PRECISION_MIN), PRECISION_MAX)
+
+
+def erreur_type(precision):
+    """Erreur relative type d'un sketch de précision donnée"""
+    return 1.04 / np.sqrt(1 << precision)
+
+
+def empreintes(valeurs):
+    """Empreintes 64 bits d'identifiants (stables d'une exécution à l'autre)"""
+    return pd.util.hash_array(np.asarray(valeurs, dtype=object))
+
+
+def registres(empreintes, precision):
+    """Registre (p bits de poids fort) et rang (premier bit à 1 du reste) de chaque empreinte"""
+    empreintes = np.asarray(empreintes, dtype=np.uint64)
+    bits_reste = 64 - precision
+    registre = (empreintes >> np.uint64(bits_reste)).astype(np.int64)
+    reste = empreintes & np.uint64((1 << bits_reste) - 1)
+    # frexp donne le nombre de bits significatifs du reste (0 si le reste est nul)
+    longueur = np.frexp(reste.astype(np.float64))[1]
+    rang = bits_reste - longueur + 1
+    return registre, rang.astype(np.int8)
+
+
+# Au-delà, l'union par groupe passe par les triplets creux plutôt que par des registres denses
+TAILLE_MAX_DENSE = 1 << 26
+
+
+def _sigma(x):
+    """Série sigma de l'estimateur d'Ertl (registres vides), vectorisée"""
+    x = np.array(x, dtype=np.float64)
+    vide = x == 1
+    # Sketch vide : la série diverge (estimation nulle), elle est calculée sur 0
+    x = np.where(vide, 0.0, x)
+    resultat = x.copy()
+    y = np.ones_like(x)
+    while True:
+        x = x * x
+        precedent = resultat
+        resultat = resultat + x * y
+        y = y + y
+        if np.array_equal(resultat, precedent):
+            break
+    return np.where(vide, np.inf, resultat)
+
+
+def _tau(x):
+    """Série tau de l'estimateur d'Ertl (registres saturés), vectorisée"""
+    x = np.array(x, dtype=np.float64)
+    resultat = 1 - x
+    y = np.ones_like(x)
+    while True:
+        x = np.sqrt(x)
+        precedent = resultat
+        y = y * 0.5
+        resultat = resultat - (1 - x) ** 2 * y
+        if np.array_equal(resultat, precedent):
+            break
+    return np.where((x == 0) | (x == 1), 0.0, resultat / 3)
+
+
+def estimer_histogrammes(histogrammes, precision):
+    """Cardinalités estimées à partir des histogrammes de rangs (une ligne par sketch)
+
+    Estimateur d'Ertl (2017) : sans biais sur toute la plage de cardinalités,
+    sans table de correction ni bascule vers le comptage linéaire.
+    """
+    m = 1 << precision
+    q = 64 - precision
+    histogrammes = np.asarray(histogrammes, dtype=np.float64)
+    z = m * _tau(1 - histogrammes[:, q + 1] / m)
+    for k in range(q, 0, -1):
+        z = 0.5 * (z + histogrammes[:, k])
+    z = z + m * _sigma(histogrammes[:, 0] / m)
+    with np.errstate(divide='ignore'):
+        return m * m / (2 * np.log(2)) / z
+
+
+class SketchesHLL:
+    """Famille de sketches HLL creux, indexés de 0 à nb_sketches - 1"""
+
+    def __init__(self, sketch, registre, rang, nb_sketches, precision):
+        self.sketch = sketch
+        self.registre = registre
+        self.rang = rang
+        self.nb_sketches = nb_sketches
+        self.precision = precision
+
+    @property
+    def erreur(self):
+        return erreur_type(self.precision)
+
+    @classmethod
+    def _reduire(cls, sketch, registre, rang, nb_sketches, precision):
+        """Garde le rang maximal de chaque paire (sketch, registre)"""
+        cle = sketch.astype(np.int64) * (1 << precision) + registre
+        ordre = np.lexsort((rang, cle))
+        cle, rang = cle[ordre], rang[ordre]
+        dernier = np.ones(len(cle), dtype=bool)
+        dernier[:-1] = cle[1:] != cle[:-1]
+        cle, rang = cle[dernier], rang[dernier]
+        return cls(cle >> precision, cle & ((1 << precision) - 1), rang, nb_sketches, precision)
+
+    @classmethod
+    def construire(cls, sketch_par_ligne, empreintes_lignes, nb_sketches, precision):
+        """Un sketch par valeur de `sketch_par_ligne`, alimenté par les empreintes des lignes"""
+        registre, rang = registres(empreintes_lignes, precision)
+        return cls._reduire(np.asarray(sketch_par_ligne), registre, rang, nb_sketches, precision)
+
+    def regrouper(self, groupe_par_sketch, nb_groupes):
+        """Union des sketches par groupe (groupe -1 : sketch ignoré)"""
+        groupe = np.asarray(groupe_par_sketch)[self.sketch]
+        retenu = groupe >= 0
+        return SketchesHLL._reduire(groupe[retenu], self.registre[retenu], self.rang[retenu],
+                                    nb_groupes, self.precision)
+
+    def concatener(self, autre):
+        """Sketches de `autre` ajoutés à la suite (numérotés à partir de nb_sketches)"""
+        if autre.precision != self.precision:
+            raise ValueError(f"Précisions HLL différentes: {self.precision} et {autre.precision}")
+        return SketchesHLL(np.concatenate([self.sketch, autre.sketch + self.nb_sketches]),
+                           np.concatenate([self.registre, autre.registre]),
+                           np.concatenate([self.rang, autre.rang]),
+                           self.nb_sketches + autre.nb_sketches, self.precision)
+
+    def histogrammes(self):
+        """Nombre de registres de chaque rang (0 : registre vide), par sketch"""
+        nb_rangs = 64 - self.precision + 2
+        histogrammes = np.bincount(self.sketch * nb_rangs + self.rang,
+                                   minlength=self.nb_sketches * nb_rangs).reshape(self.nb_sketches, nb_rangs)
+        histogrammes[:, 0] = (1 << self.precision) - histogrammes[:, 1:].sum(axis=1)
+        return histogrammes
+
+    def estimer(self):
+        """Nombre estimé de valeurs distinctes de chaque sketch"""
+        return estimer_histogrammes(self.histogrammes(), self.precision)
+
+    def estimer_groupes(self, groupe_par_sketch, nb_groupes):
+        """Nombre estimé de valeurs distinctes de l'union des sketches de chaque groupe
+
+        Quand les registres de tous les groupes tiennent en mémoire, l'union est
+        un maximum registre par registre (O(entrées), sans tri) ; sinon elle
+        passe par regrouper().
+        """
+        m = 1 << self.precision
+        if nb_groupes * m > TAILLE_MAX_DENSE:
+            return self.regrouper(groupe_par_sketch, nb_groupes).estimer()
+        groupe = np.asarray(groupe_par_sketch)[self.sketch]
+        retenu = groupe >= 0
+        denses = np.zeros(nb_groupes * m, dtype=np.int8)
+        np.maximum.at(denses, groupe[retenu] * m + self.registre[retenu], self.rang[retenu])
+        nb_rangs = 64 - self.precision + 2
+        histogrammes = np.bincount(np.repeat(np.arange(nb_groupes) * nb_rangs, m) + denses,
+                                   minlength=nb_groupes * nb_rangs).reshape(nb_groupes, nb_rangs)
+        return estimer_histogrammes(histogrammes, self.precision)
+
+    def sauvegarder(self, chemin):
+        np.savez(chemin, sketch=self.sketch, registre=self.registre, rang=self.rang,
+                 nb_sketches=self.nb_sketches, precision=self.precision)
+
+    @classmethod
+    def charger(cls, chemin):
+        donnees = np.load(chemin)
+        return cls(donnees['sketch'], donnees['registre'], donnees['rang'],
+                   int(donnees['nb_sketches']), int(donnees['precision']))
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Ingestion incrémentale des exports quotidiens des cliniques
+Auteur: Assistant IA
+Date: 2024
+
+Chaque delta (nouvelles lignes de soins) est nettoyé puis ajouté à un
+entrepôt Parquet partitionné par mois et par cabinet. Le cube de KPIs et la
+table patients (qui contient la base RFM) sont rangés selon les mêmes
+partitions : un delta ne relit et ne réécrit que les partitions qu'il touche,
+le coût d'un rafraîchissement dépend de la taille du delta, pas de tout
+l'historique. Un delta est préparé à part et n'est publié
+qu'une fois validé dans le manifeste : une ingestion interrompue puis
+relancée ne compte jamais ses lignes deux fois.
+
+Usage: python ingestion_incrementale.py delta.xlsx [dossier_entrepot]
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import uuid
+from datetime import datetime
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from chargement_donnees import empreinte_fichier, lire_source, typer_colonnes
+from cube_kpi import CubeKPI
+from montants import montants_chf
+from nettoyage_donnees import nettoyer_donnees
+from table_patients import agreger_patients, assembler_patients, fusionner_patients
+
+DOSSIER_ENTREPOT = os.path.join("data", "entrepot")
+COLONNES_PARTITION = ['mois', 'cabinet']
+# Préfixe du dossier où un delta est préparé avant d'être publié dans l'entrepôt
+PREFIXE_ATTENTE = '.attente-'
+# Sous-dossiers publiés : soins, puis cube et table patients par partition
+SOUS_DOSSIERS = ['soins', 'cube', 'patients']
+# Disposition des agrégats notée dans le manifeste (absente : cube et table uniques)
+AGREGATS_PAR_PARTITION = 'partitions'
+
+
+def empreinte_dataframe(df):
+    """Empreinte du contenu d'un DataFrame, pour reconnaître un delta déjà ingéré"""
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def cles_partition(df):
+    """Mois ('AAAA-MM') et cabinet de chaque soin, 'inconnu' si la valeur manque"""
+    return (df['date_du_soin'].dt.strftime('%Y-%m').fillna('inconnu').rename('mois'),
+            df['cabinet'].astype(object).fillna('inconnu').rename('cabinet'))
+
+
+def chemin_partition(mois, cabinet):
+    """Chemin relatif d'une partition, au format hive (mois=.../cabinet=...)"""
+    return os.path.join(f"mois={quote(str(mois), safe='')}", f"cabinet={quote(str(cabinet), safe='')}")
+
+
+class EntrepotSoins:
+    """Entrepôt partitionné des soins, avec agrégats maintenus de façon incrémentale"""
+
+    def __init__(self, dossier=DOSSIER_ENTREPOT):
+        self.dossier = dossier
+        self.dossier_soins = os.path.join(dossier, 'soins')
+        self.dossier_cube = os.path.join(dossier, 'cube')
+        self.dossier_patients = os.path.join(dossier, 'patients')
+        # Table patients unique des entrepôts antérieurs aux partitions
+        self.chemin_patients = os.path.join(dossier, 'patients.parquet')
+        self.chemin_manifeste = os.path.join(dossier, 'manifeste.json')
+        self.manifeste = self._lire_manifeste()
+        self.reprendre()
+
+    def _lire_manifeste(self):
+        try:
+            with open(self.chemin_manifeste, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'deltas': {}}
+
+    def _ecrire_manifeste(self):
+        tmp = self.chemin_manifeste + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.manifeste, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.chemin_manifeste)
+
+    def deja_ingere(self, empreinte):
+        return empreinte in self.manifeste['deltas']
+
+    def ajouter_partitions(self, df, dossier=None):
+        """Écrit des soins nettoyés dans de nouveaux fichiers des partitions (mois, cabinet)
+
+        Le cube et la table patients ne sont pas mis à jour : c'est le rôle de
+        ingerer(), qui écrit d'abord les partitions dans un dossier d'attente
+        (`dossier`) ; le schéma reste celui des soins déjà publiés.
+        """
+        mois, cabinet = cles_partition(df)
+        # Les partitions gardent les montants en CHF : lire() les repasse en centimes
+        df = montants_chf(df).assign(mois=mois, cabinet=cabinet)
+        table = pa.Table.from_pandas(typer_colonnes(df), preserve_index=False)
+
+        # Les fichiers existants fixent le schéma : le delta y est aligné
+        if os.path.isdir(self.dossier_soins):
+            schema = ds.dataset(self.dossier_soins, partitioning='hive').schema
+            colonnes = [c for c in schema.names if c not in COLONNES_PARTITION and c in table.column_names]
+            table = table.select(colonnes + COLONNES_PARTITION).cast(
+                pa.schema([schema.field(c) for c in colonnes]
+                          + [table.schema.field(c) for c in COLONNES_PARTITION])
+            )
+
+        pq.write_to_dataset(
+            table,
+            dossier or self.dossier_soins,
+            partition_cols=COLONNES_PARTITION,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+            max_partitions=max(1024, len(df[COLONNES_PARTITION].drop_duplicates())),
+        )
+        return sorted(df['mois'].unique()), sorted(df['cabinet'].unique())
+
+    def ingerer(self, df, identifiant=None, source=None):
+        """Ajoute un delta de soins et met à jour le cube et la table patients
+
+        Un delta déjà ingéré (même empreinte) est ignoré. Renvoie le résumé
+        enregistré dans le manifeste, ou None si le delta était déjà connu.
+
+        Partitions, cube et table patients sont d'abord écrits dans un dossier
+        d'attente ; l'écriture du manifeste valide l'ingestion, puis le tout
+        est publié dans l'entrepôt. Après une interruption, reprendre() termine
+        la publication d'un delta validé et abandonne un delta non validé :
+        un delta n'est jamais compté deux fois.
+        """
+        identifiant = identifiant or empreinte_dataframe(df)
+        if self.deja_ingere(identifiant):
+            print(f"⏭️ Delta déjà ingéré: {source or identifiant[:12]}")
+            return None
+
+        os.makedirs(self.dossier, exist_ok=True)
+        df = nettoyer_donnees(df)
+        self.migrer()
+
+        attente = self._dossier_attente(identifiant)
+        shutil.rmtree(attente, ignore_errors=True)
+        os.makedirs(attente)
+        mois, cabinets = self.ajouter_partitions(df, os.path.join(attente, 'soins'))
+
+        # Cube et table patients : seules les partitions du delta sont relues et réécrites
+        for (mois_partition, cabinet), lot in df.groupby(list(cles_partition(df)), sort=True):
+            relatif = chemin_partition(mois_partition, cabinet)
+            cube_delta = CubeKPI.construire(lot)
+            cube = self._charger_cube_partition(relatif)
+            cube = cube_delta if cube is None else cube.fusionner(cube_delta)
+            cube.sauvegarder(os.path.join(attente, 'cube', relatif))
+
+            patients = fusionner_patients(self._charger_patients_partition(relatif), agreger_patients(lot))
+            os.makedirs(os.path.join(attente, 'patients', relatif), exist_ok=True)
+            patients.to_parquet(os.path.join(attente, 'patients', relatif, 'patients.parquet'))
+        nb_patients = df['patientid'].nunique()
+
+        resume = {
+            'source': source,
+            'lignes': len(df),
+            'mois': mois,
+            'cabinets': cabinets,
+            'patients_modifies': nb_patients,
+            'date_ingestion': datetime.now().isoformat(timespec='seconds'),
+        }
+        self.manifeste['deltas'][identifiant] = resume
+        self.manifeste['agregats'] = AGREGATS_PAR_PARTITION
+        self._ecrire_manifeste()
+        self._publier(attente)
+        print(f"✅ Delta ingéré: {len(df)} lignes, {len(mois)} mois, {len(cabinets)} cabinets, "
+              f"{nb_patients} patients mis à jour")
+        return resume
+
+    def _dossier_attente(self, identifiant):
+        return os.path.join(self.dossier, PREFIXE_ATTENTE + identifiant)
+
+    def _publier(self, attente):
+        """Déplace un delta préparé dans l'entrepôt ; peut être relancé après une interruption
+
+        Les fichiers de soins sont nouveaux ; ceux du cube et de la table
+        patients remplacent ceux des partitions touchées. Un fichier déjà
+        déplacé n'est plus dans le dossier d'attente : une reprise ne déplace
+        que les suivants.
+        """
+        for sous_dossier in SOUS_DOSSIERS:
+            depart = os.path.join(attente, sous_dossier)
+            for racine, _, fichiers in os.walk(depart):
+                for nom in fichiers:
+                    source = os.path.join(racine, nom)
+                    cible = os.path.join(self.dossier, sous_dossier, os.path.relpath(source, depart))
+                    os.makedirs(os.path.dirname(cible), exist_ok=True)
+                    os.replace(source, cible)
+        shutil.rmtree(attente)
+
+    def reprendre(self):
+        """Termine les ingestions validées par le manifeste et abandonne les autres"""
+        if not os.path.isdir(self.dossier):
+            return
+        for nom in sorted(os.listdir(self.dossier)):
+            if not nom.startswith(PREFIXE_ATTENTE):
+                continue
+            attente = os.path.join(self.dossier, nom)
+            if self.deja_ingere(nom[len(PREFIXE_ATTENTE):]):
+                print(f"🔁 Publication d'un delta interrompu: {nom[len(PREFIXE_ATTENTE):][:12]}")
+                self._publier(attente)
+            else:
+                shutil.rmtree(attente)
+
+    def ingerer_fichier(self, chemin):
+        """Ingère un fichier delta Excel ou CSV"""
+        empreinte = empreinte_fichier(chemin)
+        if self.deja_ingere(empreinte):
+            print(f"⏭️ Fichier déjà ingéré: {chemin}")
+            return None
+        return self.ingerer(lire_source(chemin), identifiant=empreinte, source=os.path.basename(chemin))
+
+    def _partitions(self, dossier, fichier):
+        """Chemins relatifs des partitions qui contiennent `fichier`"""
+        if not os.path.isdir(dossier):
+            return []
+        return sorted(os.path.relpath(racine, dossier) for racine, _, fichiers in os.walk(dossier)
+                      if fichier in fichiers)
+
+    def _charger_cube_partition(self, relatif):
+        dossier = os.path.join(self.dossier_cube, relatif)
+        return CubeKPI.charger(dossier) if os.path.exists(os.path.join(dossier, 'cube.json')) else None
+
+    def _charger_patients_partition(self, relatif):
+        chemin = os.path.join(self.dossier_patients, relatif, 'patients.parquet')
+        return pd.read_parquet(chemin) if os.path.exists(chemin) else None
+
+    def migrer(self):
+        """Range le cube et la table patients par partition (mois, cabinet)
+
+        Un entrepôt antérieur (cube et table patients uniques, ou partitions de
+        soins écrites sans agrégats par ajouter_partitions seul) est migré une
+        fois : les agrégats de chaque partition sont reconstruits à partir de
+        ses soins. Une migration interrompue est refaite en entier.
+        """
+        if self.manifeste.get('agregats') == AGREGATS_PAR_PARTITION or not os.path.isdir(self.dossier_soins):
+            return
+        print("🔄 Migration des agrégats de l'entrepôt par partition (mois, cabinet)")
+        shutil.rmtree(self.dossier_cube, ignore_errors=True)
+        shutil.rmtree(self.dossier_patients, ignore_errors=True)
+        df = self.lire()
+        for (mois, cabinet), lot in df.groupby(list(cles_partition(df)), sort=True):
+            relatif = chemin_partition(mois, cabinet)
+            CubeKPI.construire(lot).sauvegarder(os.path.join(self.dossier_cube, relatif))
+            os.makedirs(os.path.join(self.dossier_patients, relatif), exist_ok=True)
+            agreger_patients(lot).to_parquet(os.path.join(self.dossier_patients, relatif, 'patients.parquet'))
+        if os.path.exists(self.chemin_patients):
+            os.remove(self.chemin_patients)
+        self.manifeste['agregats'] = AGREGATS_PAR_PARTITION
+        self._ecrire_manifeste()
+
+    def charger_cube(self, mois=None, cabinets=None):
+        """Cube de KPIs des partitions demandées, toutes par défaut (None si l'entrepôt est vide)"""
+        self.migrer()
+        cubes = [CubeKPI.charger(os.path.join(self.dossier_cube, relatif))
+                 for relatif in self._partitions(self.dossier_cube, 'cube.json')
+                 if self._retenue(relatif, mois, cabinets)]
+        return CubeKPI.assembler(cubes) if cubes else None
+
+    def charger_patients(self, mois=None, cabinets=None):
+        """Table patients des partitions demandées, toutes par défaut (None si l'entrepôt est vide)
+
+        Un patient vu dans plusieurs partitions y a plusieurs lignes, fusionnées ici.
+        """
+        self.migrer()
+        return assembler_patients(
+            pd.read_parquet(os.path.join(self.dossier_patients, relatif, 'patients.parquet'))
+            for relatif in self._partitions(self.dossier_patients, 'patients.parquet')
+            if self._retenue(relatif, mois, cabinets))
+
+    @staticmethod
+    def _retenue(relatif, mois, cabinets):
+        """La partition `relatif` fait-elle partie des mois et cabinets demandés ?"""
+        partition_mois, partition_cabinet = (partie.split('=', 1)[1] for partie in relatif.split(os.sep))
+        return ((mois is None or partition_mois in {quote(str(m), safe='') for m in mois})
+                and (cabinets is None or partition_cabinet in {quote(str(c), safe='') for c in cabinets}))
+
+    def charger_rfm(self):
+        """Agrégats RFM par patient (dernier_soin, frequence, montant), lus dans la table patients"""
+        patients = self.charger_patients()
+        return None if patients is None else patients[['dernier_soin', 'frequence', 'montant']]
+
+    def lire(self, colonnes=None, mois=None, cabinets=None):
+        """Lit les soins de l'entrepôt, en ne parcourant que les partitions demandées"""
+        filtres = []
+        if mois is not None:
+            filtres.append(('mois', 'in', list(mois)))
+        if cabinets is not None:
+            filtres.append(('cabinet', 'in', list(cabinets)))
+        table = pq.read_table(self.dossier_soins, columns=colonnes, filters=filtres or None,
+                              partitioning='hive')
+        return nettoyer_donnees(table.to_pandas())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    try:
+        entrepot = EntrepotSoins(sys.argv[2] if len(sys.argv) > 2 else DOSSIER_ENTREPOT)
+        entrepot.ingerer_fichier(sys.argv[1])
+    except Exception as e:
+        print(f"❌ Erreur lors de l'ingestion: {e}")
+        sys.exit(1)
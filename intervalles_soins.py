@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Calcul vectorisé des intervalles entre soins d'un même patient
+Auteur: Assistant IA
+Date: 2024
+
+Les visites sont triées une seule fois par (patient, date) puis différenciées
+en bloc avec numpy : aucune boucle Python par patient.
+"""
+
+import numpy as np
+import pandas as pd
+
+NS_PAR_JOUR = 86_400 * 10**9
+
+
+def _codes_patients(serie):
+    """Codes entiers des patients (-1 si manquant) et libellés correspondants"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy(), serie.cat.categories
+    # Pas de tri des libellés : sur des millions d'identifiants il coûte plus que tout le reste
+    return pd.factorize(serie)
+
+
+def intervalles_entre_soins(df, col_patient='patientid', col_date='date_du_soin'):
+    """Intervalles (en jours) entre deux soins consécutifs d'un même patient
+
+    Renvoie une Series d'entiers indexée par patient, avec une entrée par
+    intervalle : c'est la distribution globale des intervalles. Les lignes
+    sans patient ou sans date sont ignorées.
+    """
+    codes, patients = _codes_patients(df[col_patient])
+    dates = pd.to_datetime(df[col_date]).to_numpy().astype('datetime64[ns]')
+
+    valide = (codes >= 0) & ~np.isnat(dates)
+    codes = codes[valide].astype(np.int64)
+    instants = dates[valide].view('int64')
+
+    if len(codes) > 0 and not (instants % NS_PAR_JOUR).any():
+        # Dates sans heure : (patient, jour) tient dans un seul entier, un tri simple suffit
+        jours = instants // NS_PAR_JOUR
+        cles = np.sort((codes << 32) | (jours - jours.min()))
+        codes = cles >> 32
+        ecarts = np.diff(cles & 0xFFFFFFFF)
+    else:
+        ordre = np.lexsort((instants, codes))
+        codes = codes[ordre]
+        ecarts = np.diff(instants[ordre]) // NS_PAR_JOUR
+
+    meme_patient = codes[1:] == codes[:-1]
+    return pd.Series(
+        ecarts[meme_patient],
+        index=pd.Index(patients.take(codes[1:][meme_patient]), name=col_patient),
+        name='intervalle_jours',
+    )
+
+
+def intervalles_par_patient(intervalles):
+    """Distribution des intervalles par patient (nombre, moyenne, médiane, min, max)"""
+    resume = intervalles.groupby(level=0, sort=False).agg(['count', 'mean', 'median', 'min', 'max'])
+    resume.columns = ['Nombre_intervalles', 'Intervalle_moyen', 'Intervalle_median',
+                      'Intervalle_min', 'Intervalle_max']
+    return resume
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Bibliothèque de KPIs vectorisés du cabinet dentaire
+Auteur: Assistant IA
+Date: 2024
+
+Chaque KPI est exprimé par des agrégations nommées ou des ratios de sommes,
+sans fonction Python appelée groupe par groupe (groupby().apply(lambda ...)).
+"""
+
+import numpy as np
+import pandas as pd
+
+from montants import colonnes_chf
+
+
+def _codes(serie, trier=True):
+    """Codes entiers (-1 si manquant) et libellés, dans l'ordre d'un groupby"""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        return serie.cat.codes.to_numpy().astype(np.int64), serie.cat.categories
+    codes, libelles = pd.factorize(serie, sort=trier)
+    return codes.astype(np.int64), libelles
+
+
+def performance_par_groupe(df, col_groupe, col_montant='montant_total_chf'):
+    """CA total, nombre d'actes et CA moyen par groupe"""
+    return colonnes_chf(df, [col_groupe, col_montant]).groupby(col_groupe, observed=True).agg(
+        CA_Total=(col_montant, 'sum'),
+        Nombre_Actes=(col_montant, 'count'),
+        CA_Moyen=(col_montant, 'mean'),
+    )
+
+
+def rentabilite_par_minute(df, col_groupe='type_de_soin', col_montant='montant_total_chf',
+                           col_duree='durée_minutes'):
+    """CA par minute de fauteuil : somme des montants / somme des durées (0 si durée nulle)"""
+    sommes = colonnes_chf(df, [col_groupe, col_montant, col_duree]).groupby(col_groupe, observed=True).sum()
+    return rentabilite(sommes[col_montant], sommes[col_duree])
+
+
+def rentabilite(montants, durees):
+    """CA par minute à partir de montants et de durées déjà cumulés par groupe"""
+    ratio = montants / durees
+    return ratio.where(durees > 0, 0)
+
+
+def taux_fidelisation(df, col_groupe, col_patient='patientid', seuil_visites=1):
+    """Part (%) des patients d'un groupe venus plus de `seuil_visites` fois dans ce groupe
+
+    Chaque paire (groupe, patient) est encodée en un seul entier : un tri
+    numpy donne le nombre de visites par paire, sans groupby sur deux clés.
+    """
+    groupes, libelles = _codes(df[col_groupe])
+    patients, _ = _codes(df[col_patient], trier=False)
+    base = max(patients.max() + 1, 1) if len(patients) else 1
+
+    connu = (groupes >= 0) & (patients >= 0)
+    paires, visites = np.unique(groupes[connu] * base + patients[connu], return_counts=True)
+    groupe_paire = paires // base
+
+    nb_patients = np.bincount(groupe_paire, minlength=len(libelles))
+    nb_fideles = np.bincount(groupe_paire, weights=visites > seuil_visites, minlength=len(libelles))
+    presents = nb_patients > 0
+    index = libelles[presents]
+    if isinstance(df[col_groupe].dtype, pd.CategoricalDtype):
+        index = pd.CategoricalIndex(index, dtype=df[col_groupe].dtype)
+    return pd.Series(nb_fideles[presents] / nb_patients[presents] * 100, index=index.rename(col_groupe))
+
+
+def taux_modalite(df, col_groupe, col_valeur, modalite):
+    """Part (%) des lignes d'un groupe dont la colonne vaut `modalite` (ex. patients VIP)"""
+    return (df[col_valeur] == modalite).groupby(df[col_groupe], observed=True).mean() * 100
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Lecture par blocs des gros exports CSV
+Auteur: Assistant IA
+Date: 2024
+
+Un export CSV du logiciel de gestion du cabinet peut peser plusieurs Go :
+le charger d'un bloc avec pd.read_csv sature la mémoire. Ici le fichier est
+lu par blocs de TAILLE_BLOC lignes, avec des types explicites et seulement
+les colonnes utiles ; chaque bloc met à jour des agrégats puis est libéré.
+La table complète n'est jamais construite.
+
+Les agrégats sont un cube (période, clinique, praticien, type de soin) de
+sommes et de compteurs, au grain du mois par défaut : sa taille dépend du
+nombre de combinaisons, pas du nombre de lignes, et ne peut dépasser
+NB_CELLULES_MAX. Chaque cellule est encodée en un entier et garde sa ligne
+une fois créée : un bloc est réduit seul (np.unique + bincount), puis ses
+sommes sont ajoutées aux lignes de ses cellules, sans retrier le cube.
+
+Les patients distincts sont estimés par des sketches HyperLogLog denses
+(2^p registres chacun) : un par mois, et un par mois et par clinique,
+praticien ou type de soin. Un filtre sur la période et sur une dimension
+fusionne les sketches retenus ; quand plusieurs dimensions sont filtrées,
+l'estimation est le plus petit des majorants obtenus dimension par
+dimension. La mémoire des agrégats ne dépend que du nombre de mois et de
+libellés, jamais du nombre de lignes ni de patients.
+"""
+
+import numpy as np
+import pandas as pd
+
+from hyperloglog import ERREUR_DEFAUT, empreintes, erreur_type, estimer_histogrammes, precision_pour_erreur, registres
+
+TAILLE_BLOC = 200_000
+
+# Colonnes de l'export (noms d'origine, tels qu'affichés par app.py)
+COL_DATE = 'Date du soin'
+COL_PATIENT = 'PatientID'
+COL_CLINIQUE = 'Nom de la clinique'
+COL_PRATICIEN = 'Nom complet praticien'
+COL_SOIN = 'Type de soin normalisé'
+COL_MONTANT = 'Montant total (CHF)'
+COL_PAYE = 'Montant payé (CHF)'
+COL_RESTE = 'Reste à charge (CHF)'
+COL_SATISFACTION = 'Satisfaction (1-5)'
+COL_DUREE = 'Durée (minutes)'
+COL_RDV_MANQUE = 'Rendez-vous manqué'
+COL_RETARD = 'Retard paiement (jours)'
+
+# Types explicites : pas d'inférence, et les libellés répétés en catégories
+TYPES_COLONNES = {
+    # Dates converties bloc par bloc : parse_dates passe par des objets Python en lecture par blocs
+    COL_DATE: 'object',
+    COL_PATIENT: 'object',
+    COL_CLINIQUE: 'category',
+    COL_PRATICIEN: 'category',
+    COL_SOIN: 'category',
+    COL_MONTANT: 'float64',
+    COL_PAYE: 'float64',
+    COL_RESTE: 'float64',
+    COL_SATISFACTION: 'float32',
+    COL_DUREE: 'float32',
+    COL_RDV_MANQUE: 'category',
+    COL_RETARD: 'float32',
+}
+COLONNES_UTILES = set(TYPES_COLONNES)
+
+CLES_CUBE = ['periode', 'clinique', 'praticien', 'soin']
+COLONNES_CLES = {'clinique': COL_CLINIQUE, 'praticien': COL_PRATICIEN, 'soin': COL_SOIN}
+SOMMES_CUBE = ['nb_soins', 'ca', 'paye', 'reste', 'satisfaction_somme', 'satisfaction_nb',
+               'duree_somme', 'duree_nb', 'rdv_manques', 'retard_somme', 'retard_nb', 'retards_30j']
+AGREGATIONS_CUBE = {**{colonne: 'sum' for colonne in SOMMES_CUBE}, 'duree_max': 'max'}
+
+# Une cellule du cube est encodée en un entier : période (17 bits depuis ORIGINE)
+# puis 15 bits par libellé. Le code 0 est réservé aux valeurs manquantes.
+ORIGINE = np.datetime64('1900-01-01', 'D')
+BITS_LIBELLE = 15
+
+# Grain du cube (unité numpy : 'M' mois, 'D' jour...) et plafond du nombre de cellules
+GRAIN_DEFAUT = 'M'
+NB_CELLULES_MAX = 2_000_000
+
+
+def _sans_nan(valeurs):
+    return np.where(np.isnan(valeurs), 0.0, valeurs)
+
+
+def _periodes(dates, grain):
+    """Numéro de période (1, 2... depuis ORIGINE, 0 si date manquante) de chaque date"""
+    dates = pd.to_datetime(dates).to_numpy().astype(f'datetime64[{grain}]')
+    origine = ORIGINE.astype(f'datetime64[{grain}]')
+    return np.where(np.isnat(dates), 0, (dates - origine).astype(np.int64) + 1)
+
+
+def _debut_periode(numeros, grain):
+    """Premier jour des périodes numérotées par _periodes (NaT pour 0)"""
+    origine = ORIGINE.astype(f'datetime64[{grain}]')
+    debuts = (origine + np.maximum(numeros - 1, 0)).astype('datetime64[ns]')
+    return np.where(numeros > 0, debuts, np.datetime64('NaT', 'ns'))
+
+
+class _IndexCles:
+    """Clés entières -> lignes, attribuées dans l'ordre d'arrivée
+
+    Les lignes existantes ne bougent jamais : un bloc n'ajoute que ses clés
+    inconnues, retrouvées par recherche dichotomique dans les clés triées.
+    """
+
+    def __init__(self, nb_max=None):
+        self.nb_max = nb_max
+        self.cles = np.empty(0, dtype=np.int64)  # clé de chaque ligne
+        self._triees = np.empty(0, dtype=np.int64)
+        self._lignes_triees = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.cles)
+
+    def lignes(self, cles):
+        """Ligne de chaque clé (distinctes et triées), les clés inconnues étant ajoutées"""
+        position = np.searchsorted(self._triees, cles)
+        connue = position < len(self._triees)
+        connue[connue] = self._triees[position[connue]] == cles[connue]
+        lignes = np.empty(len(cles), dtype=np.int64)
+        lignes[connue] = self._lignes_triees[position[connue]]
+
+        nouvelles = cles[~connue]
+        if len(nouvelles):
+            if self.nb_max is not None and len(self.cles) + len(nouvelles) > self.nb_max:
+                raise ValueError(f"Plus de {self.nb_max:,} cellules : choisir un grain plus grossier")
+            lignes[~connue] = np.arange(len(self.cles), len(self.cles) + len(nouvelles))
+            triees = np.concatenate([self._triees, nouvelles])
+            ordre = np.argsort(triees, kind='stable')
+            self._triees = triees[ordre]
+            self._lignes_triees = np.concatenate([self._lignes_triees, lignes[~connue]])[ordre]
+            self.cles = np.concatenate([self.cles, nouvelles])
+        return lignes
+
+    @property
+    def nbytes(self):
+        return self.cles.nbytes + self._triees.nbytes + self._lignes_triees.nbytes
+
+
+class SketchesDenses:
+    """Sketches HLL denses (une ligne de 2^p registres par clé), fusionnés registre par registre"""
+
+    def __init__(self, precision):
+        self.precision = precision
+        self.index = _IndexCles()
+        self.registres = np.zeros((0, 1 << precision), dtype=np.int8)
+
+    @property
+    def erreur(self):
+        return erreur_type(self.precision)
+
+    def ajouter(self, cles_lignes, empreintes_lignes):
+        """Intègre les empreintes de lignes, chacune dans le sketch de sa clé"""
+        cles, inverse = np.unique(cles_lignes, return_inverse=True)
+        lignes = self.index.lignes(cles)
+        if len(self.index) > len(self.registres):
+            ajout = np.zeros((len(self.index) - len(self.registres), self.registres.shape[1]), dtype=np.int8)
+            self.registres = np.concatenate([self.registres, ajout])
+        registre, rang = registres(empreintes_lignes, self.precision)
+        np.maximum.at(self.registres, (lignes[inverse], registre), rang)
+
+    def estimer(self, retenues):
+        """Nombre estimé de valeurs distinctes de l'union des sketches retenus (masque par ligne)"""
+        union = self.registres[retenues].max(axis=0, initial=0)
+        histogramme = np.bincount(union, minlength=64 - self.precision + 2)
+        return float(estimer_histogrammes(histogramme[np.newaxis], self.precision)[0])
+
+    @property
+    def nbytes(self):
+        return self.index.nbytes + self.registres.nbytes
+
+
+class AgregatsFlux:
+    """Agrégats KPI mis à jour bloc par bloc"""
+
+    def __init__(self, grain=GRAIN_DEFAUT, erreur_patients=ERREUR_DEFAUT, nb_cellules_max=NB_CELLULES_MAX):
+        """`grain` : unité numpy de la période du cube ; `erreur_patients` : erreur type des patients estimés"""
+        self.grain = grain
+        self.index = _IndexCles(nb_cellules_max)
+        self.valeurs = {colonne: np.empty(0) for colonne in AGREGATIONS_CUBE}
+        self.libelles = {cle: [] for cle in COLONNES_CLES}
+        self._codes_libelles = {cle: {} for cle in COLONNES_CLES}
+        # Patients : sketches par mois (code 0) et par mois × libellé, pour chaque dimension
+        precision = precision_pour_erreur(erreur_patients)
+        self.sketches = {'tous': SketchesDenses(precision),
+                         **{cle: SketchesDenses(precision) for cle in COLONNES_CLES}}
+        self.premier_jour = self.dernier_jour = None
+        self.nb_lignes = 0
+        self._cube = None
+
+    def _coder(self, bloc, cle):
+        """Codes globaux (1..n, 0 si manquant) d'une colonne libellé du bloc"""
+        colonne = COLONNES_CLES[cle]
+        if colonne not in bloc.columns:
+            return np.zeros(len(bloc), dtype=np.int64)
+        serie = bloc[colonne]
+        if not isinstance(serie.dtype, pd.CategoricalDtype):
+            serie = serie.astype('category')
+        codes_connus = self._codes_libelles[cle]
+        for libelle in serie.cat.categories:
+            if libelle not in codes_connus:
+                if len(codes_connus) >= (1 << BITS_LIBELLE) - 1:
+                    raise ValueError(f"Trop de valeurs distinctes pour '{colonne}'")
+                self.libelles[cle].append(libelle)
+                codes_connus[libelle] = len(codes_connus) + 1
+        correspondance = np.array([0] + [codes_connus[l] for l in serie.cat.categories], dtype=np.int64)
+        return correspondance[serie.cat.codes.to_numpy().astype(np.int64) + 1]
+
+    def ajouter(self, bloc):
+        """Intègre un bloc de lignes (le bloc peut ensuite être libéré)"""
+        def colonne(nom):
+            if nom not in bloc.columns:
+                return np.full(len(bloc), np.nan)
+            return bloc[nom].to_numpy(dtype=np.float64, na_value=np.nan)
+
+        satisfaction, duree, retard = colonne(COL_SATISFACTION), colonne(COL_DUREE), colonne(COL_RETARD)
+        if COL_RDV_MANQUE in bloc.columns:
+            rdv_manque = (bloc[COL_RDV_MANQUE] == 'Oui').to_numpy()
+        else:
+            rdv_manque = np.zeros(len(bloc), dtype=bool)
+        lignes = {
+            'nb_soins': np.ones(len(bloc)),
+            'ca': _sans_nan(colonne(COL_MONTANT)),
+            'paye': _sans_nan(colonne(COL_PAYE)),
+            'reste': _sans_nan(colonne(COL_RESTE)),
+            'satisfaction_somme': _sans_nan(satisfaction),
+            'satisfaction_nb': ~np.isnan(satisfaction),
+            'duree_somme': _sans_nan(duree),
+            'duree_nb': ~np.isnan(duree),
+            'rdv_manques': rdv_manque,
+            'retard_somme': np.where(retard > 0, retard, 0.0),
+            'retard_nb': retard > 0,
+            'retards_30j': retard > 30,
+        }
+
+        dates = pd.to_datetime(bloc[COL_DATE])
+        if dates.notna().any():
+            debut, fin = dates.min(), dates.max()
+            self.premier_jour = debut if self.premier_jour is None else min(self.premier_jour, debut)
+            self.dernier_jour = fin if self.dernier_jour is None else max(self.dernier_jour, fin)
+        codes = {cle: self._coder(bloc, cle) for cle in COLONNES_CLES}
+        cles = _periodes(dates, self.grain)
+        for cle in COLONNES_CLES:
+            cles = (cles << BITS_LIBELLE) | codes[cle]
+
+        # Le bloc est réduit seul, puis ses sommes vont aux lignes de ses cellules
+        cellules, inverse = np.unique(cles, return_inverse=True)
+        position = self.index.lignes(cellules)
+        if len(self.index) > len(self.valeurs['nb_soins']):
+            ajout = len(self.index) - len(self.valeurs['nb_soins'])
+            for nom in SOMMES_CUBE:
+                self.valeurs[nom] = np.concatenate([self.valeurs[nom], np.zeros(ajout)])
+            self.valeurs['duree_max'] = np.concatenate([self.valeurs['duree_max'], np.full(ajout, -np.inf)])
+        for nom in SOMMES_CUBE:
+            self.valeurs[nom][position] += np.bincount(inverse, weights=lignes[nom], minlength=len(cellules))
+        duree_max = np.full(len(cellules), -np.inf)
+        np.maximum.at(duree_max, inverse, np.where(np.isnan(duree), -np.inf, duree))
+        self.valeurs['duree_max'][position] = np.maximum(self.valeurs['duree_max'][position], duree_max)
+
+        if COL_PATIENT in bloc.columns:
+            patients = bloc[COL_PATIENT]
+            connu = patients.notna().to_numpy()
+            hachages = empreintes(patients.to_numpy()[connu])
+            mois = _periodes(dates, 'M')[connu] << BITS_LIBELLE
+            self.sketches['tous'].ajouter(mois, hachages)
+            for cle in COLONNES_CLES:
+                self.sketches[cle].ajouter(mois | codes[cle][connu], hachages)
+
+        self._cube = None
+        self.nb_lignes += len(bloc)
+        return self
+
+    @property
+    def cube(self):
+        """Cube décodé : une ligne par cellule (période, clinique, praticien, soin)"""
+        if self._cube is None:
+            masque = (1 << BITS_LIBELLE) - 1
+            cles = self.index.cles
+            colonnes = {}
+            for i, cle in enumerate(reversed(list(COLONNES_CLES))):
+                codes = (cles >> (BITS_LIBELLE * i)) & masque
+                colonnes[cle] = pd.Categorical.from_codes(codes - 1, categories=self.libelles[cle])
+            colonnes['periode'] = pd.to_datetime(
+                _debut_periode(cles >> (BITS_LIBELLE * len(COLONNES_CLES)), self.grain))
+            cube = pd.DataFrame({cle: colonnes[cle] for cle in CLES_CUBE})
+            for nom in SOMMES_CUBE:
+                cube[nom] = self.valeurs[nom]
+            cube['duree_max'] = np.where(np.isinf(self.valeurs['duree_max']), np.nan, self.valeurs['duree_max'])
+            self._cube = cube
+        return self._cube
+
+    def modalites(self, cle):
+        """Libellés rencontrés pour une clé du cube (options des filtres)"""
+        return list(self.libelles[cle])
+
+    def periode(self):
+        """Premier et dernier jour de soin"""
+        return self.premier_jour, self.dernier_jour
+
+    def _bornes(self, debut, fin, grain):
+        """Périodes (numéros) de début et de fin d'un filtre de dates ; None si non borné"""
+        debut = None if debut is None else int(_periodes([pd.Timestamp(debut)], grain)[0])
+        fin = None if fin is None else int(_periodes([pd.Timestamp(fin)], grain)[0])
+        return debut, fin
+
+    def filtrer(self, debut=None, fin=None, cliniques=(), praticiens=(), soins=()):
+        """Cellules du cube dont la période recoupe [debut, fin], dans les sélections données
+
+        Au grain du mois, un filtre de dates retient les mois entiers qu'il touche.
+        """
+        cube = self.cube
+        masque = np.ones(len(cube), dtype=bool)
+        periodes = self.index.cles >> (BITS_LIBELLE * len(COLONNES_CLES))
+        premiere, derniere = self._bornes(debut, fin, self.grain)
+        if premiere is not None:
+            masque &= periodes >= premiere
+        if derniere is not None:
+            masque &= (periodes <= derniere) & (periodes > 0)
+        for cle, selection in [('clinique', cliniques), ('praticien', praticiens), ('soin', soins)]:
+            if selection:
+                masque &= cube[cle].isin(list(selection)).to_numpy()
+        return cube if masque.all() else cube[masque]
+
+    def nb_patients(self, debut=None, fin=None, cliniques=(), praticiens=(), soins=()):
+        """Patients distincts (estimés) des mois touchés par [debut, fin] et des sélections données
+
+        Une seule dimension filtrée : union des sketches (mois × libellé)
+        retenus. Plusieurs : chacune donne un majorant, le plus petit est
+        renvoyé.
+        """
+        premier, dernier = self._bornes(debut, fin, 'M')
+        estimations = []
+        for cle, selection in [('tous', ()), ('clinique', cliniques), ('praticien', praticiens), ('soin', soins)]:
+            if cle != 'tous' and not selection:
+                continue
+            sketches = self.sketches[cle]
+            cles = sketches.index.cles
+            mois = cles >> BITS_LIBELLE
+            retenues = np.ones(len(cles), dtype=bool)
+            if premier is not None:
+                retenues &= mois >= premier
+            if dernier is not None:
+                retenues &= (mois <= dernier) & (mois > 0)
+            if selection:
+                codes = [self._codes_libelles[cle][l] for l in selection if l in self._codes_libelles[cle]]
+                retenues &= np.isin(cles & ((1 << BITS_LIBELLE) - 1), codes)
+            estimations.append(sketches.estimer(retenues))
+        return int(np.rint(min(estimations)))
+
+    @property
+    def erreur_patients(self):
+        return self.sketches['tous'].erreur
+
+    def metriques(self, cube=None):
+        """Indicateurs de la vue d'ensemble d'app.py, calculés sur le cube"""
+        cube = self.cube if cube is None else cube
+        total = cube[list(AGREGATIONS_CUBE)].agg(AGREGATIONS_CUBE)
+        nb_soins = total['nb_soins']
+
+        def ratio(numerateur, denominateur):
+            return float(numerateur / denominateur) if denominateur else float('nan')
+
+        return {
+            'total_treatments': int(nb_soins),
+            'total_revenue': float(total['ca']),
+            'total_paid': float(total['paye']),
+            'remaining': float(total['reste']),
+            'avg_satisfaction': ratio(total['satisfaction_somme'], total['satisfaction_nb']),
+            'avg_duration': ratio(total['duree_somme'], total['duree_nb']),
+            'max_duration': float(total['duree_max']),
+            'missed_rate': ratio(100 * total['rdv_manques'], nb_soins),
+            'late_payments': int(total['retard_nb']),
+            'late_payments_30d': int(total['retards_30j']),
+            'avg_late_days': ratio(total['retard_somme'], total['retard_nb']),
+        }
+
+    def par(self, cle, colonne, cube=None):
+        """Somme d'une colonne du cube par clinique, praticien, soin ou mois"""
+        cube = self.cube if cube is None else cube
+        groupe = cube['periode'].dt.to_period('M') if cle == 'mois' else cube[cle]
+        return cube.groupby(groupe, observed=True)[colonne].sum()
+
+    def __sizeof__(self):
+        # Mesure utilisée par le cache mémoire d'app.py (sys.getsizeof)
+        return object.__sizeof__(self) + self.memoire()
+
+    def memoire(self):
+        """Mémoire occupée par les agrégats, sketches et cube décodé compris (octets)"""
+        sketches = sum(s.nbytes for s in self.sketches.values())
+        cube = 0 if self._cube is None else int(self._cube.memory_usage(deep=True).sum())
+        return self.index.nbytes + sum(v.nbytes for v in self.valeurs.values()) + sketches + cube
+
+
+def lire_csv_par_blocs(source, taille_bloc=TAILLE_BLOC, agregats=None):
+    """Agrégats d'un export CSV lu par blocs (chemin ou fichier ouvert)"""
+    agregats = AgregatsFlux() if agregats is None else agregats
+    lecteur = pd.read_csv(
+        source,
+        usecols=lambda colonne: colonne in COLONNES_UTILES,
+        dtype=TYPES_COLONNES,
+        chunksize=taille_bloc,
+    )
+    with lecteur:
+        for bloc in lecteur:
+            agregats.ajouter(bloc)
+    # Cube décodé dès maintenant : il est compté par memoire() quand les agrégats sont mis en cache
+    agregats.cube
+    return agregats
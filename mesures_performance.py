@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Instrumentation optionnelle des étapes coûteuses (chargement, nettoyage, KPIs, pages)
+Auteur: Assistant IA
+Date: 2024
+
+Désactivée par défaut : une fonction instrumentée ne coûte alors qu'un test
+de booléen. La variable d'environnement MESURES_PERFORMANCE l'active :
+
+- MESURES_PERFORMANCE=1 : durée, lignes traitées et RSS maximal du processus
+  (module resource, POSIX ; psutil s'il est installé sinon, ou pas de RSS) ;
+- MESURES_PERFORMANCE=memoire : en plus, pic mémoire propre à chaque étape
+  (tracemalloc, qui ralentit sensiblement les étapes riches en objets Python).
+
+Chaque mesure est émise en JSON sur le logger « mesures_performance ». Si
+MESURES_PERFORMANCE_FICHIER est défini, les cumuls par étape y sont réécrits
+au format texte Prometheus (collecteur textfile de node_exporter).
+"""
+
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+NB_MESURES_MAX = 1000
+PREFIXE_METRIQUES = "cabinet_dentaire_etape"
+
+journal = logging.getLogger("mesures_performance")
+
+
+def _rss_max_octets():
+    """RSS maximal atteint par le processus depuis son démarrage (None si non mesurable)"""
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux : kio ; macOS : octets
+        return rss if sys.platform == "darwin" else rss * 1024
+    if psutil is not None:
+        memoire = psutil.Process().memory_info()
+        # Windows : pic du working set ; ailleurs, RSS courant à défaut de maximum
+        return getattr(memoire, 'peak_wset', memoire.rss)
+    return None
+
+
+def _lignes_par_defaut(resultat, args):
+    """Lignes traitées : taille du résultat tabulaire, sinon du DataFrame de l'objet appelé"""
+    if isinstance(resultat, (pd.DataFrame, pd.Series)):
+        return len(resultat)
+    if args and isinstance(getattr(args[0], 'df', None), pd.DataFrame):
+        return len(args[0].df)
+    return None
+
+
+class _Jeton:
+    """Étape en cours de mesure"""
+
+    def __init__(self, etape, lignes, debut_memoire):
+        self.etape = etape
+        self.lignes = lignes
+        self.debut = time.perf_counter()
+        self.debut_memoire = debut_memoire
+        self.pic_memoire = debut_memoire
+
+
+class Mesures:
+    """Registre des mesures : dernières mesures brutes et cumuls par étape"""
+
+    def __init__(self):
+        self.actif = False
+        self.memoire = False
+        self.fichier_prometheus = None
+        self.dernieres = deque(maxlen=NB_MESURES_MAX)
+        self.cumuls = {}
+        self._verrou = threading.Lock()
+        self._pile = threading.local()
+
+    def activer(self, memoire=False, fichier_prometheus=None):
+        self.actif = True
+        self.memoire = memoire
+        self.fichier_prometheus = fichier_prometheus
+        if memoire and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if not journal.handlers:
+            gestionnaire = logging.StreamHandler()
+            gestionnaire.setFormatter(logging.Formatter("%(message)s"))
+            journal.addHandler(gestionnaire)
+            journal.setLevel(logging.INFO)
+
+    def desactiver(self):
+        self.actif = False
+        if self.memoire and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.memoire = False
+
+    def vider(self):
+        with self._verrou:
+            self.dernieres.clear()
+            self.cumuls.clear()
+
+    @property
+    def _etapes_en_cours(self):
+        if not hasattr(self._pile, 'jetons'):
+            self._pile.jetons = []
+        return self._pile.jetons
+
+    def commencer(self, etape, lignes=None):
+        """Début d'une étape ; renvoie le jeton à passer à terminer() (None si inactif)"""
+        if not self.actif:
+            return None
+        debut_memoire = 0
+        if self.memoire:
+            courante, pic = tracemalloc.get_traced_memory()
+            # Le pic de l'étape englobante est relevé avant d'être réinitialisé
+            if self._etapes_en_cours:
+                parent = self._etapes_en_cours[-1]
+                parent.pic_memoire = max(parent.pic_memoire, pic)
+            tracemalloc.reset_peak()
+            debut_memoire = courante
+        jeton = _Jeton(etape, lignes, debut_memoire)
+        self._etapes_en_cours.append(jeton)
+        return jeton
+
+    def terminer(self, jeton, lignes=None):
+        """Fin d'une étape : enregistre et publie sa mesure"""
+        if jeton is None:
+            return None
+        duree = time.perf_counter() - jeton.debut
+        pile = self._etapes_en_cours
+        if jeton in pile:
+            # Les étapes internes non terminées (exception) sont abandonnées
+            del pile[pile.index(jeton):]
+        mesure = {
+            'etape': jeton.etape,
+            'secondes': round(duree, 6),
+            'lignes': jeton.lignes if lignes is None else lignes,
+            'rss_max_octets': _rss_max_octets(),
+            'horodatage': time.time(),
+        }
+        if self.memoire and tracemalloc.is_tracing():
+            jeton.pic_memoire = max(jeton.pic_memoire, tracemalloc.get_traced_memory()[1])
+            mesure['pic_memoire_octets'] = jeton.pic_memoire - jeton.debut_memoire
+            if pile:
+                pile[-1].pic_memoire = max(pile[-1].pic_memoire, jeton.pic_memoire)
+        self._enregistrer(mesure)
+        return mesure
+
+    def _enregistrer(self, mesure):
+        with self._verrou:
+            self.dernieres.append(mesure)
+            cumul = self.cumuls.setdefault(mesure['etape'], {
+                'appels': 0, 'secondes': 0.0, 'lignes': 0, 'derniere_duree': 0.0, 'pic_memoire_octets': 0})
+            cumul['appels'] += 1
+            cumul['secondes'] += mesure['secondes']
+            cumul['lignes'] += mesure['lignes'] or 0
+            cumul['derniere_duree'] = mesure['secondes']
+            cumul['pic_memoire_octets'] = max(cumul['pic_memoire_octets'], mesure.get('pic_memoire_octets', 0))
+        journal.info(json.dumps(mesure, ensure_ascii=False))
+        if self.fichier_prometheus:
+            try:
+                self.exporter_prometheus(self.fichier_prometheus)
+            except OSError as e:
+                journal.warning(f"⚠️ Impossible d'écrire {self.fichier_prometheus}: {e}")
+
+    def mesurer(self, etape, lignes=None):
+        """Gestionnaire de contexte : with MESURES.mesurer('etape'): ..."""
+        return _Contexte(self, etape, lignes)
+
+    def texte_prometheus(self):
+        """Cumuls par étape au format d'exposition texte de Prometheus"""
+        with self._verrou:
+            cumuls = {etape: dict(cumul) for etape, cumul in self.cumuls.items()}
+        metriques = [
+            ('secondes_total', 'counter', 'Durée cumulée des appels de l\'étape', 'secondes'),
+            ('appels_total', 'counter', 'Nombre d\'appels de l\'étape', 'appels'),
+            ('lignes_total', 'counter', 'Lignes traitées par l\'étape', 'lignes'),
+            ('derniere_duree_secondes', 'gauge', 'Durée du dernier appel de l\'étape', 'derniere_duree'),
+        ]
+        if self.memoire:
+            metriques.append(('pic_memoire_octets', 'gauge', 'Pic mémoire maximal de l\'étape',
+                              'pic_memoire_octets'))
+        lignes = []
+        for suffixe, type_metrique, aide, cle in metriques:
+            nom = f"{PREFIXE_METRIQUES}_{suffixe}"
+            lignes += [f"# HELP {nom} {aide}", f"# TYPE {nom} {type_metrique}"]
+            for etape, cumul in sorted(cumuls.items()):
+                etiquette = etape.replace('\\', '\\\\').replace('"', '\\"')
+                lignes.append(f'{nom}{{etape="{etiquette}"}} {round(cumul[cle], 6)}')
+        rss = _rss_max_octets()
+        if rss is not None:
+            nom = "cabinet_dentaire_rss_max_octets"
+            lignes += [f"# HELP {nom} RSS maximal du processus", f"# TYPE {nom} gauge", f"{nom} {rss}"]
+        return "\n".join(lignes) + "\n"
+
+    def exporter_prometheus(self, chemin):
+        """Réécrit le fichier de métriques (atomique : jamais lu à moitié écrit)"""
+        tmp = f"{chemin}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.texte_prometheus())
+        os.replace(tmp, chemin)
+
+    def tableau(self):
+        """Cumuls par étape, du plus coûteux au moins coûteux"""
+        with self._verrou:
+            cumuls = {etape: dict(cumul) for etape, cumul in self.cumuls.items()}
+        if not cumuls:
+            return pd.DataFrame(columns=['appels', 'secondes', 'moyenne', 'derniere_duree', 'lignes'])
+        tableau = pd.DataFrame.from_dict(cumuls, orient='index')
+        tableau['moyenne'] = tableau['secondes'] / tableau['appels']
+        colonnes = ['appels', 'secondes', 'moyenne', 'derniere_duree', 'lignes']
+        if self.memoire:
+            tableau['pic_memoire_mo'] = tableau['pic_memoire_octets'] / 1e6
+            colonnes.append('pic_memoire_mo')
+        return tableau[colonnes].sort_values('secondes', ascending=False)
+
+
+class _Contexte:
+    def __init__(self, mesures, etape, lignes):
+        self.mesures = mesures
+        self.etape = etape
+        self.lignes = lignes
+
+    def __enter__(self):
+        self.jeton = self.mesures.commencer(self.etape, self.lignes)
+        return self
+
+    def __exit__(self, *exc):
+        self.mesures.terminer(self.jeton)
+        return False
+
+
+MESURES = Mesures()
+
+
+def instrumenter(etape=None, lignes=_lignes_par_defaut):
+    """Décorateur : mesure chaque appel de la fonction (sans effet si l'instrumentation est inactive)
+
+    `lignes(resultat, args)` donne le nombre de lignes traitées.
+    """
+    def decorer(fonction):
+        nom = etape or fonction.__qualname__
+
+        @functools.wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            if not MESURES.actif:
+                return fonction(*args, **kwargs)
+            jeton = MESURES.commencer(nom)
+            resultat = None
+            try:
+                resultat = fonction(*args, **kwargs)
+                return resultat
+            finally:
+                MESURES.terminer(jeton, lignes(resultat, args) if lignes else None)
+
+        return enveloppe
+
+    return decorer
+
+
+def instrumenter_classe(prefixes=('kpi_', 'analyse_', 'nettoyer_'), lignes=_lignes_par_defaut):
+    """Décorateur de classe : instrumente les méthodes dont le nom commence par un des préfixes"""
+    def decorer(cls):
+        for nom, methode in list(vars(cls).items()):
+            if callable(methode) and nom.startswith(tuple(prefixes)):
+                setattr(cls, nom, instrumenter(f"{cls.__name__}.{nom}", lignes)(methode))
+        return cls
+
+    return decorer
+
+
+# Activation par l'environnement, dès l'import
+_mode = os.environ.get('MESURES_PERFORMANCE', '').strip().lower()
+if _mode not in ('', '0', 'non', 'false'):
+    MESURES.activer(memoire=_mode == 'memoire',
+                    fichier_prometheus=os.environ.get('MESURES_PERFORMANCE_FICHIER') or None)
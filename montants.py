@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Montants en CHF stockés en centimes entiers
+Auteur: Assistant IA
+Date: 2024
+
+Dans la table nettoyée, les montants (total, payé, reste à charge) sont des
+centimes en int32 : exacts au centime jusqu'à ±21 millions de CHF par soin,
+et deux fois plus compacts que le float64. Les colonnes s'appellent alors
+*_centimes au lieu de *_chf, pour qu'un montant en centimes ne soit jamais
+pris pour des francs.
+
+Les calculs lisent les montants par montant_chf() : la colonne en CHF si
+elle existe (données brutes, autres tables), sinon les centimes reconvertis
+en CHF au moment du calcul. montants_chf() fait de même pour toute une table
+(exports, entrepôt), qui garde ainsi ses colonnes en CHF.
+"""
+
+import numpy as np
+import pandas as pd
+
+CENTIMES_PAR_CHF = 100
+
+# Colonne en CHF -> colonne en centimes de la table nettoyée
+COLONNES_CENTIMES = {
+    'montant_total_chf': 'montant_total_centimes',
+    'montant_payé_chf': 'montant_payé_centimes',
+    'reste_à_charge_chf': 'reste_à_charge_centimes',
+}
+COLONNES_CHF = {centimes: chf for chf, centimes in COLONNES_CENTIMES.items()}
+
+
+def en_centimes(serie):
+    """Montants en CHF -> centimes arrondis (flottants, NaN conservés)"""
+    return np.round(pd.to_numeric(serie, errors='coerce') * CENTIMES_PAR_CHF)
+
+
+def a_colonne(df, colonne):
+    """La colonne est-elle disponible, en CHF ou en centimes ?"""
+    return colonne in df.columns or COLONNES_CENTIMES.get(colonne) in df.columns
+
+
+def montant_chf(df, colonne='montant_total_chf'):
+    """Colonne `colonne` de df ; un montant stocké en centimes est reconverti en CHF (float64)"""
+    if colonne in df.columns or colonne not in COLONNES_CENTIMES:
+        return df[colonne]
+    return (df[COLONNES_CENTIMES[colonne]].astype(np.float64) / CENTIMES_PAR_CHF).rename(colonne)
+
+
+def colonnes_chf(df, colonnes):
+    """Sous-table des colonnes demandées, montants en CHF (ex. avant un groupby().agg())"""
+    return pd.DataFrame({colonne: montant_chf(df, colonne) for colonne in colonnes}, index=df.index)
+
+
+def montants_chf(df):
+    """Table dont les colonnes en centimes sont remplacées, à la même place, par des CHF"""
+    centimes = {c: chf for c, chf in COLONNES_CHF.items() if c in df.columns}
+    if not centimes:
+        return df
+    return df.assign(**{c: montant_chf(df, chf) for c, chf in centimes.items()}).rename(columns=centimes)
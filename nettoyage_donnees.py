@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Pipeline de nettoyage unique des données du cabinet dentaire
+Auteur: Assistant IA
+Date: 2024
+
+Le typage est piloté par un schéma explicite (SCHEMA_COLONNES) au lieu de
+deviner les dates d'après le nom des colonnes. Le résultat est mis en cache
+sur disque à côté du cache brut, puis en mémoire, pour que le rapport, les
+visualisations et le dashboard partagent le même DataFrame nettoyé.
+
+Le schéma vise une représentation compacte : libellés répétés en category,
+identifiants patients en chaînes Arrow, entiers réduits, indicateurs en bool,
+montants en centimes int32 (colonnes *_centimes, relues en CHF par
+montants.montant_chf()). rapport_memoire() détaille le gain colonne par
+colonne.
+
+Objectif non atteint : la RSS n'est divisée que par 3,8 à 3,9 (visé : 4) sur
+scripts/rapport_memoire.py. Le reste tient surtout aux identifiants patients
+(chaînes Arrow, ~1/6 de la table compacte), à la date du soin, qui reste en
+datetime64[ns], et aux ratios float32, qu'on ne réduit pas davantage sans
+perdre de précision.
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+from pandas.api.types import pandas_dtype
+
+from chargement_donnees import (
+    FICHIER_DONNEES,
+    cache_valide,
+    charger_donnees,
+    ecrire_cache,
+    lire_cache,
+)
+from mesures_performance import instrumenter
+from montants import COLONNES_CENTIMES, COLONNES_CHF, en_centimes
+
+# Types cibles des colonnes connues ; les colonnes absentes du schéma sont laissées telles quelles
+SCHEMA_COLONNES = {
+    # Dates
+    'date_du_soin': 'datetime64[ns]',
+    # Patients : l'identifiant reste une chaîne (pas de catégories non observées
+    # dans les groupby('patientid')), mais stockée dans un seul buffer Arrow
+    'patientid': 'string[pyarrow]',
+    'nom': 'category',
+    'prénom': 'category',
+    'sexe': 'category',
+    'âge': 'int8',
+    'assurance': 'category',
+    'adresse_complete': 'category',
+    'type_de_patient': 'category',
+    'nb_visites_patient': 'int16',
+    'patient_fidèle': 'bool',
+    'satisfaction_1-5': 'float32',
+    # Cliniques
+    'cabinet': 'category',
+    'nom_de_la_clinique': 'category',
+    'canton_clinique': 'category',
+    # Praticiens
+    'dentiste': 'category',
+    'nom_complet_praticien': 'category',
+    'type_de_praticien': 'category',
+    # Soins
+    'type_de_soin': 'category',
+    'type_de_soin_normalisé': 'category',
+    'catégorie_soin': 'category',
+    'formule': 'category',
+    'heure_début': 'category',
+    'durée_minutes': 'int16',
+    # Paiements
+    'méthode_de_paiement': 'category',
+    'retard_paiement_jours': 'float32',
+    # Montants : centimes entiers, exacts au centime (colonnes *_chf renommées, voir montants.py)
+    'montant_total_centimes': 'int32',
+    'montant_payé_centimes': 'int32',
+    'reste_à_charge_centimes': 'int32',
+    # Ratios jamais cumulés : la précision du float32 suffit
+    'revenu_horaire_chf/h': 'float32',
+    'taux_de_remboursement_%': 'float32',
+    # Indicateurs
+    'rdv_manqué': 'bool',
+    'retard': 'bool',
+}
+
+# Le suffixe du cache dépend du schéma : toute modification du schéma invalide le cache
+VERSION_SCHEMA = hashlib.sha1(
+    json.dumps(SCHEMA_COLONNES, sort_keys=True).encode("utf-8")
+).hexdigest()[:8]
+SUFFIXE_CACHE = f"propre-{VERSION_SCHEMA}"
+
+_cache_memoire = {}
+
+
+def _deja_converti(serie, type_cible):
+    # str() ne distingue pas les chaînes Arrow des chaînes Python ('string')
+    return str(serie.dtype) == type_cible or serie.dtype == pandas_dtype(type_cible)
+
+
+def _convertir_colonne(serie, type_cible):
+    """Convertit une colonne vers son type cible, sans travail si elle l'a déjà"""
+    if _deja_converti(serie, type_cible):
+        return serie
+
+    if type_cible.startswith('datetime64'):
+        return pd.to_datetime(serie, errors='coerce').astype(type_cible)
+    if type_cible == 'category':
+        return serie.astype('category')
+    if type_cible.startswith('string'):
+        return serie.astype(type_cible).where(serie.notna())
+    if type_cible == 'bool':
+        # Les valeurs manquantes sont considérées comme « non »
+        if serie.dtype == object:
+            serie = serie.map({True: True, False: False, 'True': True, 'False': False,
+                               'Oui': True, 'Non': False})
+        return serie.eq(True).fillna(False).astype(bool)
+    if not pd.api.types.is_numeric_dtype(serie):
+        serie = pd.to_numeric(serie, errors='coerce')
+    if type_cible.startswith('int') and serie.isna().any():
+        # Un entier manquant ne tient pas dans un int numpy : flottant compact à la place
+        return serie.astype('float32')
+    return serie.astype(type_cible)
+
+
+@instrumenter('nettoyage')
+def nettoyer_donnees(df, schema=None):
+    """Applique le schéma de types au DataFrame et le renvoie"""
+    schema = SCHEMA_COLONNES if schema is None else schema
+    # Seules les colonnes à convertir sont réassignées : assign() recopie le DataFrame
+    conversions = {
+        col: _convertir_colonne(df[col], type_cible)
+        for col, type_cible in schema.items()
+        if col in df.columns and not _deja_converti(df[col], type_cible)
+    }
+    # Montants en CHF -> centimes, à la place de la colonne d'origine puis renommés
+    renommages = {chf: centimes for chf, centimes in COLONNES_CENTIMES.items()
+                  if chf in df.columns and centimes in schema}
+    for chf, centimes in renommages.items():
+        conversions[chf] = _convertir_colonne(en_centimes(df[chf]), schema[centimes])
+    if not conversions:
+        return df
+    return df.assign(**conversions).rename(columns=renommages)
+
+
+@instrumenter('chargement_nettoye')
+def charger_donnees_nettoyees(chemin=FICHIER_DONNEES, utiliser_cache=True):
+    """Charge les données déjà nettoyées, en réutilisant les caches disque et mémoire
+
+    Une copie superficielle est renvoyée : l'appelant peut ajouter ou remplacer
+    des colonnes sans affecter les autres consommateurs du même cache.
+    """
+    if not utiliser_cache:
+        return nettoyer_donnees(charger_donnees(chemin, utiliser_cache=False))
+
+    stat = os.stat(chemin)
+    cle = (os.path.abspath(chemin), stat.st_mtime_ns, stat.st_size)
+    if cle in _cache_memoire:
+        return _cache_memoire[cle].copy(deep=False)
+
+    df = None
+    if cache_valide(chemin, SUFFIXE_CACHE):
+        try:
+            df = lire_cache(chemin, SUFFIXE_CACHE, chaines_arrow=True)
+        except Exception as e:
+            print(f"⚠️ Cache nettoyé illisible, reconstruction: {e}")
+
+    if df is None:
+        df = nettoyer_donnees(charger_donnees(chemin))
+        try:
+            ecrire_cache(df, chemin, SUFFIXE_CACHE)
+        except Exception as e:
+            print(f"⚠️ Impossible d'écrire le cache nettoyé: {e}")
+
+    _cache_memoire.clear()
+    _cache_memoire[cle] = df
+    return df.copy(deep=False)
+
+
+def rapport_memoire(df, reference=None):
+    """Mémoire occupée par colonne (Mo), comparée si besoin à un DataFrame de référence
+
+    Renvoie un DataFrame trié par mémoire décroissante, avec une ligne TOTAL.
+    """
+    memoire = df.memory_usage(deep=True, index=False)
+    rapport = pd.DataFrame({'type': df.dtypes.astype(str), 'Mo': memoire / 1e6})
+    if reference is not None:
+        # Les montants en centimes sont comparés à leur colonne d'origine en CHF
+        origine = pd.Index([COLONNES_CHF.get(col, col) for col in rapport.index])
+        rapport['type_origine'] = reference.dtypes.astype(str).reindex(origine).to_numpy()
+        rapport['Mo_origine'] = (reference.memory_usage(deep=True, index=False).reindex(origine) / 1e6).to_numpy()
+    rapport = rapport.sort_values('Mo', ascending=False)
+
+    total = rapport.select_dtypes('number').sum()
+    rapport.loc['TOTAL'] = total
+    if reference is not None:
+        rapport['facteur'] = rapport['Mo_origine'] / rapport['Mo']
+    return rapport
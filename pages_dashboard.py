@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Données des pages du dashboard Streamlit, préparées à l'avance
+Auteur: Assistant IA
+Date: 2024
+
+Chaque page du dashboard a une fonction de préparation pure : à partir des
+lignes d'un cabinet et des cumuls du cube de KPIs, elle renvoie les tables
+affichées par la page (aucun appel Streamlit). Les regroupements ligne à
+ligne de toutes les pages sont déclarés ensemble (declarer_requetes), et
+les pages qui raisonnent par patient lisent la même table patients
+(table_patients), partagée par cabinet ; la balance âgée part des
+créances ouvertes de l'instantané persisté (creances.charger_balance), sans
+reparcourir les soins. Prechauffage lance ces
+préparations pour toutes les pages et tous les cabinets dans un pool de
+threads dès que les données sont chargées : changer de page ne fait plus
+que lire un résultat déjà calculé. Ces résultats sont gardés dans un
+CacheLRU (cache_memoire) borné par BUDGET_PRECHAUFFAGE_MO : avec beaucoup
+de cabinets, les moins consultés sont évincés puis préparés de nouveau à
+la demande. Les distributions sont gardées sous forme
+de classes (donnees_graphiques.classer), pas de valeurs brutes.
+
+Des threads plutôt que des processus : les préparations lisent le même
+DataFrame en mémoire (sans copie ni sérialisation), et numpy/pandas
+libèrent le GIL pendant l'essentiel des tris et regroupements.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_memoire import BUDGET_DEFAUT_MO, CacheLRU
+from cohortes import cohortes
+from creances import balances_agees, creances_ouvertes
+from donnees_graphiques import classer
+from intervalles_soins import intervalles_entre_soins
+from kpi_vectorises import taux_fidelisation
+from mesures_performance import MESURES
+from montants import a_colonne
+from requetes_kpi import RequetesKPI
+from table_patients import agreger_patients
+
+PAGE_DASHBOARD = "🏠 Dashboard Général"
+PAGE_SOINS = "🦷 Performance des Soins"
+PAGE_PRATICIENS = "👨‍⚕️ Analyse des Praticiens"
+PAGE_PATIENTS = "🧑‍🤝‍🧑 Analyse des Patients"
+PAGE_PAIEMENTS = "💰 Paiements et Créances"
+PAGE_GEOGRAPHIE = "🏥 Analyse Géographique"
+PAGE_TEMPOREL = "📅 Analyse Temporelle"
+
+NOMS_MOIS = ['Jan', 'Fév', 'Mar', 'Avr', 'Mai', 'Jun', 'Jul', 'Aoû', 'Sep', 'Oct', 'Nov', 'Déc']
+
+# Nombre de threads du préchauffage (0 : chaque page est calculée à sa première visite)
+NB_THREADS_PRECHAUFFAGE = int(os.environ.get('PRECHAUFFAGE_THREADS', min(4, os.cpu_count() or 1)))
+# Budget mémoire des préparations gardées (Mo), partagé par toutes les pages et tous les cabinets
+BUDGET_PRECHAUFFAGE_MO = int(os.environ.get('PRECHAUFFAGE_BUDGET_MO', BUDGET_DEFAUT_MO))
+
+
+def distribution(nom, valeurs):
+    """Statistiques d'une distribution et ses classes d'histogramme, sans les valeurs brutes"""
+    return {
+        f'stats_{nom}': valeurs.agg(['count', 'mean', 'median', 'std']),
+        f'classes_{nom}': classer(valeurs),
+    }
+
+
+def declarer_requetes(df):
+    """Regroupements ligne à ligne de toutes les pages, pour les lignes d'un cabinet"""
+    requetes = RequetesKPI(df)
+    requetes.declarer('patients_par_mois', 'Année-Mois', 'patientid', 'nunique')
+    return requetes
+
+
+def preparer_dashboard(df, cumul, requetes, patients, creances):
+    return {
+        'totaux': cumul(),
+        'ca_mensuel': cumul('Année-Mois')['ca_total'].rename('montant_total_chf'),
+        'top_soins': cumul('type_de_soin_normalisé')['ca_total'].sort_values(ascending=False).head(10),
+    }
+
+
+def preparer_soins(df, cumul, requetes, patients, creances):
+    par_soin = cumul('type_de_soin_normalisé')
+    rentabilite_soins = par_soin[['ca_total', 'nb_actes']].round({'ca_total': 2}).rename(columns={
+        'ca_total': 'montant_total_chf',
+        'nb_actes': 'Nombre_actes'
+    })
+    rentabilite_soins['Rentabilite_moyenne'] = rentabilite_soins['montant_total_chf'] / rentabilite_soins['Nombre_actes']
+    return {
+        'top_10_ca_soins': par_soin['ca_total'].round(2).rename('montant_total_chf').sort_values(ascending=False).head(10),
+        'rentabilite_soins': rentabilite_soins.sort_values('Rentabilite_moyenne', ascending=False),
+        **distribution('soins_par_patient', patients()['frequence']),
+    }
+
+
+def preparer_praticiens(df, cumul, requetes, patients, creances):
+    if 'nom_complet_praticien' not in df.columns:
+        return {}
+    ca_par_praticien = cumul('nom_complet_praticien')[['ca_total', 'ca_moyen', 'nb_montants']].round(2)
+    ca_par_praticien.columns = ['CA_total', 'CA_moyen', 'Nombre_actes']
+    return {
+        'ca_par_praticien': ca_par_praticien.sort_values('CA_total', ascending=False),
+        'fidelisation': taux_fidelisation(df, 'nom_complet_praticien').round(2),
+    }
+
+
+def preparer_patients(df, cumul, requetes, patients, creances):
+    acquisition = cohortes(df)
+    return {
+        'patients': patients(),
+        **distribution('intervalles', intervalles_entre_soins(df)),
+        # Patients vus pour la première fois chaque mois (taille des cohortes), et patients distincts vus
+        'nouveaux_patients_mensuel': acquisition.nouveaux,
+        'patients_actifs_mensuel': requetes['patients_par_mois'],
+        'cohortes': acquisition,
+    }
+
+
+def preparer_paiements(df, cumul, requetes, patients, creances):
+    retards_par_soin = cumul('type_de_soin_normalisé')[['taux_retard', 'nb_retards', 'nb_actes']].round(4)
+    retards_par_soin.columns = ['Taux_retard', 'Nombre_retards', 'Nombre_total']
+    retards_par_soin['Taux_retard_pct'] = retards_par_soin['Taux_retard'] * 100
+    return {
+        'totaux': cumul(),
+        'retards_par_soin': retards_par_soin,
+        'classes_retard_paiement': classer(df['retard_paiement_jours']),
+        **preparer_creances(df, creances()),
+    }
+
+
+def preparer_creances(df, creances=None):
+    """Balance âgée des créances ouvertes, au dernier soin des lignes du cabinet
+
+    `creances` : créances ouvertes de ces lignes, si elles sont déjà connues
+    (instantané de la balance âgée) ; sinon elles sont tirées des soins.
+    """
+    if not a_colonne(df, 'montant_payé_chf') or len(df) == 0:
+        return {}
+    date_reference = df['date_du_soin'].max().normalize()
+    if creances is None:
+        creances = creances_ouvertes(df)
+    return {
+        'date_balance': date_reference,
+        'balance_agee': balances_agees(creances, date_reference),
+    }
+
+
+def preparer_geographie(df, cumul, requetes, patients, creances):
+    if 'nom_de_la_clinique' not in df.columns:
+        return {}
+    par_clinique = cumul('nom_de_la_clinique')
+    ca_par_clinique = par_clinique[['ca_total', 'ca_moyen', 'nb_montants']].round(2)
+    ca_par_clinique.columns = ['CA_total', 'CA_moyen', 'Nombre_actes']
+    return {
+        'ca_par_clinique': ca_par_clinique.sort_values('CA_total', ascending=False),
+        'patients_par_clinique': par_clinique['nb_patients'].sort_values(ascending=False),
+        'vip_par_clinique': (par_clinique['taux_vip'] * 100).round(2).sort_values(ascending=False),
+    }
+
+
+def preparer_temporel(df, cumul, requetes, patients, creances):
+    par_mois = cumul('Année-Mois')
+    ca_mensuel = par_mois['ca_total']
+
+    # Les trimestres, années et mois calendaires sont des cumuls des mois du cube
+    par_mois = par_mois[par_mois.index.str.fullmatch(r'\d{4}-\d{2}')]
+    annees = par_mois.index.str[:4].astype(int)
+    mois_annee = par_mois.index.str[5:7].astype(int)
+    trimestres = annees.astype(str) + '-T' + ((mois_annee - 1) // 3 + 1).astype(str)
+
+    soins_par_mois = par_mois['nb_actes'].groupby(mois_annee).sum()
+    ca_par_mois = par_mois['ca_total'].groupby(mois_annee).sum()
+    soins_par_mois.index = [NOMS_MOIS[i - 1] for i in soins_par_mois.index]
+    ca_par_mois.index = [NOMS_MOIS[i - 1] for i in ca_par_mois.index]
+    return {
+        'ca_mensuel': ca_mensuel,
+        'ca_trimestriel': par_mois['ca_total'].groupby(trimestres).sum(),
+        'ca_annuel': par_mois['ca_total'].groupby(annees).sum(),
+        'soins_par_mois': soins_par_mois,
+        'ca_par_mois': ca_par_mois,
+    }
+
+
+# Pages du dashboard, dans l'ordre de la navigation
+PREPARATIONS = {
+    PAGE_DASHBOARD: preparer_dashboard,
+    PAGE_SOINS: preparer_soins,
+    PAGE_PRATICIENS: preparer_praticiens,
+    PAGE_PATIENTS: preparer_patients,
+    PAGE_PAIEMENTS: preparer_paiements,
+    PAGE_GEOGRAPHIE: preparer_geographie,
+    PAGE_TEMPOREL: preparer_temporel,
+}
+PAGES = list(PREPARATIONS)
+
+
+class Prechauffage:
+    """Données de chaque page pour chaque cabinet, calculées en tâche de fond
+
+    Les résultats (et les tables patients par cabinet) sont rangés dans un
+    CacheLRU borné : au-delà du budget, les moins récemment consultés sont
+    évincés et préparés de nouveau à la visite suivante. Le préchauffage
+    s'arrête de lui-même une fois le budget rempli. Les résultats sont
+    partagés par toutes les sessions et ne doivent pas être modifiés par les
+    pages qui les affichent.
+    """
+
+    def __init__(self, vues, cube, patients=None, balance=None, nb_threads=NB_THREADS_PRECHAUFFAGE,
+                 cache=None):
+        """`patients` : table patients de tous les cabinets, si elle est déjà matérialisée ;
+        `balance` : instantané de la balance âgée des mêmes soins (creances.charger_balance) ;
+        `cache` : CacheLRU des préparations (par défaut, budget BUDGET_PRECHAUFFAGE_MO)"""
+        self.vues = vues
+        self.cube = cube
+        self.balance = balance
+        self.cache = cache if cache is not None else CacheLRU(BUDGET_PRECHAUFFAGE_MO * 1024**2)
+        self._verrou = threading.Lock()
+        self._taches = {}
+        self._requetes = {}
+        # Table matérialisée par l'appelant : gardée hors du cache, elle n'est jamais recalculée
+        self._patients = patients
+        if nb_threads <= 0:
+            return
+
+        # Toutes les pages de la vue globale d'abord, puis cabinet par cabinet
+        executeur = ThreadPoolExecutor(max_workers=nb_threads, thread_name_prefix='prechauffage')
+        for cabinet in [None] + self.vues.valeurs():
+            for page in PAGES:
+                self._taches[(page, cabinet)] = executeur.submit(self._prechauffer, page, cabinet)
+        # Plus aucune soumission : les threads s'arrêtent une fois la file vidée
+        executeur.shutdown(wait=False)
+
+    def requetes(self, cabinet=None):
+        """Planificateur de regroupements d'un cabinet, partagé par toutes ses pages"""
+        with self._verrou:
+            if cabinet not in self._requetes:
+                self._requetes[cabinet] = declarer_requetes(self.vues.vue(cabinet))
+            return self._requetes[cabinet]
+
+    def patients(self, cabinet=None):
+        """Table patients d'un cabinet, partagée par toutes ses pages tant qu'elle reste en cache"""
+        if cabinet is None and self._patients is not None:
+            return self._patients
+        return self.cache.obtenir(('patients', cabinet), lambda: agreger_patients(self.vues.vue(cabinet)))
+
+    def creances(self, cabinet=None):
+        """Créances ouvertes d'un cabinet, lues dans l'instantané de la balance s'il est fourni"""
+        if self.balance is None:
+            return creances_ouvertes(self.vues.vue(cabinet))
+        creances = self.balance.creances
+        return creances if cabinet is None else creances[creances['cabinet'] == cabinet]
+
+    def _preparer(self, page, cabinet):
+        df = self.vues.vue(cabinet)
+        filtres = {} if cabinet is None else {'cabinet': cabinet}
+
+        def cumul(par=None):
+            return self.cube.cumuler(par, **filtres)
+
+        with MESURES.mesurer(f"preparation:{page.split(' ', 1)[1]}", lignes=len(df)):
+            return PREPARATIONS[page](df, cumul, self.requetes(cabinet), lambda: self.patients(cabinet),
+                                      lambda: self.creances(cabinet))
+
+    def _prechauffer(self, page, cabinet):
+        # Budget rempli : les pages restantes seront préparées à leur première visite
+        if self.cache.occupation < self.cache.budget_octets:
+            self.donnees(page, cabinet)
+
+    def donnees(self, page, cabinet=None):
+        """Données d'une page (cabinet None : tous les cabinets)
+
+        Lues dans le cache, ou préparées tout de suite ; une préparation en
+        cours (préchauffage ou autre session) est attendue, pas refaite.
+        """
+        return self.cache.obtenir(('page', page, cabinet), lambda: self._preparer(page, cabinet))
+
+    def avancement(self):
+        """(préparations terminées, préparations prévues)"""
+        with self._verrou:
+            taches = list(self._taches.values())
+        return sum(tache.done() for tache in taches), len(taches)
@@ -13,12 +13,29 @@ from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+from cohortes import cohortes
+from creances import BalanceAgee, afficher_rapport, charger_balance
+from cube_kpi import CubeKPI
+from export_parquet import DOSSIER_EXPORT, exporter
+from kpi_vectorises import rentabilite, taux_fidelisation
+from mesures_performance import instrumenter_classe
+from montants import CENTIMES_PAR_CHF, COLONNES_CENTIMES, a_colonne, montant_chf
+from nettoyage_donnees import charger_donnees_nettoyees, nettoyer_donnees
+from requetes_kpi import RequetesKPI
+from rfm import MoteurRFM
+from table_patients import agreger_patients, charger_table_patients
+
 # Configuration pour les graphiques
 plt.style.use('seaborn-v0_8')
 sns.set_palette("husl")
 plt.rcParams['figure.figsize'] = (12, 8)
 plt.rcParams['font.size'] = 10
 
+# Dimensions du cube de KPIs utilisées par le rapport
+DIMENSIONS_RAPPORT = ['cabinet', 'nom_de_la_clinique', 'canton_clinique', 'dentiste', 'type_de_soin', 'Année-Mois']
+
+# Chaque étape du rapport est mesurée quand MESURES_PERFORMANCE est actif
+@instrumenter_classe(prefixes=('nettoyer_', 'kpi_', 'analyse_', 'generer_'))
 class RapportCompletDentaire:
     def __init__(self, fichier_donnees="patients_mis_a_jour.xlsx"):
         """Initialisation du rapport complet"""
@@ -26,35 +43,58 @@ class RapportCompletDentaire:
         print("="*60)
         
         try:
-            self.df = pd.read_excel(fichier_donnees)
+            self.fichier_donnees = fichier_donnees
+            self.df = charger_donnees_nettoyees(fichier_donnees)
             print(f"✅ Données chargées: {self.df.shape[0]} lignes, {self.df.shape[1]} colonnes")
             print(f"📊 Colonnes disponibles: {list(self.df.columns)}")
             
-            # Nettoyage initial
-            self.nettoyer_donnees()
+            # Agrégats construits une fois, réutilisés par tous les KPIs
+            # (patients distincts comptés exactement : pas de sketch HLL dans un rapport audité)
+            self.cube = CubeKPI.construire(self.df, dimensions=DIMENSIONS_RAPPORT)
             
         except Exception as e:
             print(f"❌ Erreur lors du chargement: {e}")
             raise
     
+    @property
+    def requetes(self):
+        """Agrégations du rapport, déclarées ensemble : un seul groupby par clé (soin, global)"""
+        if getattr(self, '_requetes', None) is None or self._requetes.df is not self.df:
+            self._requetes = self.declarer_requetes()
+        return self._requetes
+    
+    @property
+    def patients(self):
+        """Table de synthèse par patient (cache disque à côté des soins), partagée par les KPIs patients"""
+        if getattr(self, '_patients', None) is None or self._patients_df is not self.df:
+            fichier = getattr(self, 'fichier_donnees', None)
+            self._patients = charger_table_patients(fichier, self.df) if fichier else agreger_patients(self.df)
+            self._patients_df = self.df
+        return self._patients
+    
+    def declarer_requetes(self):
+        """Agrégations ligne à ligne des KPIs du rapport (les regroupements par patient sont dans self.patients)"""
+        requetes = RequetesKPI(self.df)
+        colonnes = self.df.columns
+        # Montants cumulés en centimes (sommes exactes), convertis en CHF à l'affichage
+        centimes = COLONNES_CENTIMES['montant_total_chf']
+        if {'type_de_soin', centimes, 'durée_minutes'} <= set(colonnes):
+            requetes.declarer_table('duree_par_soin', 'type_de_soin',
+                                    montant=(centimes, 'sum'), duree=('durée_minutes', 'sum'))
+        if centimes in colonnes:
+            requetes.declarer_table('montants', (), total=(centimes, 'sum'), moyen=(centimes, 'mean'))
+        distincts = {nom: (col, 'nunique') for nom, col in [
+            ('patients', 'patientid'), ('praticiens', 'dentiste'), ('cliniques', 'nom_de_la_clinique')
+        ] if col in colonnes}
+        if distincts:
+            requetes.declarer_table('distincts', (), **distincts)
+        return requetes
+    
     def nettoyer_donnees(self):
         """Nettoyage et préparation des données"""
         print("🧹 Nettoyage des données...")
-        
-        # Conversion des colonnes de dates
-        colonnes_dates = self.df.select_dtypes(include=['object']).columns
-        for col in colonnes_dates:
-            if 'date' in col.lower() or 'jour' in col.lower():
-                try:
-                    self.df[col] = pd.to_datetime(self.df[col], errors='coerce')
-                except:
-                    pass
-        
-        # Nettoyage des colonnes numériques
-        colonnes_numeriques = self.df.select_dtypes(include=[np.number]).columns
-        for col in colonnes_numeriques:
-            self.df[col] = pd.to_numeric(self.df[col], errors='coerce')
-        
+        self.df = nettoyer_donnees(self.df)
+        self.cube = CubeKPI.construire(self.df, dimensions=DIMENSIONS_RAPPORT)
         print("✅ Nettoyage terminé")
     
     def explorer_donnees(self):
@@ -65,15 +105,16 @@ class RapportCompletDentaire:
         print(f"📊 Forme du dataset: {self.df.shape}")
         print(f"📅 Période couverte: {self.df.select_dtypes(include=['datetime64']).columns.tolist()}")
         print(f"💰 Colonnes numériques: {self.df.select_dtypes(include=[np.number]).columns.tolist()}")
-        print(f"📝 Colonnes catégorielles: {self.df.select_dtypes(include=['object']).columns.tolist()}")
+        print(f"📝 Colonnes catégorielles: {self.df.select_dtypes(include=['object', 'string', 'category']).columns.tolist()}")
         
         # Statistiques descriptives
-        if 'montant_total_chf' in self.df.columns:
+        if a_colonne(self.df, 'montant_total_chf'):
+            montants = montant_chf(self.df)
             print(f"\n💰 STATISTIQUES MONÉTAIRES:")
-            print(f"   CA total: {self.df['montant_total_chf'].sum():,.2f} CHF")
-            print(f"   CA moyen: {self.df['montant_total_chf'].mean():.2f} CHF")
-            print(f"   CA médian: {self.df['montant_total_chf'].median():.2f} CHF")
-            print(f"   Écart-type: {self.df['montant_total_chf'].std():.2f} CHF")
+            print(f"   CA total: {montants.sum():,.2f} CHF")
+            print(f"   CA moyen: {montants.mean():.2f} CHF")
+            print(f"   CA médian: {montants.median():.2f} CHF")
+            print(f"   Écart-type: {montants.std():.2f} CHF")
     
     def kpi_performance_soins(self):
         """🦷 KPIs - Performance des soins"""
@@ -81,9 +122,9 @@ class RapportCompletDentaire:
         print("🦷 KPI 1: PERFORMANCE DES SOINS")
         print("="*60)
         
-        if 'type_de_soin' in self.df.columns and 'montant_total_chf' in self.df.columns:
+        if 'type_de_soin' in self.df.columns and a_colonne(self.df, 'montant_total_chf'):
             # Top 10 soins par CA
-            top_soins = self.df.groupby('type_de_soin')['montant_total_chf'].agg(['sum', 'count', 'mean']).round(2)
+            top_soins = self.cube.cumuler('type_de_soin')[['ca_total', 'nb_montants', 'ca_moyen']].round(2)
             top_soins.columns = ['CA_Total', 'Nombre_Actes', 'CA_Moyen']
             top_soins = top_soins.sort_values('CA_Total', ascending=False)
             
@@ -91,16 +132,15 @@ class RapportCompletDentaire:
             print(top_soins.head(10).to_string())
             
             # Rentabilité par minute (si durée disponible)
-            if 'durée_minutes' in self.df.columns:
-                rentabilite_minute = self.df.groupby('type_de_soin').apply(
-                    lambda x: (x['montant_total_chf'].sum() / x['durée_minutes'].sum()) if x['durée_minutes'].sum() > 0 else 0
-                ).round(2)
+            if 'duree_par_soin' in self.requetes:
+                sommes = self.requetes['duree_par_soin']
+                rentabilite_minute = rentabilite(sommes['montant'] / CENTIMES_PAR_CHF, sommes['duree']).round(2)
                 print("\n⏱️ RENTABILITÉ PAR MINUTE (TOP 10):")
                 print(rentabilite_minute.sort_values(ascending=False).head(10).to_string())
         
         # Nombre moyen de soins par patient
         if 'patientid' in self.df.columns:
-            soins_par_patient = self.df.groupby('patientid').size()
+            soins_par_patient = self.patients['frequence']
             print(f"\n👥 STATISTIQUES SOINS PAR PATIENT:")
             print(f"   Moyenne: {soins_par_patient.mean():.2f}")
             print(f"   Médiane: {soins_par_patient.median():.0f}")
@@ -113,9 +153,9 @@ class RapportCompletDentaire:
         print("👨‍⚕️ KPI 2: PRATICIENS")
         print("="*60)
         
-        if 'dentiste' in self.df.columns and 'montant_total_chf' in self.df.columns:
+        if 'dentiste' in self.df.columns and a_colonne(self.df, 'montant_total_chf'):
             # CA par praticien
-            ca_praticien = self.df.groupby('dentiste')['montant_total_chf'].agg(['sum', 'count', 'mean']).round(2)
+            ca_praticien = self.cube.cumuler('dentiste')[['ca_total', 'nb_montants', 'ca_moyen']].round(2)
             ca_praticien.columns = ['CA_Total', 'Nombre_Actes', 'CA_Moyen']
             ca_praticien = ca_praticien.sort_values('CA_Total', ascending=False)
             
@@ -124,10 +164,7 @@ class RapportCompletDentaire:
             
             # Taux de fidélisation
             if 'patientid' in self.df.columns:
-                fidelisation = self.df.groupby(['dentiste', 'patientid']).size().reset_index()
-                fidelisation = fidelisation.groupby('dentiste').apply(
-                    lambda x: (x[x[0] > 1].shape[0] / x.shape[0]) * 100
-                ).round(2)
+                fidelisation = taux_fidelisation(self.df, 'dentiste').round(2)
                 
                 print("\n👥 TAUX DE FIDÉLISATION PAR PRATICIEN (%):")
                 print(fidelisation.sort_values(ascending=False).to_string())
@@ -140,15 +177,15 @@ class RapportCompletDentaire:
         
         if 'patientid' in self.df.columns:
             # Taux de rétention
-            visites_par_patient = self.df.groupby('patientid').size()
-            patients_fideles = (visites_par_patient > 1).sum()
-            taux_retention = (patients_fideles / len(visites_par_patient)) * 100
+            patients = self.patients
+            patients_fideles = patients['fidele'].sum()
+            taux_retention = (patients_fideles / len(patients)) * 100
             
             print(f"\n📊 FIDÉLISATION DES PATIENTS:")
             print(f"   Taux de rétention: {taux_retention:.1f}%")
             print(f"   Patients fidèles (2+ visites): {patients_fideles}")
-            print(f"   Total patients: {len(visites_par_patient)}")
-            print(f"   Patients uniques: {self.df['patientid'].nunique()}")
+            print(f"   Total patients: {len(patients)}")
+            print(f"   Patients uniques: {self.requetes['distincts']['patients']}")
             
             # Analyse RFM
             if 'date_du_soin' in self.df.columns:
@@ -158,46 +195,16 @@ class RapportCompletDentaire:
         """Analyse RFM (Récence, Fréquence, Montant)"""
         print("\n📊 ANALYSE RFM (Récence, Fréquence, Montant):")
         
-        # Calcul RFM
-        rfm = self.df.groupby('patientid').agg({
-            'date_du_soin': lambda x: (pd.Timestamp.now() - x.max()).days,  # Récence
-            'patientid': 'count',  # Fréquence
-            'montant_total_chf': 'sum'  # Montant
-        }).rename(columns={'date_du_soin': 'recence', 'patientid': 'frequence', 'montant_total_chf': 'montant'})
+        # Scores et segments RFM vectorisés, date de référence = dernier soin des données
+        moteur = MoteurRFM()
+        rfm = moteur.ajuster_agregats(self.patients)
+        print(f"   Date de référence: {moteur.date_reference:%Y-%m-%d}")
         
-        # Segmentation RFM avec gestion des doublons
-        try:
-            rfm['R'] = pd.qcut(rfm['recence'], q=4, labels=['4', '3', '2', '1'], duplicates='drop')
-            rfm['F'] = pd.qcut(rfm['frequence'], q=4, labels=['1', '2', '3', '4'], duplicates='drop')
-            rfm['M'] = pd.qcut(rfm['montant'], q=4, labels=['1', '2', '3', '4'], duplicates='drop')
-            
-            rfm['RFM_Score'] = rfm['R'].astype(str) + rfm['F'].astype(str) + rfm['M'].astype(str)
-            
-            # Classification des segments
-            def segment_rfm(row):
-                if row['RFM_Score'] >= '444':
-                    return 'VIP'
-                elif row['RFM_Score'] >= '333':
-                    return 'Fidèle'
-                elif row['RFM_Score'] >= '222':
-                    return 'Actif'
-                else:
-                    return 'À risque'
-            
-            rfm['Segment'] = rfm.apply(segment_rfm, axis=1)
-            
-            print("\n📈 RÉPARTITION DES SEGMENTS:")
-            print(rfm['Segment'].value_counts().to_string())
-            
-            print("\n💰 MONTANT MOYEN PAR SEGMENT:")
-            print(rfm.groupby('Segment')['montant'].mean().round(2).to_string())
-            
-        except Exception as e:
-            print(f"⚠️ Erreur dans l'analyse RFM: {e}")
-            print("📊 Statistiques RFM de base:")
-            print(f"   Récence moyenne: {rfm['recence'].mean():.1f} jours")
-            print(f"   Fréquence moyenne: {rfm['frequence'].mean():.2f} visites")
-            print(f"   Montant moyen: {rfm['montant'].mean():.2f} CHF")
+        print("\n📈 RÉPARTITION DES SEGMENTS:")
+        print(rfm['Segment'].value_counts().to_string())
+        
+        print("\n💰 MONTANT MOYEN PAR SEGMENT:")
+        print(rfm.groupby('Segment', observed=True)['montant'].mean().round(2).to_string())
     
     def kpi_paiements(self):
         """💰 KPIs - Paiements et créances"""
@@ -205,22 +212,30 @@ class RapportCompletDentaire:
         print("💰 KPI 4: PAIEMENTS ET CRÉANCES")
         print("="*60)
         
-        if 'montant_payé_chf' in self.df.columns and 'montant_total_chf' in self.df.columns:
-            # Calcul des montants en retard
-            self.df['montant_impayé'] = self.df['montant_total_chf'] - self.df['montant_payé_chf']
-            retards = self.df[self.df['montant_impayé'] > 0]
+        if a_colonne(self.df, 'montant_payé_chf') and a_colonne(self.df, 'montant_total_chf'):
+            # Montants impayés, déjà cumulés dans le cube
+            totaux = self.cube.cumuler()
+            nb_retards = int(totaux['nb_impayes'])
             
             print(f"\n⏰ ANALYSE DES IMPAYÉS:")
-            print(f"   Paiements en retard: {len(retards)}")
-            print(f"   Montant total en retard: {retards['montant_impayé'].sum():,.2f} CHF")
-            print(f"   % de paiements en retard: {(len(retards)/len(self.df)*100):.1f}%")
-            print(f"   Montant moyen impayé: {retards['montant_impayé'].mean():.2f} CHF")
+            print(f"   Paiements en retard: {nb_retards}")
+            print(f"   Montant total en retard: {totaux['montant_impaye']:,.2f} CHF")
+            print(f"   % de paiements en retard: {(nb_retards/len(self.df)*100):.1f}%")
+            print(f"   Montant moyen impayé: {totaux['impaye_moyen']:.2f} CHF")
             
-            if len(retards) > 0:
+            if nb_retards > 0:
                 # Analyse par type de soin
-                retards_par_soin = retards.groupby('type_de_soin')['montant_impayé'].sum().sort_values(ascending=False)
+                par_soin = self.cube.cumuler('type_de_soin')
+                retards_par_soin = par_soin.loc[par_soin['nb_impayes'] > 0, 'montant_impaye'].sort_values(ascending=False)
                 print("\n🦷 IMPAYÉS PAR TYPE DE SOIN (TOP 10):")
                 print(retards_par_soin.head(10).to_string())
+            
+            # Balance âgée : soldes impayés par ancienneté (0-30, 31-60, 61-90, 90+ jours)
+            if 'date_du_soin' in self.df.columns:
+                # Instantané persisté à côté du fichier, mis à jour quand le fichier change
+                fichier = getattr(self, 'fichier_donnees', None)
+                balance = charger_balance(fichier, self.df) if fichier else BalanceAgee.construire(self.df)
+                afficher_rapport(balance.rapport(), balance.date_reference)
     
     def kpi_geographie(self):
         """🏥 KPIs - Analyse géographique"""
@@ -230,7 +245,7 @@ class RapportCompletDentaire:
         
         # CA par clinique
         if 'nom_de_la_clinique' in self.df.columns:
-            ca_clinique = self.df.groupby('nom_de_la_clinique')['montant_total_chf'].agg(['sum', 'count']).round(2)
+            ca_clinique = self.cube.cumuler('nom_de_la_clinique')[['ca_total', 'nb_montants']].round(2)
             ca_clinique.columns = ['CA_Total', 'Nombre_Actes']
             ca_clinique['CA_Moyen'] = (ca_clinique['CA_Total'] / ca_clinique['Nombre_Actes']).round(2)
             
@@ -239,7 +254,7 @@ class RapportCompletDentaire:
         
         # Patients uniques par canton
         if 'canton_clinique' in self.df.columns and 'patientid' in self.df.columns:
-            patients_canton = self.df.groupby('canton_clinique')['patientid'].nunique()
+            patients_canton = self.cube.cumuler('canton_clinique')['nb_patients']
             print("\n👥 PATIENTS UNIQUES PAR CANTON:")
             print(patients_canton.sort_values(ascending=False).to_string())
     
@@ -251,23 +266,32 @@ class RapportCompletDentaire:
         
         if 'date_du_soin' in self.df.columns:
             # CA par mois
-            self.df['mois'] = self.df['date_du_soin'].dt.to_period('M')
-            ca_mensuel = self.df.groupby('mois')['montant_total_chf'].sum()
+            par_mois = self.cube.cumuler('Année-Mois')
+            par_mois.index = pd.PeriodIndex(par_mois.index, freq='M', name='mois')
+            ca_mensuel = par_mois['ca_total']
             
             print("\n📈 CA MENSUEL:")
             print(ca_mensuel.round(2).to_string())
             
-            # Patients par mois
-            patients_mensuel = self.df.groupby('mois')['patientid'].nunique()
+            # Patients vus pour la première fois chaque mois (comme le tableau de bord)
             print("\n👥 NOUVEAUX PATIENTS PAR MOIS:")
-            print(patients_mensuel.to_string())
+            print(cohortes(self.df).nouveaux.to_string())
+
+            # Patients distincts vus chaque mois
+            print("\n👥 PATIENTS ACTIFS PAR MOIS:")
+            print(par_mois['nb_patients'].to_string())
             
             # Saisonnalité
-            self.df['mois_num'] = self.df['date_du_soin'].dt.month
-            saisonnalite = self.df.groupby('mois_num')['montant_total_chf'].sum()
+            mois_num = pd.Index(par_mois.index.month, name='mois_num')
+            saisonnalite = ca_mensuel.groupby(mois_num).sum()
             print("\n🌤️ SAISONNALITÉ (CA par mois):")
             print(saisonnalite.round(2).to_string())
     
+    def exporter_parquet(self, dossier=DOSSIER_EXPORT):
+        """Écrit les données nettoyées et les tables de KPIs en Parquet partitionné"""
+        print(f"\n📦 Export Parquet vers {dossier}")
+        return exporter(self.df, dossier, cube=self.cube)
+    
     def generer_rapport_complet(self):
         """Génère un rapport complet de toutes les analyses"""
         print("\n🚀 DÉBUT DU RAPPORT COMPLET")
@@ -296,22 +320,22 @@ class RapportCompletDentaire:
         print("\n🎯 INSIGHTS CLÉS:")
         print("="*40)
         
-        if 'montant_total_chf' in self.df.columns:
-            ca_total = self.df['montant_total_chf'].sum()
-            ca_moyen = self.df['montant_total_chf'].mean()
+        if 'montants' in self.requetes:
+            ca_total = self.requetes['montants']['total'] / CENTIMES_PAR_CHF
+            ca_moyen = self.requetes['montants']['moyen'] / CENTIMES_PAR_CHF
             print(f"💰 CA total: {ca_total:,.2f} CHF")
             print(f"💰 CA moyen par acte: {ca_moyen:.2f} CHF")
         
         if 'patientid' in self.df.columns:
-            nb_patients = self.df['patientid'].nunique()
+            nb_patients = self.requetes['distincts']['patients']
             print(f"👥 Nombre de patients uniques: {nb_patients}")
         
         if 'dentiste' in self.df.columns:
-            nb_praticiens = self.df['dentiste'].nunique()
+            nb_praticiens = self.requetes['distincts']['praticiens']
             print(f"👨‍⚕️ Nombre de praticiens: {nb_praticiens}")
         
         if 'nom_de_la_clinique' in self.df.columns:
-            nb_cliniques = self.df['nom_de_la_clinique'].nunique()
+            nb_cliniques = self.requetes['distincts']['cliniques']
             print(f"🏥 Nombre de cliniques: {nb_cliniques}")
 
 # Exécution du rapport complet
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Planificateur de requêtes de KPIs : un seul regroupement par jeu de clés
+Auteur: Assistant IA
+Date: 2024
+
+Les consommateurs (rapport, pages du dashboard) déclarent d'abord, sous un
+nom, les agrégations dont ils ont besoin : clés de regroupement, colonne et
+fonction. À la première lecture d'un résultat, toutes les déclarations en
+attente qui partagent les mêmes clés sont exécutées ensemble : les clés ne
+sont factorisées qu'une fois (un seul groupby) pour toutes les mesures, et
+une mesure demandée par plusieurs consommateurs n'est calculée qu'une fois.
+
+Les clés () désignent une agrégation globale (ex. nombre de patients
+distincts). Le planificateur est protégé par un verrou : les préparations
+des pages, exécutées en parallèle, peuvent partager la même instance.
+"""
+
+import threading
+
+import pandas as pd
+
+FONCTIONS = ('size', 'count', 'sum', 'mean', 'median', 'std', 'min', 'max', 'nunique', 'first', 'last')
+
+
+def _normaliser_cles(cles):
+    if cles is None:
+        return ()
+    return (cles,) if isinstance(cles, str) else tuple(cles)
+
+
+def _mesure(colonne, fonction):
+    """Mesure élémentaire (colonne, fonction) ; la taille d'un groupe ne dépend d'aucune colonne"""
+    if fonction not in FONCTIONS:
+        raise ValueError(f"Fonction d'agrégation inconnue: {fonction}")
+    return (None, 'size') if fonction == 'size' else (colonne, fonction)
+
+
+class RequetesKPI:
+    """Agrégations nommées d'un DataFrame, fusionnées par clés de regroupement"""
+
+    def __init__(self, df, trier=True):
+        self.df = df
+        self.trier = trier
+        self._declarations = {}  # nom -> (clés, {libellé: mesure}) ; libellé None pour une Series
+        self._en_attente = {}  # clés -> mesures à calculer
+        self._resultats = {}  # (clés, mesure) -> Series ou scalaire
+        self._verrou = threading.Lock()
+        self.nb_passes = 0
+
+    def _enregistrer(self, nom, cles, mesures):
+        cles = _normaliser_cles(cles)
+        manquantes = [c for c in cles + tuple(col for col, _ in mesures.values())
+                      if c is not None and c not in self.df.columns]
+        if manquantes:
+            raise KeyError(f"Colonnes absentes: {manquantes}")
+        with self._verrou:
+            self._declarations[nom] = (cles, mesures)
+            for mesure in mesures.values():
+                if (cles, mesure) not in self._resultats:
+                    self._en_attente.setdefault(cles, set()).add(mesure)
+
+    def declarer(self, nom, cles, colonne=None, fonction='size'):
+        """Déclare une mesure ; `requetes[nom]` sera une Series indexée par les clés"""
+        self._enregistrer(nom, cles, {None: _mesure(colonne, fonction)})
+        return self
+
+    def declarer_table(self, nom, cles, **mesures):
+        """Déclare plusieurs mesures nommées ; `requetes[nom]` sera un DataFrame
+
+        Chaque mesure est un couple (colonne, fonction), comme pour groupby().agg().
+        """
+        self._enregistrer(nom, cles, {libelle: _mesure(*mesure) for libelle, mesure in mesures.items()})
+        return self
+
+    def __contains__(self, nom):
+        return nom in self._declarations
+
+    def plan(self):
+        """Regroupements en attente : clés -> mesures (une passe par entrée)"""
+        with self._verrou:
+            return {cles: sorted(mesures, key=str) for cles, mesures in self._en_attente.items()}
+
+    def executer(self):
+        """Calcule toutes les mesures en attente, une passe par jeu de clés"""
+        with self._verrou:
+            for cles, mesures in self._en_attente.items():
+                for mesure, resultat in self._agreger(cles, sorted(mesures, key=str)).items():
+                    self._resultats[(cles, mesure)] = resultat
+            self._en_attente.clear()
+
+    def _agreger(self, cles, mesures):
+        self.nb_passes += 1
+        if not cles:
+            return {
+                (colonne, fonction): len(self.df) if fonction == 'size' else self.df[colonne].agg(fonction)
+                for colonne, fonction in mesures
+            }
+
+        # Le même objet groupby sert à toutes les mesures : les clés ne sont factorisées qu'une fois
+        groupes = self.df.groupby(list(cles), observed=True, sort=self.trier)
+        resultats = {}
+        nommees = {f"m{i}": mesure for i, mesure in enumerate(mesures) if mesure[1] != 'size'}
+        if nommees:
+            table = groupes.agg(**nommees)
+            for etiquette, mesure in nommees.items():
+                resultats[mesure] = table[etiquette].rename(mesure[0])
+        if (None, 'size') in mesures:
+            resultats[(None, 'size')] = groupes.size()
+        return resultats
+
+    def __getitem__(self, nom):
+        """Résultat d'une déclaration ; exécute d'abord toutes les déclarations en attente"""
+        cles, mesures = self._declarations[nom]
+        if any((cles, mesure) not in self._resultats for mesure in mesures.values()):
+            self.executer()
+        valeurs = {libelle: self._resultats[(cles, mesure)] for libelle, mesure in mesures.items()}
+        if None in valeurs:
+            return valeurs[None]
+        if not cles:
+            return pd.Series(valeurs)
+        return pd.DataFrame(valeurs)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Base RFM (Récence, Fréquence, Montant) par patient
+Auteur: Assistant IA
+Date: 2024
+
+La base garde, pour chaque patient, la date du dernier soin, le nombre de
+soins et le montant cumulé. Ces trois agrégats se fusionnent : l'arrivée de
+nouveaux soins ne met à jour que les patients concernés.
+
+Le moteur de scoring classe chaque agrégat en quartiles (bornes numpy) et
+attribue le segment par une table de correspondance indexée par les scores
+entiers. La date de référence est fixe : deux calculs sur les mêmes données
+donnent les mêmes scores, quel que soit le jour d'exécution.
+"""
+
+import numpy as np
+import pandas as pd
+
+from montants import colonnes_chf
+
+NB_CLASSES = 4
+SEGMENTS_RFM = ['À risque', 'Actif', 'Fidèle', 'VIP']
+# Score RFM minimal (R*100 + F*10 + M) de chaque segment, du plus bas au plus haut
+SEUILS_SEGMENTS = {'Actif': 222, 'Fidèle': 333, 'VIP': 444}
+
+
+def mesures_rfm(col_date='date_du_soin', col_montant='montant_total_chf'):
+    """Agrégations nommées des agrégats RFM (groupby().agg() ou RequetesKPI.declarer_table)"""
+    return {
+        'dernier_soin': (col_date, 'max'),
+        'frequence': (col_date, 'size'),
+        'montant': (col_montant, 'sum'),
+    }
+
+
+def agreger_rfm(df, col_patient='patientid', col_date='date_du_soin', col_montant='montant_total_chf'):
+    """Agrégats RFM bruts par patient : dernier_soin, frequence, montant"""
+    df = colonnes_chf(df, [col_patient, col_date, col_montant])
+    return df.groupby(col_patient, observed=True, sort=False).agg(**mesures_rfm(col_date, col_montant))
+
+
+def fusionner_rfm(base, delta):
+    """Intègre les agrégats RFM d'un delta dans la base existante
+
+    Seuls les patients présents dans le delta sont modifiés ; les nouveaux
+    patients sont ajoutés en fin de table. `base` n'est jamais modifiée (elle
+    peut être la table patients partagée par le rapport et le tableau de
+    bord) : le résultat est une nouvelle table.
+    """
+    if base is None or len(base) == 0:
+        return delta.copy()
+
+    communs = delta.index.intersection(base.index)
+    nouveaux = delta.index.difference(base.index)
+
+    if len(communs) > 0:
+        base = base.copy()
+        base.loc[communs, 'dernier_soin'] = pd.concat(
+            [base.loc[communs, 'dernier_soin'], delta.loc[communs, 'dernier_soin']], axis=1
+        ).max(axis=1)
+        base.loc[communs, 'frequence'] += delta.loc[communs, 'frequence']
+        base.loc[communs, 'montant'] += delta.loc[communs, 'montant']
+
+    if len(nouveaux) > 0:
+        base = pd.concat([base, delta.loc[nouveaux]])
+    return base
+
+
+def _table_segments():
+    """Code de segment pour chaque combinaison de scores, indexée par (R-1, F-1, M-1)"""
+    r, f, m = np.meshgrid(*[np.arange(1, NB_CLASSES + 1)] * 3, indexing='ij')
+    score = (r * 100 + f * 10 + m).ravel()
+    table = np.zeros(len(score), dtype=np.int8)
+    for segment, seuil in SEUILS_SEGMENTS.items():
+        table[score >= seuil] = SEGMENTS_RFM.index(segment)
+    return table
+
+
+TABLE_SEGMENTS = _table_segments()
+
+
+def bornes_quantiles(valeurs):
+    """Bornes internes des quartiles (interpolation linéaire, comme pd.qcut)"""
+    return np.nanquantile(np.asarray(valeurs, dtype=float), np.linspace(0, 1, NB_CLASSES + 1)[1:-1])
+
+
+def classer(valeurs, bornes):
+    """Classe 1..NB_CLASSES de chaque valeur ; intervalles fermés à droite, comme pd.qcut
+
+    Contrairement à pd.qcut, des bornes confondues (ex. une majorité de
+    patients venus une seule fois) ne provoquent pas d'erreur : les classes
+    correspondantes restent simplement vides.
+    """
+    return np.searchsorted(bornes, np.asarray(valeurs, dtype=float), side='left') + 1
+
+
+class MoteurRFM:
+    """Scores et segments RFM par patient, recalculables de façon incrémentale"""
+
+    def __init__(self, date_reference=None):
+        # Par défaut, la date de référence est celle du dernier soin des données
+        self.date_reference = pd.Timestamp(date_reference) if date_reference is not None else None
+        self.agregats = None
+        self.bornes = None
+        self.scores = None
+
+    def recence(self, agregats):
+        """Jours écoulés entre le dernier soin et la date de référence"""
+        ecart = np.datetime64(self.date_reference, 'ns') - agregats['dernier_soin'].to_numpy(dtype='datetime64[ns]')
+        return ecart / np.timedelta64(1, 'D') // 1
+
+    def calibrer(self):
+        """Recalcule les bornes des quartiles sur toute la base"""
+        self.bornes = {
+            'recence': bornes_quantiles(self.recence(self.agregats)),
+            'frequence': bornes_quantiles(self.agregats['frequence']),
+            'montant': bornes_quantiles(self.agregats['montant']),
+        }
+
+    def scorer(self, agregats):
+        """Scores R, F, M, score RFM entier et segment, avec les bornes courantes"""
+        recence = self.recence(agregats)
+        # Une récence faible est la meilleure : l'échelle est inversée
+        r = NB_CLASSES + 1 - classer(recence, self.bornes['recence'])
+        f = classer(agregats['frequence'], self.bornes['frequence'])
+        m = classer(agregats['montant'], self.bornes['montant'])
+        segments = TABLE_SEGMENTS[((r - 1) * NB_CLASSES + (f - 1)) * NB_CLASSES + (m - 1)]
+
+        return pd.DataFrame({
+            'recence': recence,
+            'frequence': agregats['frequence'].to_numpy(),
+            'montant': agregats['montant'].to_numpy(),
+            'R': r.astype(np.int8),
+            'F': f.astype(np.int8),
+            'M': m.astype(np.int8),
+            'RFM_Score': (r * 100 + f * 10 + m).astype(np.int16),
+            'Segment': pd.Categorical.from_codes(segments, SEGMENTS_RFM),
+        }, index=agregats.index)
+
+    def ajuster(self, df, col_patient='patientid', col_date='date_du_soin', col_montant='montant_total_chf'):
+        """Calcul complet : agrégats, date de référence, bornes et scores de tous les patients"""
+        return self.ajuster_agregats(agreger_rfm(df, col_patient, col_date, col_montant))
+
+    def ajuster_agregats(self, agregats):
+        """Comme ajuster(), à partir d'agrégats RFM déjà calculés (ex. la table patients)"""
+        self.agregats = agregats
+        if self.date_reference is None:
+            self.date_reference = self.agregats['dernier_soin'].max().normalize()
+        self.calibrer()
+        self.scores = self.scorer(self.agregats)
+        return self.scores
+
+    def mettre_a_jour(self, df_delta, col_patient='patientid', col_date='date_du_soin',
+                      col_montant='montant_total_chf'):
+        """Intègre de nouveaux soins et ne rescore que les patients concernés
+
+        Les bornes et la date de référence restent figées : les scores des
+        autres patients ne bougent pas. Appeler calibrer() puis
+        scorer(self.agregats) pour un recalcul complet.
+        """
+        if self.scores is None:
+            return self.ajuster(df_delta, col_patient, col_date, col_montant)
+        delta = agreger_rfm(df_delta, col_patient, col_date, col_montant)
+        self.agregats = fusionner_rfm(self.agregats, delta)
+        nouveaux = self.scorer(self.agregats.loc[delta.index])
+
+        # Les scores déjà renvoyés restent inchangés : la mise à jour porte sur une copie
+        communs = nouveaux.index.intersection(self.scores.index)
+        scores = self.scores.copy()
+        scores.loc[communs] = nouveaux.loc[communs]
+        self.scores = pd.concat([scores, nouveaux.loc[nouveaux.index.difference(scores.index)]])
+        return self.scores
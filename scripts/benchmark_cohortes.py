@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark : cohortes d'acquisition, groupby pandas vs version vectorisée (bincount)
+
+Usage: python scripts/benchmark_cohortes.py [nb_lignes_max]
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cohortes import cohortes
+from montants import montant_chf
+from outils_benchmark import comparer, soins_synthetiques, tailles_croissantes
+
+# Au-delà, la version groupby prend plusieurs dizaines de secondes
+TAILLE_MAX_GROUPBY = 1_000_000
+
+
+def generer_visites(nb_lignes):
+    """Soins synthétiques sur 5 ans : assez de cohortes et de mois d'ancienneté"""
+    return soins_synthetiques(nb_lignes, ['patientid', 'date_du_soin', 'montant_total_chf'], annees=5)
+
+
+def cohortes_groupby(df):
+    """Version pandas : premier mois par patient (transform), puis groupby (cohorte, ancienneté)"""
+    mois = df['date_du_soin'].dt.to_period('M')
+    cohorte = mois.groupby(df['patientid']).transform('min')
+    anciennete = (mois - cohorte).map(lambda ecart: ecart.n)
+    cles = [cohorte.astype(str).rename('cohorte'), anciennete.rename('mois_depuis_acquisition')]
+    patients = df['patientid'].groupby(cles).nunique().unstack()
+    revenus = montant_chf(df).groupby(cles).sum().unstack()
+    return patients, revenus
+
+
+def verifier(attendu, vectorise):
+    patients, revenus = attendu
+    assert np.array_equal(vectorise.patients.reindex_like(patients).fillna(0), patients.fillna(0)), \
+        "Effectifs différents"
+    assert np.allclose(vectorise.revenus.reindex_like(revenus).fillna(0), revenus.fillna(0)), \
+        "Revenus différents"
+
+
+def benchmark(nb_lignes_max=10_000_000):
+    comparer("Benchmark des cohortes d'acquisition", cohortes_groupby, cohortes, verifier,
+             tailles_croissantes(10_000, nb_lignes_max), TAILLE_MAX_GROUPBY, generer_visites,
+             libelle_reference="Groupby")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000)
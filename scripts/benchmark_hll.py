@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark : patients distincts du cube de KPIs, comptage exact vs sketches HLL
+
+Pour chaque taille, le cube est construit dans les deux modes, puis cumulé
+par mois et par clinique (avec et sans filtre), comme le font les pages du
+tableau de bord. L'erreur relative maximale des sketches est comparée à
+l'erreur type annoncée.
+
+Usage: python scripts/benchmark_hll.py [nb_lignes_max] [erreur]
+"""
+import os
+import sys
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cube_kpi import CubeKPI
+from hyperloglog import ERREUR_DEFAUT
+from outils_benchmark import chronometrer, soins_synthetiques
+
+warnings.filterwarnings('ignore')
+
+TAILLES = [100_000, 1_000_000, 5_000_000]
+DIMENSIONS = ['cabinet', 'nom_de_la_clinique', 'type_de_soin_normalisé', 'Année-Mois']
+
+
+def generer_soins(nb_lignes):
+    """Soins synthétiques sur 2 ans, avec la colonne Année-Mois du tableau de bord"""
+    df = soins_synthetiques(nb_lignes, ['patientid', 'cabinet', 'nom_de_la_clinique', 'type_de_soin_normalisé',
+                                        'date_du_soin', 'montant_total_chf'], annees=2)
+    df['Année-Mois'] = df['date_du_soin'].dt.strftime('%Y-%m').astype('category')
+    return df
+
+
+def requetes(cube, cabinet):
+    """Cumuls des pages du tableau de bord"""
+    return [
+        cube.cumuler()['nb_patients'],
+        cube.cumuler('Année-Mois')['nb_patients'],
+        cube.cumuler('nom_de_la_clinique')['nb_patients'],
+        cube.cumuler('Année-Mois', cabinet=cabinet)['nb_patients'],
+    ]
+
+
+def octets_patients(cube):
+    if cube.sketches is not None:
+        s = cube.sketches
+        return s.sketch.nbytes + s.registre.nbytes + s.rang.nbytes
+    cellule, patient = cube.patients_cellules
+    return cellule.nbytes + patient.nbytes + int(cube.patients.memory_usage(deep=True))
+
+
+def benchmark(nb_lignes_max=TAILLES[-1], erreur=ERREUR_DEFAUT):
+    print(f"⏱️ Patients distincts : exact vs HLL (erreur type visée {erreur:.1%})")
+    print("=" * 60)
+    for nb_lignes in [t for t in TAILLES if t <= nb_lignes_max]:
+        df = generer_soins(nb_lignes)
+        exact, t_exact = chronometrer(CubeKPI.construire, df, dimensions=DIMENSIONS)
+        approche, t_hll = chronometrer(CubeKPI.construire, df, dimensions=DIMENSIONS, erreur_patients=erreur)
+
+        cabinet = df['cabinet'].cat.categories[0]
+        res_exact, q_exact = chronometrer(requetes, exact, cabinet)
+        res_hll, q_hll = chronometrer(requetes, approche, cabinet)
+        ecart = max(np.max(np.abs(np.asarray(h, dtype=float) / np.asarray(e, dtype=float) - 1))
+                    for e, h in zip(res_exact, res_hll))
+
+        print(f"\n📦 {len(df):,} lignes, {len(exact.cellules):,} cellules")
+        print(f"   Construction: exact {t_exact:.2f} s, HLL {t_hll:.2f} s")
+        print(f"   Cumuls:       exact {q_exact * 1000:.0f} ms, HLL {q_hll * 1000:.0f} ms")
+        print(f"   Mémoire:      exact {octets_patients(exact) / 1e6:.1f} Mo, "
+              f"HLL {octets_patients(approche) / 1e6:.1f} Mo")
+        print(f"   Écart max: {ecart:.2%} (erreur type {approche.erreur_patients:.2%})")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else TAILLES[-1],
+              float(sys.argv[2]) if len(sys.argv) > 2 else ERREUR_DEFAUT)
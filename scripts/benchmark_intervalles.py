@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Benchmark : intervalles entre soins, boucle par patient vs version vectorisée
+
+Usage: python scripts/benchmark_intervalles.py [nb_lignes_max]
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from intervalles_soins import intervalles_entre_soins
+from outils_benchmark import comparer, soins_synthetiques, tailles_croissantes
+
+# Au-delà, la boucle d'origine prend plusieurs minutes
+TAILLE_MAX_BOUCLE = 20_000
+
+
+def generer_visites(nb_lignes):
+    """Soins synthétiques sur 2 ans (patients et dates seulement)"""
+    return soins_synthetiques(nb_lignes, ['patientid', 'date_du_soin'], annees=2)
+
+
+def intervalles_boucle(df_filtered):
+    """Implémentation d'origine de la page « Analyse des Patients »"""
+    df_sorted = df_filtered.sort_values(['patientid', 'date_du_soin'])
+    intervalles = []
+
+    for patient in df_sorted['patientid'].unique():
+        patient_data = df_sorted[df_sorted['patientid'] == patient]
+        if len(patient_data) > 1:
+            dates = patient_data['date_du_soin'].sort_values()
+            for i in range(1, len(dates)):
+                intervalle = (dates.iloc[i] - dates.iloc[i-1]).days
+                intervalles.append(intervalle)
+    return intervalles
+
+
+def verifier(boucle, vectorise):
+    # Même distribution : mêmes valeurs une fois triées
+    assert np.array_equal(np.sort(boucle), np.sort(vectorise.to_numpy())), "Résultats différents"
+
+
+def benchmark(nb_lignes_max=10_000_000):
+    comparer("Benchmark des intervalles entre soins", intervalles_boucle, intervalles_entre_soins, verifier,
+             tailles_croissantes(1_000, nb_lignes_max), TAILLE_MAX_BOUCLE, generer_visites,
+             libelle_reference="Boucle")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark : KPIs par groupby().apply(lambda) vs bibliothèque vectorisée
+
+Usage: python scripts/benchmark_kpis_vectorises.py [nb_lignes_max]
+"""
+import os
+import sys
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from kpi_vectorises import rentabilite_par_minute, taux_fidelisation, taux_modalite
+from montants import montant_chf
+from outils_benchmark import chronometrer, soins_synthetiques
+
+warnings.filterwarnings('ignore')
+
+TAILLES = [100_000, 1_000_000, 10_000_000]
+
+
+def generer_soins(nb_lignes):
+    """Soins synthétiques, réduits aux colonnes des KPIs mesurés"""
+    return soins_synthetiques(nb_lignes, ['patientid', 'type_de_soin', 'dentiste', 'nom_de_la_clinique',
+                                          'type_de_patient', 'montant_total_chf', 'durée_minutes'])
+
+
+# Implémentations d'origine (rapport_complet_kpis.py et streamlit_app.py)
+
+def rentabilite_lambda(df):
+    return df.groupby('type_de_soin', observed=True).apply(
+        lambda x: (montant_chf(x).sum() / x['durée_minutes'].sum()) if x['durée_minutes'].sum() > 0 else 0
+    )
+
+
+def fidelisation_lambda(df):
+    fidelisation = df.groupby(['dentiste', 'patientid'], observed=True).size().reset_index()
+    return fidelisation.groupby('dentiste', observed=True).apply(
+        lambda x: (x[x[0] > 1].shape[0] / x.shape[0]) * 100
+    )
+
+
+def vip_lambda(df):
+    return df.groupby('nom_de_la_clinique', observed=True)['type_de_patient'].apply(
+        lambda x: (x == 'VIP').mean()
+    ) * 100
+
+
+KPIS = [
+    ("Rentabilité/minute", rentabilite_lambda,
+     lambda df: rentabilite_par_minute(df, 'type_de_soin')),
+    ("Fidélisation", fidelisation_lambda,
+     lambda df: taux_fidelisation(df, 'dentiste')),
+    ("Part VIP", vip_lambda,
+     lambda df: taux_modalite(df, 'nom_de_la_clinique', 'type_de_patient', 'VIP')),
+]
+
+
+def benchmark(nb_lignes_max=10_000_000):
+    print("⏱️ Benchmark des KPIs vectorisés")
+    print("=" * 70)
+    print(f"{'KPI':<20} {'Lignes':>12} {'Lambda (s)':>12} {'Vectorisé (s)':>14} {'Accélération':>12}")
+
+    for taille in [t for t in TAILLES if t <= nb_lignes_max]:
+        df = generer_soins(taille)
+        for nom, origine, vectorise in KPIS:
+            attendu, t_origine = chronometrer(origine, df)
+            obtenu, t_vect = chronometrer(vectorise, df)
+            assert np.allclose(attendu.sort_index().to_numpy(dtype=float),
+                               obtenu.sort_index().to_numpy(dtype=float)), f"Résultats différents: {nom}"
+            print(f"{nom:<20} {taille:>12,} {t_origine:>12.3f} {t_vect:>14.3f} {t_origine / t_vect:>11.1f}x")
+
+    print("\n✅ Résultats identiques aux implémentations d'origine")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000)
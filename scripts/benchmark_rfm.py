@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark : scoring RFM d'origine (lambda + apply par ligne) vs moteur vectorisé
+
+Usage: python scripts/benchmark_rfm.py [nb_patients]
+"""
+import os
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from donnees_synthetiques import SOINS_PAR_PATIENT
+from montants import colonnes_chf
+from outils_benchmark import chronometrer, soins_synthetiques
+from rfm import MoteurRFM
+
+warnings.filterwarnings('ignore')
+
+# Au-delà, l'implémentation d'origine prend plusieurs minutes
+TAILLE_MAX_ORIGINE = 50_000
+
+
+def generer_soins(nb_patients):
+    """Soins synthétiques sur 2 ans, pour environ `nb_patients` patients"""
+    return soins_synthetiques(int(nb_patients * SOINS_PAR_PATIENT),
+                              ['patientid', 'date_du_soin', 'montant_total_chf'], annees=2)
+
+
+def rfm_origine(df, date_reference):
+    """Implémentation d'origine de analyse_rfm (date de référence fixée pour comparer)"""
+    df = colonnes_chf(df, ['patientid', 'date_du_soin', 'montant_total_chf'])
+    rfm = df.groupby('patientid').agg({
+        'date_du_soin': lambda x: (date_reference - x.max()).days,
+        'patientid': 'count',
+        'montant_total_chf': 'sum'
+    }).rename(columns={'date_du_soin': 'recence', 'patientid': 'frequence', 'montant_total_chf': 'montant'})
+
+    rfm['R'] = pd.qcut(rfm['recence'], q=4, labels=['4', '3', '2', '1'])
+    rfm['M'] = pd.qcut(rfm['montant'], q=4, labels=['1', '2', '3', '4'])
+    return rfm
+
+
+def benchmark(nb_patients=1_000_000):
+    print(f"⏱️ Benchmark du moteur RFM ({nb_patients:,} patients)")
+    print("=" * 60)
+    df = generer_soins(nb_patients)
+
+    moteur = MoteurRFM()
+    scores, t_complet = chronometrer(moteur.ajuster, df)
+    print(f"📊 Scoring complet: {t_complet:.3f} s ({len(df):,} soins)")
+
+    # Reproductibilité : même date de référence, mêmes scores
+    scores_bis = MoteurRFM().ajuster(df)
+    assert scores.equals(scores_bis), "Scores non reproductibles"
+    print("🔁 Deux exécutions: scores identiques")
+
+    # Mise à jour incrémentale avec 0.1 % de nouveaux soins
+    delta = df.sample(max(1, len(df) // 1000), random_state=1).assign(date_du_soin=moteur.date_reference)
+    _, t_delta = chronometrer(moteur.mettre_a_jour, delta)
+    print(f"➕ Rescoring incrémental ({len(delta):,} soins): {t_delta:.3f} s")
+
+    # Comparaison avec l'implémentation d'origine sur un échantillon
+    echantillon = df[df['patientid'].isin(df['patientid'].unique()[:TAILLE_MAX_ORIGINE])]
+    moteur = MoteurRFM()
+    vectorise, t_vect = chronometrer(moteur.ajuster, echantillon)
+    origine, t_origine = chronometrer(rfm_origine, echantillon, moteur.date_reference)
+    # Patients dans l'ordre de la version d'origine (groupby trié)
+    vectorise = vectorise.reindex(origine.index)
+    for col in ['R', 'M']:
+        assert np.array_equal(origine[col].astype(int).to_numpy(), vectorise[col].to_numpy()), f"Scores {col} différents"
+    print(f"⚖️ {len(origine):,} patients: origine {t_origine:.3f} s, vectorisé {t_vect:.4f} s "
+          f"({t_origine / t_vect:.0f}x), scores R et M identiques")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
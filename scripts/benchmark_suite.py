@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Suite de benchmarks des chemins critiques : chargement, nettoyage, KPIs,
+RFM, intervalles entre soins et pages du dashboard Streamlit
+
+Pour chaque taille, des soins synthétiques au schéma de
+patients_mis_a_jour.xlsx sont écrits en CSV dans un dossier temporaire,
+puis chaque étape est chronométrée (meilleur temps sur plusieurs
+répétitions pour les petites tailles). Les pages du dashboard sont
+exécutées avec streamlit.testing (AppTest) : le temps d'une page est celui
+d'un rerun complet du script, caches de données chauds.
+
+Les résultats sont écrits en JSON (version git, machine, une entrée par
+taille et par étape). --comparer signale les étapes plus lentes qu'un
+précédent fichier de résultats, et termine en erreur s'il y en a.
+
+Usage: python scripts/benchmark_suite.py [nb_lignes_max] [--sortie fichier.json]
+                                         [--comparer reference.json] [--sans-pages]
+"""
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+from chargement_donnees import charger_donnees
+from cube_kpi import CubeKPI
+from donnees_synthetiques import generer_patients
+from intervalles_soins import intervalles_entre_soins
+from nettoyage_donnees import nettoyer_donnees
+from rapport_complet_kpis import DIMENSIONS_RAPPORT, RapportCompletDentaire
+
+warnings.filterwarnings('ignore')
+
+# 10M lignes demandent ~16 Go de mémoire : à passer explicitement en argument
+TAILLES = [10_000, 100_000, 1_000_000, 10_000_000]
+TAILLE_MAX_DEFAUT = 1_000_000
+# Jusqu'à cette taille, chaque étape est répétée et le meilleur temps retenu
+TAILLE_MAX_REPETITIONS = 100_000
+REPETITIONS = 3
+
+DOSSIER_RESULTATS = os.path.join(RACINE, "benchmarks")
+APPLICATION = os.path.join(RACINE, "streamlit_app.py")
+DELAI_PAGE = 600
+
+# Une étape est une régression si elle ralentit de plus de 20 % et d'au moins 10 ms
+SEUIL_REGRESSION = 1.2
+ECART_MIN_SECONDES = 0.01
+
+METHODES_RAPPORT = ['kpi_performance_soins', 'kpi_praticiens', 'kpi_patients', 'analyse_rfm',
+                    'kpi_paiements', 'kpi_geographie', 'kpi_temporel']
+
+
+def version_code():
+    """Commit git courant (suffixé de -modifie si l'arbre a des changements)"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RACINE,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        modifie = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=RACINE,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+        return f"{commit}-modifie" if modifie else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "inconnue"
+
+
+def machine():
+    import numpy as np
+    import pandas as pd
+    return {
+        'plateforme': platform.platform(),
+        'processeur': platform.processor() or platform.machine(),
+        'nb_cpu': os.cpu_count(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+    }
+
+
+class Chronometre:
+    """Collecte les temps des étapes d'une taille donnée"""
+
+    def __init__(self, taille):
+        self.taille = taille
+        self.repetitions = REPETITIONS if taille <= TAILLE_MAX_REPETITIONS else 1
+        self.resultats = []
+
+    def mesurer(self, etape, fonction, *args, repeter=True, **kwargs):
+        """Exécute l'étape (sorties console masquées) et renvoie son résultat"""
+        temps = []
+        for _ in range(self.repetitions if repeter else 1):
+            gc.collect()
+            with contextlib.redirect_stdout(io.StringIO()):
+                debut = time.perf_counter()
+                resultat = fonction(*args, **kwargs)
+                temps.append(time.perf_counter() - debut)
+        self.resultats.append({'taille': self.taille, 'etape': etape,
+                               'secondes': round(min(temps), 6), 'repetitions': len(temps)})
+        print(f"   {etape:<32} {min(temps):>9.3f} s")
+        return resultat
+
+
+def rapport_sur(df, cube):
+    """Rapport complet construit sur des données déjà chargées (sans relire le fichier)"""
+    rapport = RapportCompletDentaire.__new__(RapportCompletDentaire)
+    rapport.df, rapport.cube = df, cube
+    return rapport
+
+
+def benchmark_pages(chrono, chemin):
+    """Premier affichage (chargement + cube), puis chaque page, caches chauds"""
+    import streamlit as st
+    from streamlit.logger import set_log_level
+    from streamlit.testing.v1 import AppTest
+
+    os.environ['DASHBOARD_DONNEES'] = chemin
+    st.cache_resource.clear()
+    app = chrono.mesurer('dashboard_demarrage', lambda: AppTest.from_file(
+        APPLICATION, default_timeout=DELAI_PAGE).run(), repeter=False)
+    if app.exception:
+        raise RuntimeError(f"Le dashboard a échoué: {app.exception[0].message}")
+    # Les avertissements de dépréciation de Streamlit noieraient les temps (la
+    # configuration, lue au premier run, réinitialise le niveau des logs)
+    set_log_level('error')
+    navigation = app.sidebar.selectbox[1]
+    for page in navigation.options:
+        # Le libellé sans emoji sert de nom d'étape
+        etape = 'page_' + page.split(' ', 1)[1].lower().replace(' ', '_')
+        chrono.mesurer(etape, lambda: app.sidebar.selectbox[1].select(page).run())
+        if app.exception:
+            raise RuntimeError(f"La page '{page}' a échoué: {app.exception[0].message}")
+    st.cache_resource.clear()
+
+
+def benchmark_taille(nb_lignes, dossier, avec_pages=True):
+    print(f"\n📦 {nb_lignes:,} lignes")
+    chrono = Chronometre(nb_lignes)
+    chemin = os.path.join(dossier, f"patients_{nb_lignes}.csv")
+    debut = time.perf_counter()
+    generer_patients(nb_lignes).to_csv(chemin, index=False)
+    print(f"   (données générées en {time.perf_counter() - debut:.1f} s)")
+
+    # Lecture du CSV, puis cache colonnaire à froid (lecture + écriture) et à chaud
+    chrono.mesurer('chargement_source', charger_donnees, chemin, utiliser_cache=False)
+    chrono.mesurer('chargement_cache_froid', charger_donnees, chemin, repeter=False)
+    brut = chrono.mesurer('chargement_cache', charger_donnees, chemin)
+
+    df = chrono.mesurer('nettoyage', nettoyer_donnees, brut)
+    del brut
+    cube = chrono.mesurer('cube_kpi', CubeKPI.construire, df, dimensions=DIMENSIONS_RAPPORT)
+
+    rapport = rapport_sur(df, cube)
+    for methode in METHODES_RAPPORT:
+        chrono.mesurer(methode, getattr(rapport, methode))
+    chrono.mesurer('intervalles_entre_soins', intervalles_entre_soins, df)
+    del rapport, cube, df
+    gc.collect()
+
+    if avec_pages:
+        benchmark_pages(chrono, chemin)
+    return chrono.resultats
+
+
+def comparer(resultats, reference):
+    """Étapes plus lentes que dans les résultats de référence"""
+    temps_reference = {(r['taille'], r['etape']): r['secondes'] for r in reference['resultats']}
+    regressions = []
+    for r in resultats['resultats']:
+        avant = temps_reference.get((r['taille'], r['etape']))
+        if avant is None:
+            continue
+        if r['secondes'] > avant * SEUIL_REGRESSION and r['secondes'] - avant >= ECART_MIN_SECONDES:
+            regressions.append({**r, 'reference': avant, 'ratio': round(r['secondes'] / avant, 2)})
+    return regressions
+
+
+def benchmark(nb_lignes_max=TAILLE_MAX_DEFAUT, sortie=None, avec_pages=True):
+    print(f"⏱️ Suite de benchmarks (jusqu'à {nb_lignes_max:,} lignes)")
+    print("=" * 60)
+    tailles = [t for t in TAILLES if t <= nb_lignes_max] or [nb_lignes_max]
+    resultats = {
+        'version': version_code(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'machine': machine(),
+        'resultats': [],
+    }
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as dossier:
+        for nb_lignes in tailles:
+            resultats['resultats'] += benchmark_taille(nb_lignes, dossier, avec_pages)
+
+    if sortie is None:
+        os.makedirs(DOSSIER_RESULTATS, exist_ok=True)
+        sortie = os.path.join(DOSSIER_RESULTATS, f"benchmark_{resultats['version']}.json")
+    with open(sortie, 'w', encoding='utf-8') as f:
+        json.dump(resultats, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Résultats écrits dans {sortie}")
+    return resultats
+
+
+def afficher_regressions(regressions, chemin_reference):
+    if not regressions:
+        print(f"✅ Aucune régression par rapport à {chemin_reference}")
+        return
+    print(f"⚠️ {len(regressions)} régression(s) par rapport à {chemin_reference}:")
+    for r in regressions:
+        print(f"   {r['taille']:>10,} {r['etape']:<32} {r['reference']:.3f} s -> {r['secondes']:.3f} s "
+              f"(x{r['ratio']})")
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+
+    def option(nom):
+        if nom not in arguments:
+            return None
+        i = arguments.index(nom)
+        valeur = arguments[i + 1]
+        del arguments[i:i + 2]
+        return valeur
+
+    sortie, chemin_reference = option('--sortie'), option('--comparer')
+    avec_pages = '--sans-pages' not in arguments
+    arguments = [a for a in arguments if a != '--sans-pages']
+    resultats = benchmark(int(arguments[0]) if arguments else TAILLE_MAX_DEFAUT, sortie, avec_pages)
+
+    if chemin_reference:
+        with open(chemin_reference, encoding='utf-8') as f:
+            regressions = comparer(resultats, json.load(f))
+        afficher_regressions(regressions, chemin_reference)
+        sys.exit(1 if regressions else 0)
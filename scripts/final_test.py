@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chargement_donnees import charger_donnees
+
 def final_test():
     print("🧪 Test final des corrections")
     print("=" * 50)
     
     try:
         # Charger les données
-        df = pd.read_excel("patients_mis_a_jour.xlsx")
+        df = charger_donnees("patients_mis_a_jour.xlsx")
         print(f"✅ Données chargées : {len(df)} lignes")
         
         # Test de la colonne date
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Outils communs des benchmarks : soins synthétiques et chronométrage
+
+Les soins viennent de donnees_synthetiques.generer_patients (parcours de
+patients, cabinets et praticiens réalistes), typés par le pipeline de
+nettoyage partagé : chaque benchmark mesure les données que verra le
+tableau de bord, réduites aux colonnes qu'il utilise.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from donnees_synthetiques import generer_patients
+from nettoyage_donnees import nettoyer_donnees
+
+
+def soins_synthetiques(nb_lignes, colonnes=None, **parametres):
+    """Environ `nb_lignes` soins nettoyés ; paramètres de generer_patients (annees, nb_cabinets...)"""
+    return nettoyer_donnees(generer_patients(nb_lignes, categories=True, colonnes=colonnes, **parametres))
+
+
+def chronometrer(fonction, *args, **kwargs):
+    """(résultat, secondes) d'un appel"""
+    debut = time.perf_counter()
+    resultat = fonction(*args, **kwargs)
+    return resultat, time.perf_counter() - debut
+
+
+def tailles_croissantes(premiere, nb_lignes_max):
+    """premiere, 10 × premiere, ... jusqu'à nb_lignes_max"""
+    taille = premiere
+    while taille <= nb_lignes_max:
+        yield taille
+        taille *= 10
+
+
+def comparer(titre, reference, vectorise, verifier, tailles, taille_max_reference, generer,
+             libelle_reference="Origine"):
+    """Tableau des temps d'une implémentation de référence et de sa version vectorisée
+
+    Pour chaque taille, `generer(taille)` fournit les données ; la référence
+    n'est mesurée (et son résultat vérifié par `verifier(attendu, obtenu)`)
+    que jusqu'à `taille_max_reference` lignes.
+    """
+    print(f"⏱️ {titre}")
+    print("=" * 60)
+    print(f"{'Lignes':>12} {libelle_reference + ' (s)':>12} {'Vectorisé (s)':>14} {'Accélération':>13}")
+
+    for taille in tailles:
+        df = generer(taille)
+        obtenu, t_vect = chronometrer(vectorise, df)
+        if taille <= taille_max_reference:
+            attendu, t_reference = chronometrer(reference, df)
+            verifier(attendu, obtenu)
+            print(f"{len(df):>12,} {t_reference:>12.3f} {t_vect:>14.4f} {t_reference / t_vect:>12.0f}x")
+        else:
+            print(f"{len(df):>12,} {'-':>12} {t_vect:>14.4f} {'-':>13}")
+
+    print(f"\n✅ Résultats identiques à la version {libelle_reference.lower()}")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Rapport mémoire : DataFrame brut (chaînes Python) vs représentation compacte
+
+Les données sont dupliquées `facteur` fois, avec des identifiants patients
+distincts par copie, pour simuler plusieurs années de tous les sites. La RSS est mesurée dans un processus neuf par représentation,
+en rechargeant chacune depuis un cache Feather comme le fait le chargeur.
+
+Mesure actuelle : 3,8 à 3,9x de réduction de RSS (l'objectif de 4x n'est pas
+atteint, voir la docstring de nettoyage_donnees).
+
+Usage: python scripts/rapport_memoire.py [facteur]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chargement_donnees import FICHIER_DONNEES, charger_donnees, chemins_cache, lire_cache
+from nettoyage_donnees import nettoyer_donnees, rapport_memoire
+
+
+def rss_mo():
+    """Mémoire résidente du processus courant (Mo), None hors Linux"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except OSError:
+        return None
+
+
+def _mesurer_rss(chemin, compact):
+    """Exécuté dans un processus neuf : RSS ajoutée par le chargement d'une représentation"""
+    avant = rss_mo()
+    # Même lecture que charger_donnees() / charger_donnees_nettoyees()
+    df = lire_cache(chemin, chaines_arrow=compact)
+    apres = rss_mo()
+    if avant is None:
+        return None
+    return apres - avant
+
+
+def mesurer_rss(chemin, compact):
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(_mesurer_rss, (chemin, compact))
+
+
+def rapport(facteur=50, chemin=FICHIER_DONNEES):
+    brut = charger_donnees(chemin)
+    compact = nettoyer_donnees(brut)
+
+    print("🧮 RAPPORT MÉMOIRE PAR COLONNE")
+    print("=" * 60)
+    with pd.option_context('display.width', 120, 'display.max_columns', 10):
+        print(rapport_memoire(compact, brut).round(3).to_string())
+
+    # Chaque copie a ses propres patients, comme des années supplémentaires
+    brut_etendu = pd.concat([brut] * facteur, ignore_index=True)
+    copie = np.repeat(np.arange(facteur), len(brut)).astype(str)
+    brut_etendu['patientid'] = (brut_etendu['patientid'].astype(str) + '-' + copie).astype(object)
+    compact_etendu = nettoyer_donnees(brut_etendu)
+    print(f"\n📦 {len(brut_etendu):,} lignes ({facteur}x le fichier)")
+
+    with tempfile.TemporaryDirectory() as dossier:
+        fichiers = {}
+        for nom, df in [('brut', brut_etendu), ('compact', compact_etendu)]:
+            fichiers[nom] = os.path.join(dossier, f"{nom}.xlsx")
+            chemin_cache, _ = chemins_cache(fichiers[nom])
+            os.makedirs(os.path.dirname(chemin_cache), exist_ok=True)
+            feather.write_feather(df, chemin_cache, compression="uncompressed")
+        del brut_etendu, compact_etendu
+
+        rss_brut = mesurer_rss(fichiers['brut'], compact=False)
+        rss_compact = mesurer_rss(fichiers['compact'], compact=True)
+
+    if rss_brut is None:
+        print("⚠️ Mesure de la RSS indisponible sur ce système")
+        return
+    print(f"   RSS brut:    {rss_brut:,.1f} Mo")
+    print(f"   RSS compact: {rss_compact:,.1f} Mo")
+    print(f"   Réduction:   {rss_brut / rss_compact:.1f}x")
+
+
+if __name__ == "__main__":
+    rapport(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
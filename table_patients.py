@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Table de synthèse par patient, matérialisée une fois et partagée
+Auteur: Assistant IA
+Date: 2024
+
+Une ligne par patient : date du premier et du dernier soin, nombre de
+visites, montant cumulé et indicateur de fidélité. Les colonnes
+dernier_soin, frequence et montant sont celles de la base RFM :
+MoteurRFM.ajuster_agregats() lit la table telle quelle. Rétention, soins par
+patient, RFM et figures « Patients » lisent tous cette table au lieu de
+regrouper chacun les soins par patient.
+
+Tous les agrégats se fusionnent (minimum, maximum, sommes) : l'arrivée de
+nouveaux soins ne met à jour que les patients concernés. La table du
+fichier de données est rangée dans le cache Feather, à côté des soins
+nettoyés, et reconstruite quand le fichier source change.
+"""
+
+import pandas as pd
+
+from chargement_donnees import cache_valide, ecrire_cache, lire_cache
+from montants import colonnes_chf
+from nettoyage_donnees import FICHIER_DONNEES, VERSION_SCHEMA, charger_donnees_nettoyees
+from rfm import fusionner_rfm, mesures_rfm
+
+SUFFIXE_CACHE_PATIENTS = f"patients-{VERSION_SCHEMA}"
+
+# Un patient est fidèle au-delà de ce nombre de visites (2+ visites)
+SEUIL_FIDELITE = 1
+
+
+def mesures_patients(col_date='date_du_soin', col_montant='montant_total_chf'):
+    """Agrégations nommées de la table patients (groupby().agg() ou RequetesKPI.declarer_table)"""
+    return {'premier_soin': (col_date, 'min'), **mesures_rfm(col_date, col_montant)}
+
+
+def _marquer_fideles(table):
+    table['fidele'] = table['frequence'] > SEUIL_FIDELITE
+    return table
+
+
+def agreger_patients(df, col_patient='patientid', col_date='date_du_soin', col_montant='montant_total_chf'):
+    """Table patients d'un lot de soins : un seul regroupement pour toutes les colonnes"""
+    df = colonnes_chf(df, [col_patient, col_date, col_montant])
+    table = df.groupby(col_patient, observed=True, sort=False).agg(**mesures_patients(col_date, col_montant))
+    return _marquer_fideles(table)
+
+
+def fusionner_patients(base, delta):
+    """Intègre la table patients d'un delta dans la base existante
+
+    Comme fusionner_rfm : seuls les patients du delta sont modifiés, les
+    nouveaux patients sont ajoutés en fin de table, et `base` (souvent la
+    table en cache) reste intacte.
+    """
+    if base is None or len(base) == 0:
+        return delta.copy()
+
+    communs = delta.index.intersection(base.index)
+    premiers = pd.concat(
+        [base.loc[communs, 'premier_soin'], delta.loc[communs, 'premier_soin']], axis=1
+    ).min(axis=1)
+    base = fusionner_rfm(base, delta)
+    if len(communs) > 0:
+        base.loc[communs, 'premier_soin'] = premiers
+        base.loc[communs, 'fidele'] = base.loc[communs, 'frequence'] > SEUIL_FIDELITE
+    return base
+
+
+def assembler_patients(tables):
+    """Table patients de plusieurs lots de soins (ex. une table par partition de l'entrepôt)"""
+    tables = [t for t in tables if t is not None and len(t) > 0]
+    if not tables:
+        return None
+    table = pd.concat(tables).groupby(level=0, sort=False).agg(
+        {'premier_soin': 'min', 'dernier_soin': 'max', 'frequence': 'sum', 'montant': 'sum'})
+    return _marquer_fideles(table)
+
+
+def charger_table_patients(chemin=FICHIER_DONNEES, df=None, utiliser_cache=True):
+    """Table patients d'un fichier de données, lue dans le cache si elle est à jour
+
+    `df` : soins nettoyés du même fichier, s'ils sont déjà chargés (évite de
+    les relire quand la table doit être reconstruite).
+    """
+    if utiliser_cache and cache_valide(chemin, SUFFIXE_CACHE_PATIENTS):
+        try:
+            table = lire_cache(chemin, SUFFIXE_CACHE_PATIENTS, chaines_arrow=True)
+            return table.set_index(table.columns[0])
+        except Exception as e:
+            print(f"⚠️ Cache patients illisible, reconstruction: {e}")
+
+    if df is None:
+        df = charger_donnees_nettoyees(chemin, utiliser_cache=utiliser_cache)
+    table = agreger_patients(df)
+    if utiliser_cache:
+        try:
+            ecrire_cache(table.reset_index(), chemin, SUFFIXE_CACHE_PATIENTS)
+        except Exception as e:
+            print(f"⚠️ Impossible d'écrire le cache patients: {e}")
+    return table
@@ -3,349 +3,602 @@
 Visualisations graphiques des KPIs d'un cabinet dentaire multi-sites
 Auteur: Assistant IA
 Date: 2024
+
+Chaque famille de figures est séparée en deux étapes : le calcul des agrégats
+(méthodes agregats_* de VisualisationsDentaire) et le tracé (fonctions
+tracer_*, qui ne dépendent que des agrégats). Le mode par lot trace les
+familles dans un pool de processus, sur le backend Agg et sans plt.show().
+Les images passent par le cache de figures (cache_figures.py) : une figure
+dont les agrégats ont déjà été rendus n'est pas retracée.
+
+Usage: python visualisations_kpis.py [--headless] [--processus N]
 """
 
+import hashlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
 import pandas as pd
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
 import seaborn as sns
 from datetime import datetime, timedelta
 import warnings
 warnings.filterwarnings('ignore')
 
+from cache_figures import CacheFigures, DOSSIER_FIGURES
+from mesures_performance import instrumenter_classe
+from nettoyage_donnees import charger_donnees_nettoyees, nettoyer_donnees
+from rfm import MoteurRFM
+from table_patients import agreger_patients
+
 # Configuration pour les graphiques
 plt.style.use('seaborn-v0_8')
 sns.set_palette("husl")
 plt.rcParams['figure.figsize'] = (12, 8)
 plt.rcParams['font.size'] = 10
 
+FICHIERS_FIGURES = {
+    'soins': 'performance_soins.png',
+    'praticiens': 'analyse_praticiens.png',
+    'patients': 'analyse_patients.png',
+    'paiements': 'analyse_paiements.png',
+    'geographie': 'analyse_geographie.png',
+    'temporel': 'analyse_temporelle.png',
+}
+DPI_FIGURES = 300
+# Backends qui ne font qu'écrire des fichiers : inutile d'y tracer une figure déjà en cache
+BACKENDS_SANS_AFFICHAGE = {'agg', 'cairo', 'pdf', 'pgf', 'ps', 'svg', 'template'}
+# À incrémenter quand le code de tracé change : les figures existantes sont alors retracées
+VERSION_TRACES = 1
+
+
+def tracer_soins(a):
+    """🦷 Figure - Performance des soins"""
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    fig.suptitle('🦷 PERFORMANCE DES SOINS', fontsize=16, fontweight='bold')
+
+    # 1. Top 10 soins par CA
+    if 'top_soins' in a:
+        top_soins = a['top_soins']
+        axes[0, 0].barh(range(len(top_soins)), top_soins.values)
+        axes[0, 0].set_yticks(range(len(top_soins)))
+        axes[0, 0].set_yticklabels(top_soins.index, fontsize=8)
+        axes[0, 0].set_title('Top 10 Soins par Chiffre d\'Affaires')
+        axes[0, 0].set_xlabel('Chiffre d\'Affaires (CHF)')
+
+        # 2. Distribution des montants par soin
+        axes[0, 1].hist(a['montants'], bins=30, alpha=0.7, edgecolor='black')
+        axes[0, 1].set_title('Distribution des Montants')
+        axes[0, 1].set_xlabel('Montant (CHF)')
+        axes[0, 1].set_ylabel('Fréquence')
+
+        # 3. Nombre d'actes par soin
+        actes_par_soin = a['actes_par_soin']
+        axes[1, 0].bar(range(len(actes_par_soin)), actes_par_soin.values)
+        axes[1, 0].set_xticks(range(len(actes_par_soin)))
+        axes[1, 0].set_xticklabels(actes_par_soin.index, rotation=45, ha='right', fontsize=8)
+        axes[1, 0].set_title('Nombre d\'Actes par Type de Soin')
+        axes[1, 0].set_ylabel('Nombre d\'Actes')
+
+        # 4. CA moyen par soin
+        ca_moyen = a['ca_moyen']
+        axes[1, 1].bar(range(len(ca_moyen)), ca_moyen.values)
+        axes[1, 1].set_xticks(range(len(ca_moyen)))
+        axes[1, 1].set_xticklabels(ca_moyen.index, rotation=45, ha='right', fontsize=8)
+        axes[1, 1].set_title('CA Moyen par Type de Soin')
+        axes[1, 1].set_ylabel('CA Moyen (CHF)')
+
+    fig.tight_layout()
+    return fig
+
+
+def tracer_praticiens(a):
+    """👨‍⚕️ Figure - Praticiens"""
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    fig.suptitle('👨‍⚕️ ANALYSE DES PRATICIENS', fontsize=16, fontweight='bold')
+
+    # 1. CA par praticien
+    ca_praticien = a['ca_praticien']
+    axes[0, 0].bar(range(len(ca_praticien)), ca_praticien.values)
+    axes[0, 0].set_xticks(range(len(ca_praticien)))
+    axes[0, 0].set_xticklabels(ca_praticien.index, rotation=45, ha='right')
+    axes[0, 0].set_title('CA Total par Praticien')
+    axes[0, 0].set_ylabel('CA (CHF)')
+
+    # 2. Nombre d'actes par praticien
+    actes_praticien = a['actes_praticien']
+    axes[0, 1].bar(range(len(actes_praticien)), actes_praticien.values)
+    axes[0, 1].set_xticks(range(len(actes_praticien)))
+    axes[0, 1].set_xticklabels(actes_praticien.index, rotation=45, ha='right')
+    axes[0, 1].set_title('Nombre d\'Actes par Praticien')
+    axes[0, 1].set_ylabel('Nombre d\'Actes')
+
+    # 3. CA moyen par acte par praticien
+    ca_moyen_praticien = a['ca_moyen_praticien']
+    axes[1, 0].bar(range(len(ca_moyen_praticien)), ca_moyen_praticien.values)
+    axes[1, 0].set_xticks(range(len(ca_moyen_praticien)))
+    axes[1, 0].set_xticklabels(ca_moyen_praticien.index, rotation=45, ha='right')
+    axes[1, 0].set_title('CA Moyen par Acte par Praticien')
+    axes[1, 0].set_ylabel('CA Moyen (CHF)')
+
+    # 4. Distribution des montants par praticien
+    axes[1, 1].boxplot(a['montants_par_praticien'])
+    axes[1, 1].set_xticklabels(a['praticiens'], rotation=45, ha='right')
+    axes[1, 1].set_title('Distribution des Montants par Praticien')
+    axes[1, 1].set_ylabel('Montant (CHF)')
+
+    fig.tight_layout()
+    return fig
+
+
+def tracer_patients(a):
+    """🧑‍🤝‍🧑 Figure - Patients"""
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    fig.suptitle('🧑‍🤝‍🧑 ANALYSE DES PATIENTS', fontsize=16, fontweight='bold')
+
+    # 1. Distribution du nombre de visites par patient
+    axes[0, 0].hist(a['visites_par_patient'], bins=20, alpha=0.7, edgecolor='black')
+    axes[0, 0].set_title('Distribution du Nombre de Visites par Patient')
+    axes[0, 0].set_xlabel('Nombre de Visites')
+    axes[0, 0].set_ylabel('Nombre de Patients')
+
+    # 2. Montant total par patient
+    axes[0, 1].hist(a['montant_par_patient'], bins=30, alpha=0.7, edgecolor='black')
+    axes[0, 1].set_title('Distribution du Montant Total par Patient')
+    axes[0, 1].set_xlabel('Montant Total (CHF)')
+    axes[0, 1].set_ylabel('Nombre de Patients')
+
+    # 3. Analyse RFM si date disponible
+    if 'rfm' in a:
+        rfm = a['rfm']
+
+        # Scatter plot Récence vs Fréquence
+        axes[1, 0].scatter(rfm['recence'], rfm['frequence'], alpha=0.6)
+        axes[1, 0].set_title('Récence vs Fréquence')
+        axes[1, 0].set_xlabel('Récence (jours)')
+        axes[1, 0].set_ylabel('Fréquence (nombre de visites)')
+
+        # Scatter plot Fréquence vs Montant
+        axes[1, 1].scatter(rfm['frequence'], rfm['montant'], alpha=0.6)
+        axes[1, 1].set_title('Fréquence vs Montant')
+        axes[1, 1].set_xlabel('Fréquence (nombre de visites)')
+        axes[1, 1].set_ylabel('Montant Total (CHF)')
+
+    fig.tight_layout()
+    return fig
+
+
+def tracer_paiements(a):
+    """💰 Figure - Paiements"""
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    fig.suptitle('💰 ANALYSE DES PAIEMENTS', fontsize=16, fontweight='bold')
+
+    # 1. Distribution des délais de paiement
+    axes[0, 0].hist(a['delais'], bins=30, alpha=0.7, edgecolor='black')
+    axes[0, 0].axvline(x=30, color='red', linestyle='--', label='Seuil 30 jours')
+    axes[0, 0].set_title('Distribution des Délais de Paiement')
+    axes[0, 0].set_xlabel('Délai (jours)')
+    axes[0, 0].set_ylabel('Nombre de Paiements')
+    axes[0, 0].legend()
+
+    # 2. Montants en retard
+    if len(a['montants_retard']) > 0:
+        axes[0, 1].hist(a['montants_retard'], bins=20, alpha=0.7, edgecolor='black', color='red')
+        axes[0, 1].set_title('Distribution des Montants en Retard')
+        axes[0, 1].set_xlabel('Montant (CHF)')
+        axes[0, 1].set_ylabel('Nombre de Paiements')
+
+    # 3. Retards par type de soin
+    if 'retards_par_soin' in a:
+        retards_par_soin = a['retards_par_soin']
+        axes[1, 0].bar(range(len(retards_par_soin)), retards_par_soin.values, color='red')
+        axes[1, 0].set_xticks(range(len(retards_par_soin)))
+        axes[1, 0].set_xticklabels(retards_par_soin.index, rotation=45, ha='right')
+        axes[1, 0].set_title('Montants en Retard par Type de Soin')
+        axes[1, 0].set_ylabel('Montant en Retard (CHF)')
+
+    # 4. Évolution des retards dans le temps
+    retards_temporel = a['retards_temporel']
+    axes[1, 1].plot(range(len(retards_temporel)), retards_temporel.values, marker='o')
+    axes[1, 1].set_title('Évolution des Paiements en Retard')
+    axes[1, 1].set_xlabel('Mois')
+    axes[1, 1].set_ylabel('Nombre de Paiements en Retard')
+
+    fig.tight_layout()
+    return fig
+
+
+def tracer_geographie(a):
+    """🏥 Figure - Géographie"""
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    fig.suptitle('🏥 ANALYSE GÉOGRAPHIQUE', fontsize=16, fontweight='bold')
+
+    # 1. CA par clinique
+    if 'ca_clinique' in a:
+        ca_clinique = a['ca_clinique']
+        axes[0, 0].bar(range(len(ca_clinique)), ca_clinique.values)
+        axes[0, 0].set_xticks(range(len(ca_clinique)))
+        axes[0, 0].set_xticklabels(ca_clinique.index, rotation=45, ha='right')
+        axes[0, 0].set_title('CA par Clinique')
+        axes[0, 0].set_ylabel('CA (CHF)')
+
+    # 2. Patients par région
+    if 'patients_region' in a:
+        patients_region = a['patients_region']
+        axes[0, 1].bar(range(len(patients_region)), patients_region.values)
+        axes[0, 1].set_xticks(range(len(patients_region)))
+        axes[0, 1].set_xticklabels(patients_region.index, rotation=45, ha='right')
+        axes[0, 1].set_title('Nombre de Patients par Région')
+        axes[0, 1].set_ylabel('Nombre de Patients')
+
+    # 3. CA moyen par région
+    if 'ca_moyen_region' in a:
+        ca_moyen_region = a['ca_moyen_region']
+        axes[1, 0].bar(range(len(ca_moyen_region)), ca_moyen_region.values)
+        axes[1, 0].set_xticks(range(len(ca_moyen_region)))
+        axes[1, 0].set_xticklabels(ca_moyen_region.index, rotation=45, ha='right')
+        axes[1, 0].set_title('CA Moyen par Région')
+        axes[1, 0].set_ylabel('CA Moyen (CHF)')
+
+    # 4. Distribution géographique des soins
+    if 'soins_region' in a:
+        a['soins_region'].plot(kind='bar', ax=axes[1, 1], stacked=True)
+        axes[1, 1].set_title('Répartition des Soins par Région')
+        axes[1, 1].set_xlabel('Région')
+        axes[1, 1].set_ylabel('Nombre de Soins')
+        axes[1, 1].legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+
+    fig.tight_layout()
+    return fig
+
+
+def tracer_temporel(a):
+    """📅 Figure - Temporel"""
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+    fig.suptitle('📅 ANALYSE TEMPORELLE', fontsize=16, fontweight='bold')
+
+    # 1. CA mensuel
+    ca_mensuel = a['ca_mensuel']
+    axes[0, 0].plot(range(len(ca_mensuel)), ca_mensuel.values, marker='o', linewidth=2)
+    axes[0, 0].set_title('Évolution du CA Mensuel')
+    axes[0, 0].set_xlabel('Mois')
+    axes[0, 0].set_ylabel('CA (CHF)')
+    axes[0, 0].grid(True, alpha=0.3)
+
+    # 2. Patients par mois
+    patients_mensuel = a['patients_mensuel']
+    axes[0, 1].plot(range(len(patients_mensuel)), patients_mensuel.values, marker='s', linewidth=2, color='orange')
+    axes[0, 1].set_title('Évolution du Nombre de Patients')
+    axes[0, 1].set_xlabel('Mois')
+    axes[0, 1].set_ylabel('Nombre de Patients')
+    axes[0, 1].grid(True, alpha=0.3)
+
+    # 3. Saisonnalité
+    saisonnalite = a['saisonnalite']
+    axes[1, 0].bar(saisonnalite.index, saisonnalite.values)
+    axes[1, 0].set_title('Saisonnalité - CA par Mois')
+    axes[1, 0].set_xlabel('Mois')
+    axes[1, 0].set_ylabel('CA (CHF)')
+    axes[1, 0].set_xticks(range(1, 13))
+
+    # 4. Répartition des soins par jour de la semaine
+    soins_jour = a['soins_jour']
+    axes[1, 1].bar(range(len(soins_jour)), soins_jour.values)
+    axes[1, 1].set_xticks(range(len(soins_jour)))
+    axes[1, 1].set_xticklabels(soins_jour.index, rotation=45)
+    axes[1, 1].set_title('Répartition des Soins par Jour de la Semaine')
+    axes[1, 1].set_ylabel('Nombre de Soins')
+
+    fig.tight_layout()
+    return fig
+
+
+TRACEURS = {
+    'soins': tracer_soins,
+    'praticiens': tracer_praticiens,
+    'patients': tracer_patients,
+    'paiements': tracer_paiements,
+    'geographie': tracer_geographie,
+    'temporel': tracer_temporel,
+}
+
+
+def _mettre_a_jour_empreinte(h, valeur):
+    if isinstance(valeur, (pd.Series, pd.DataFrame)):
+        h.update(repr((type(valeur).__name__, valeur.shape, list(valeur.index.names),
+                       [str(t) for t in np.atleast_1d(valeur.dtypes)],
+                       list(valeur.columns) if isinstance(valeur, pd.DataFrame) else valeur.name)).encode())
+        h.update(pd.util.hash_pandas_object(valeur, index=True).to_numpy().tobytes())
+    elif isinstance(valeur, np.ndarray):
+        h.update(repr((valeur.dtype.str, valeur.shape)).encode())
+        h.update(np.ascontiguousarray(valeur).tobytes())
+    elif isinstance(valeur, (list, tuple)):
+        h.update(f"seq{len(valeur)}".encode())
+        for element in valeur:
+            _mettre_a_jour_empreinte(h, element)
+    elif isinstance(valeur, dict):
+        for cle in sorted(valeur):
+            h.update(repr(cle).encode())
+            _mettre_a_jour_empreinte(h, valeur[cle])
+    else:
+        h.update(repr(valeur).encode())
+
+
+def empreinte_agregats(agregats, **parametres):
+    """Empreinte SHA-256 des agrégats d'une figure et de ses paramètres de rendu"""
+    h = hashlib.sha256()
+    _mettre_a_jour_empreinte(h, {'agregats': agregats, 'parametres': parametres,
+                                 'version': VERSION_TRACES})
+    return h.hexdigest()
+
+
+def backend_interactif():
+    """Le backend matplotlib courant affiche-t-il les figures ? (plt.show() est sans effet sur Agg)"""
+    return matplotlib.get_backend().lower() not in BACKENDS_SANS_AFFICHAGE
+
+
+def _initialiser_processus():
+    # Backend sans affichage : les processus du pool ne doivent jamais ouvrir de fenêtre
+    matplotlib.use('Agg', force=True)
+
+
+def rendre_figure(famille, agregats, chemin, dpi=DPI_FIGURES):
+    """Trace une famille de figures et l'enregistre, sans affichage"""
+    fig = TRACEURS[famille](agregats)
+    fig.savefig(chemin, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return chemin
+
+
+@instrumenter_classe(prefixes=('nettoyer_', 'agregats_', 'visualiser_', 'rendre_', 'generer_'))
 class VisualisationsDentaire:
     def __init__(self, fichier_donnees="patients_mis_a_jour.xlsx"):
         """Initialisation des visualisations"""
         print("🦷 Chargement des données pour visualisations...")
-        self.df = pd.read_excel(fichier_donnees)
+        self.df = charger_donnees_nettoyees(fichier_donnees)
         print(f"✅ Données chargées: {self.df.shape[0]} lignes, {self.df.shape[1]} colonnes")
-        
-        # Nettoyage initial
-        self.nettoyer_donnees()
-        
+
     def nettoyer_donnees(self):
         """Nettoyage et préparation des données"""
         print("🧹 Nettoyage des données...")
-        
-        # Conversion des colonnes de dates
-        colonnes_dates = self.df.select_dtypes(include=['object']).columns
-        for col in colonnes_dates:
-            if 'date' in col.lower() or 'jour' in col.lower():
-                try:
-                    self.df[col] = pd.to_datetime(self.df[col], errors='coerce')
-                except:
-                    pass
-        
-        # Nettoyage des colonnes numériques
-        colonnes_numeriques = self.df.select_dtypes(include=[np.number]).columns
-        for col in colonnes_numeriques:
-            self.df[col] = pd.to_numeric(self.df[col], errors='coerce')
-    
-    def visualiser_performance_soins(self):
+        self.df = nettoyer_donnees(self.df)
+
+    def agregats_soins(self):
+        """Agrégats de la figure « Performance des soins »"""
+        a = {}
+        if 'type_soin' in self.df.columns and 'montant' in self.df.columns:
+            a['top_soins'] = self.df.groupby('type_soin')['montant'].sum().sort_values(ascending=False).head(10)
+            a['montants'] = self.df['montant'].to_numpy()
+            a['actes_par_soin'] = self.df.groupby('type_soin').size().sort_values(ascending=False).head(10)
+            a['ca_moyen'] = self.df.groupby('type_soin')['montant'].mean().sort_values(ascending=False).head(10)
+        return a
+
+    def agregats_praticiens(self):
+        """Agrégats de la figure « Praticiens » (None si les colonnes manquent)"""
+        if 'praticien' not in self.df.columns or 'montant' not in self.df.columns:
+            return None
+        groupes = self.df.groupby('praticien', sort=False)['montant']
+        return {
+            'ca_praticien': self.df.groupby('praticien')['montant'].sum().sort_values(ascending=False),
+            'actes_praticien': self.df.groupby('praticien').size().sort_values(ascending=False),
+            'ca_moyen_praticien': self.df.groupby('praticien')['montant'].mean().sort_values(ascending=False),
+            # Ordre d'apparition des praticiens, comme unique()
+            'praticiens': list(groupes.groups),
+            'montants_par_praticien': [g.to_numpy() for _, g in groupes],
+        }
+
+    def agregats_patients(self):
+        """Agrégats de la figure « Patients » (None si les colonnes manquent)"""
+        if not {'patient_id', 'date_soin', 'montant'} <= set(self.df.columns):
+            return None
+        # Un seul regroupement par patient pour les trois graphiques
+        patients = agreger_patients(self.df, col_patient='patient_id', col_date='date_soin', col_montant='montant')
+        return {
+            'visites_par_patient': patients['frequence'],
+            'montant_par_patient': patients['montant'],
+            # Date de référence fixe (dernier soin) : même figure à données identiques
+            'rfm': MoteurRFM().ajuster_agregats(patients)[['recence', 'frequence', 'montant']],
+        }
+
+    def agregats_paiements(self):
+        """Agrégats de la figure « Paiements » (None si les colonnes manquent)"""
+        if 'date_paiement' not in self.df.columns or 'date_soin' not in self.df.columns:
+            return None
+        delais = (self.df['date_paiement'] - self.df['date_soin']).dt.days
+        retards = self.df[delais > 30]
+        a = {
+            'delais': delais,
+            'montants_retard': retards['montant'].to_numpy(),
+            'retards_temporel': retards.groupby(retards['date_soin'].dt.to_period('M')).size(),
+        }
+        if 'type_soin' in self.df.columns and len(retards) > 0:
+            a['retards_par_soin'] = retards.groupby('type_soin')['montant'].sum().sort_values(ascending=False).head(10)
+        return a
+
+    def agregats_geographie(self):
+        """Agrégats de la figure « Géographie »"""
+        a = {}
+        if 'clinique' in self.df.columns:
+            a['ca_clinique'] = self.df.groupby('clinique')['montant'].sum().sort_values(ascending=False)
+        if 'region' in self.df.columns and 'patient_id' in self.df.columns:
+            a['patients_region'] = self.df.groupby('region')['patient_id'].nunique().sort_values(ascending=False)
+        if 'region' in self.df.columns:
+            a['ca_moyen_region'] = self.df.groupby('region')['montant'].mean().sort_values(ascending=False)
+        if 'region' in self.df.columns and 'type_soin' in self.df.columns:
+            a['soins_region'] = self.df.groupby(['region', 'type_soin']).size().unstack(fill_value=0)
+        return a
+
+    def agregats_temporel(self):
+        """Agrégats de la figure « Temporel » (None si les colonnes manquent)"""
+        if 'date_soin' not in self.df.columns:
+            return None
+        dates = self.df['date_soin']
+        return {
+            'ca_mensuel': self.df.groupby(dates.dt.to_period('M'))['montant'].sum(),
+            'patients_mensuel': self.df.groupby(dates.dt.to_period('M'))['patient_id'].nunique(),
+            'saisonnalite': self.df.groupby(dates.dt.month)['montant'].sum(),
+            'soins_jour': self.df.groupby(dates.dt.day_name()).size(),
+        }
+
+    def agregats(self, famille):
+        """Agrégats d'une famille de figures (None : figure non produite)"""
+        return getattr(self, f"agregats_{famille}")()
+
+    def cache_figures(self, dossier=DOSSIER_FIGURES):
+        """Cache des figures rendues dans `dossier` (une instance par dossier)"""
+        caches = self.__dict__.setdefault('_caches_figures', {})
+        if dossier not in caches:
+            caches[dossier] = CacheFigures(os.path.join(dossier, 'cache'))
+        return caches[dossier]
+
+    def _visualiser(self, famille, dossier=DOSSIER_FIGURES):
+        """Enregistre une famille dans `dossier` via le cache et l'affiche
+
+        La figure n'est tracée que si ses agrégats manquent au cache ou si
+        elle doit être affichée (backend interactif), puis fermée.
+        """
+        agregats = self.agregats(famille)
+        if agregats is None:
+            return
+        cache = self.cache_figures(dossier)
+        empreinte = empreinte_agregats(agregats, famille=famille, dpi=DPI_FIGURES)
+        chemin = cache.lire(empreinte)
+        afficher = backend_interactif()
+        if chemin is None or afficher:
+            fig = TRACEURS[famille](agregats)
+            if chemin is None:
+                chemin = cache.ecrire(empreinte, lambda c: fig.savefig(c, dpi=DPI_FIGURES, bbox_inches='tight',
+                                                                        format='png'))
+            if afficher:
+                plt.show()
+            plt.close(fig)
+        cache.publier(chemin, os.path.join(dossier, FICHIERS_FIGURES[famille]))
+
+    def visualiser_performance_soins(self, dossier=DOSSIER_FIGURES):
         """🦷 Visualisations - Performance des soins"""
         print("📊 Génération des graphiques - Performance des soins...")
-        
-        fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-        fig.suptitle('🦷 PERFORMANCE DES SOINS', fontsize=16, fontweight='bold')
-        
-        # 1. Top 10 soins par CA
-        if 'type_soin' in self.df.columns and 'montant' in self.df.columns:
-            top_soins = self.df.groupby('type_soin')['montant'].sum().sort_values(ascending=False).head(10)
-            
-            axes[0, 0].barh(range(len(top_soins)), top_soins.values)
-            axes[0, 0].set_yticks(range(len(top_soins)))
-            axes[0, 0].set_yticklabels(top_soins.index, fontsize=8)
-            axes[0, 0].set_title('Top 10 Soins par Chiffre d\'Affaires')
-            axes[0, 0].set_xlabel('Chiffre d\'Affaires (CHF)')
-            
-            # 2. Distribution des montants par soin
-            axes[0, 1].hist(self.df['montant'], bins=30, alpha=0.7, edgecolor='black')
-            axes[0, 1].set_title('Distribution des Montants')
-            axes[0, 1].set_xlabel('Montant (CHF)')
-            axes[0, 1].set_ylabel('Fréquence')
-            
-            # 3. Nombre d'actes par soin
-            actes_par_soin = self.df.groupby('type_soin').size().sort_values(ascending=False).head(10)
-            axes[1, 0].bar(range(len(actes_par_soin)), actes_par_soin.values)
-            axes[1, 0].set_xticks(range(len(actes_par_soin)))
-            axes[1, 0].set_xticklabels(actes_par_soin.index, rotation=45, ha='right', fontsize=8)
-            axes[1, 0].set_title('Nombre d\'Actes par Type de Soin')
-            axes[1, 0].set_ylabel('Nombre d\'Actes')
-            
-            # 4. CA moyen par soin
-            ca_moyen = self.df.groupby('type_soin')['montant'].mean().sort_values(ascending=False).head(10)
-            axes[1, 1].bar(range(len(ca_moyen)), ca_moyen.values)
-            axes[1, 1].set_xticks(range(len(ca_moyen)))
-            axes[1, 1].set_xticklabels(ca_moyen.index, rotation=45, ha='right', fontsize=8)
-            axes[1, 1].set_title('CA Moyen par Type de Soin')
-            axes[1, 1].set_ylabel('CA Moyen (CHF)')
-        
-        plt.tight_layout()
-        plt.savefig('performance_soins.png', dpi=300, bbox_inches='tight')
-        plt.show()
-    
-    def visualiser_praticiens(self):
+        self._visualiser('soins', dossier)
+
+    def visualiser_praticiens(self, dossier=DOSSIER_FIGURES):
         """👨‍⚕️ Visualisations - Praticiens"""
         print("📊 Génération des graphiques - Praticiens...")
-        
-        if 'praticien' in self.df.columns and 'montant' in self.df.columns:
-            fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-            fig.suptitle('👨‍⚕️ ANALYSE DES PRATICIENS', fontsize=16, fontweight='bold')
-            
-            # 1. CA par praticien
-            ca_praticien = self.df.groupby('praticien')['montant'].sum().sort_values(ascending=False)
-            axes[0, 0].bar(range(len(ca_praticien)), ca_praticien.values)
-            axes[0, 0].set_xticks(range(len(ca_praticien)))
-            axes[0, 0].set_xticklabels(ca_praticien.index, rotation=45, ha='right')
-            axes[0, 0].set_title('CA Total par Praticien')
-            axes[0, 0].set_ylabel('CA (CHF)')
-            
-            # 2. Nombre d'actes par praticien
-            actes_praticien = self.df.groupby('praticien').size().sort_values(ascending=False)
-            axes[0, 1].bar(range(len(actes_praticien)), actes_praticien.values)
-            axes[0, 1].set_xticks(range(len(actes_praticien)))
-            axes[0, 1].set_xticklabels(actes_praticien.index, rotation=45, ha='right')
-            axes[0, 1].set_title('Nombre d\'Actes par Praticien')
-            axes[0, 1].set_ylabel('Nombre d\'Actes')
-            
-            # 3. CA moyen par acte par praticien
-            ca_moyen_praticien = self.df.groupby('praticien')['montant'].mean().sort_values(ascending=False)
-            axes[1, 0].bar(range(len(ca_moyen_praticien)), ca_moyen_praticien.values)
-            axes[1, 0].set_xticks(range(len(ca_moyen_praticien)))
-            axes[1, 0].set_xticklabels(ca_moyen_praticien.index, rotation=45, ha='right')
-            axes[1, 0].set_title('CA Moyen par Acte par Praticien')
-            axes[1, 0].set_ylabel('CA Moyen (CHF)')
-            
-            # 4. Distribution des montants par praticien
-            axes[1, 1].boxplot([self.df[self.df['praticien'] == p]['montant'] for p in self.df['praticien'].unique()])
-            axes[1, 1].set_xticklabels(self.df['praticien'].unique(), rotation=45, ha='right')
-            axes[1, 1].set_title('Distribution des Montants par Praticien')
-            axes[1, 1].set_ylabel('Montant (CHF)')
-            
-            plt.tight_layout()
-            plt.savefig('analyse_praticiens.png', dpi=300, bbox_inches='tight')
-            plt.show()
-    
-    def visualiser_patients(self):
+        self._visualiser('praticiens', dossier)
+
+    def visualiser_patients(self, dossier=DOSSIER_FIGURES):
         """🧑‍🤝‍🧑 Visualisations - Patients"""
         print("📊 Génération des graphiques - Patients...")
-        
-        if 'patient_id' in self.df.columns:
-            fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-            fig.suptitle('🧑‍🤝‍🧑 ANALYSE DES PATIENTS', fontsize=16, fontweight='bold')
-            
-            # 1. Distribution du nombre de visites par patient
-            visites_par_patient = self.df.groupby('patient_id').size()
-            axes[0, 0].hist(visites_par_patient, bins=20, alpha=0.7, edgecolor='black')
-            axes[0, 0].set_title('Distribution du Nombre de Visites par Patient')
-            axes[0, 0].set_xlabel('Nombre de Visites')
-            axes[0, 0].set_ylabel('Nombre de Patients')
-            
-            # 2. Montant total par patient
-            montant_par_patient = self.df.groupby('patient_id')['montant'].sum()
-            axes[0, 1].hist(montant_par_patient, bins=30, alpha=0.7, edgecolor='black')
-            axes[0, 1].set_title('Distribution du Montant Total par Patient')
-            axes[0, 1].set_xlabel('Montant Total (CHF)')
-            axes[0, 1].set_ylabel('Nombre de Patients')
-            
-            # 3. Analyse RFM si date disponible
-            if 'date_soin' in self.df.columns:
-                rfm = self.df.groupby('patient_id').agg({
-                    'date_soin': lambda x: (pd.Timestamp.now() - x.max()).days,
-                    'patient_id': 'count',
-                    'montant': 'sum'
-                }).rename(columns={'date_soin': 'recence', 'patient_id': 'frequence', 'montant': 'montant'})
-                
-                # Scatter plot Récence vs Fréquence
-                axes[1, 0].scatter(rfm['recence'], rfm['frequence'], alpha=0.6)
-                axes[1, 0].set_title('Récence vs Fréquence')
-                axes[1, 0].set_xlabel('Récence (jours)')
-                axes[1, 0].set_ylabel('Fréquence (nombre de visites)')
-                
-                # Scatter plot Fréquence vs Montant
-                axes[1, 1].scatter(rfm['frequence'], rfm['montant'], alpha=0.6)
-                axes[1, 1].set_title('Fréquence vs Montant')
-                axes[1, 1].set_xlabel('Fréquence (nombre de visites)')
-                axes[1, 1].set_ylabel('Montant Total (CHF)')
-            
-            plt.tight_layout()
-            plt.savefig('analyse_patients.png', dpi=300, bbox_inches='tight')
-            plt.show()
-    
-    def visualiser_paiements(self):
+        self._visualiser('patients', dossier)
+
+    def visualiser_paiements(self, dossier=DOSSIER_FIGURES):
         """💰 Visualisations - Paiements"""
         print("📊 Génération des graphiques - Paiements...")
-        
-        if 'date_paiement' in self.df.columns and 'date_soin' in self.df.columns:
-            fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-            fig.suptitle('💰 ANALYSE DES PAIEMENTS', fontsize=16, fontweight='bold')
-            
-            # Calcul des délais de paiement
-            self.df['delai_paiement'] = (self.df['date_paiement'] - self.df['date_soin']).dt.days
-            
-            # 1. Distribution des délais de paiement
-            axes[0, 0].hist(self.df['delai_paiement'], bins=30, alpha=0.7, edgecolor='black')
-            axes[0, 0].axvline(x=30, color='red', linestyle='--', label='Seuil 30 jours')
-            axes[0, 0].set_title('Distribution des Délais de Paiement')
-            axes[0, 0].set_xlabel('Délai (jours)')
-            axes[0, 0].set_ylabel('Nombre de Paiements')
-            axes[0, 0].legend()
-            
-            # 2. Montants en retard
-            retards = self.df[self.df['delai_paiement'] > 30]
-            if len(retards) > 0:
-                axes[0, 1].hist(retards['montant'], bins=20, alpha=0.7, edgecolor='black', color='red')
-                axes[0, 1].set_title('Distribution des Montants en Retard')
-                axes[0, 1].set_xlabel('Montant (CHF)')
-                axes[0, 1].set_ylabel('Nombre de Paiements')
-            
-            # 3. Retards par type de soin
-            if 'type_soin' in self.df.columns and len(retards) > 0:
-                retards_par_soin = retards.groupby('type_soin')['montant'].sum().sort_values(ascending=False).head(10)
-                axes[1, 0].bar(range(len(retards_par_soin)), retards_par_soin.values, color='red')
-                axes[1, 0].set_xticks(range(len(retards_par_soin)))
-                axes[1, 0].set_xticklabels(retards_par_soin.index, rotation=45, ha='right')
-                axes[1, 0].set_title('Montants en Retard par Type de Soin')
-                axes[1, 0].set_ylabel('Montant en Retard (CHF)')
-            
-            # 4. Évolution des retards dans le temps
-            if 'date_soin' in self.df.columns:
-                retards_temporel = retards.groupby(retards['date_soin'].dt.to_period('M')).size()
-                axes[1, 1].plot(range(len(retards_temporel)), retards_temporel.values, marker='o')
-                axes[1, 1].set_title('Évolution des Paiements en Retard')
-                axes[1, 1].set_xlabel('Mois')
-                axes[1, 1].set_ylabel('Nombre de Paiements en Retard')
-            
-            plt.tight_layout()
-            plt.savefig('analyse_paiements.png', dpi=300, bbox_inches='tight')
-            plt.show()
-    
-    def visualiser_geographie(self):
+        self._visualiser('paiements', dossier)
+
+    def visualiser_geographie(self, dossier=DOSSIER_FIGURES):
         """🏥 Visualisations - Géographie"""
         print("📊 Génération des graphiques - Géographie...")
-        
-        fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-        fig.suptitle('🏥 ANALYSE GÉOGRAPHIQUE', fontsize=16, fontweight='bold')
-        
-        # 1. CA par clinique
-        if 'clinique' in self.df.columns:
-            ca_clinique = self.df.groupby('clinique')['montant'].sum().sort_values(ascending=False)
-            axes[0, 0].bar(range(len(ca_clinique)), ca_clinique.values)
-            axes[0, 0].set_xticks(range(len(ca_clinique)))
-            axes[0, 0].set_xticklabels(ca_clinique.index, rotation=45, ha='right')
-            axes[0, 0].set_title('CA par Clinique')
-            axes[0, 0].set_ylabel('CA (CHF)')
-        
-        # 2. Patients par région
-        if 'region' in self.df.columns and 'patient_id' in self.df.columns:
-            patients_region = self.df.groupby('region')['patient_id'].nunique().sort_values(ascending=False)
-            axes[0, 1].bar(range(len(patients_region)), patients_region.values)
-            axes[0, 1].set_xticks(range(len(patients_region)))
-            axes[0, 1].set_xticklabels(patients_region.index, rotation=45, ha='right')
-            axes[0, 1].set_title('Nombre de Patients par Région')
-            axes[0, 1].set_ylabel('Nombre de Patients')
-        
-        # 3. CA moyen par région
-        if 'region' in self.df.columns:
-            ca_moyen_region = self.df.groupby('region')['montant'].mean().sort_values(ascending=False)
-            axes[1, 0].bar(range(len(ca_moyen_region)), ca_moyen_region.values)
-            axes[1, 0].set_xticks(range(len(ca_moyen_region)))
-            axes[1, 0].set_xticklabels(ca_moyen_region.index, rotation=45, ha='right')
-            axes[1, 0].set_title('CA Moyen par Région')
-            axes[1, 0].set_ylabel('CA Moyen (CHF)')
-        
-        # 4. Distribution géographique des soins
-        if 'region' in self.df.columns and 'type_soin' in self.df.columns:
-            soins_region = self.df.groupby(['region', 'type_soin']).size().unstack(fill_value=0)
-            soins_region.plot(kind='bar', ax=axes[1, 1], stacked=True)
-            axes[1, 1].set_title('Répartition des Soins par Région')
-            axes[1, 1].set_xlabel('Région')
-            axes[1, 1].set_ylabel('Nombre de Soins')
-            axes[1, 1].legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        
-        plt.tight_layout()
-        plt.savefig('analyse_geographie.png', dpi=300, bbox_inches='tight')
-        plt.show()
-    
-    def visualiser_temporel(self):
+        self._visualiser('geographie', dossier)
+
+    def visualiser_temporel(self, dossier=DOSSIER_FIGURES):
         """📅 Visualisations - Temporel"""
         print("📊 Génération des graphiques - Analyse temporelle...")
-        
-        if 'date_soin' in self.df.columns:
-            fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-            fig.suptitle('📅 ANALYSE TEMPORELLE', fontsize=16, fontweight='bold')
-            
-            # 1. CA mensuel
-            self.df['mois'] = self.df['date_soin'].dt.to_period('M')
-            ca_mensuel = self.df.groupby('mois')['montant'].sum()
-            axes[0, 0].plot(range(len(ca_mensuel)), ca_mensuel.values, marker='o', linewidth=2)
-            axes[0, 0].set_title('Évolution du CA Mensuel')
-            axes[0, 0].set_xlabel('Mois')
-            axes[0, 0].set_ylabel('CA (CHF)')
-            axes[0, 0].grid(True, alpha=0.3)
-            
-            # 2. Patients par mois
-            patients_mensuel = self.df.groupby('mois')['patient_id'].nunique()
-            axes[0, 1].plot(range(len(patients_mensuel)), patients_mensuel.values, marker='s', linewidth=2, color='orange')
-            axes[0, 1].set_title('Évolution du Nombre de Patients')
-            axes[0, 1].set_xlabel('Mois')
-            axes[0, 1].set_ylabel('Nombre de Patients')
-            axes[0, 1].grid(True, alpha=0.3)
-            
-            # 3. Saisonnalité
-            self.df['mois_num'] = self.df['date_soin'].dt.month
-            saisonnalite = self.df.groupby('mois_num')['montant'].sum()
-            axes[1, 0].bar(saisonnalite.index, saisonnalite.values)
-            axes[1, 0].set_title('Saisonnalité - CA par Mois')
-            axes[1, 0].set_xlabel('Mois')
-            axes[1, 0].set_ylabel('CA (CHF)')
-            axes[1, 0].set_xticks(range(1, 13))
-            
-            # 4. Répartition des soins par jour de la semaine
-            self.df['jour_semaine'] = self.df['date_soin'].dt.day_name()
-            soins_jour = self.df.groupby('jour_semaine').size()
-            axes[1, 1].bar(range(len(soins_jour)), soins_jour.values)
-            axes[1, 1].set_xticks(range(len(soins_jour)))
-            axes[1, 1].set_xticklabels(soins_jour.index, rotation=45)
-            axes[1, 1].set_title('Répartition des Soins par Jour de la Semaine')
-            axes[1, 1].set_ylabel('Nombre de Soins')
-            
-            plt.tight_layout()
-            plt.savefig('analyse_temporelle.png', dpi=300, bbox_inches='tight')
-            plt.show()
-    
-    def generer_toutes_visualisations(self):
-        """Génère toutes les visualisations"""
+        self._visualiser('temporel', dossier)
+
+    def rendre_lot(self, dossier=DOSSIER_FIGURES, processus=None, dpi=DPI_FIGURES, forcer=False):
+        """Rendu par lot sans affichage, en parallèle sur un pool de processus
+
+        Les agrégats sont calculés ici ; seules les familles dont l'empreinte
+        est absente du cache de figures sont retracées.
+        Renvoie {famille: 'rendue' | 'en cache'}.
+        """
+        os.makedirs(dossier, exist_ok=True)
+        cache = self.cache_figures(dossier)
+
+        empreintes, taches, statuts = {}, {}, {}
+        for famille in FICHIERS_FIGURES:
+            agregats = self.agregats(famille)
+            if agregats is None:
+                continue
+            empreintes[famille] = empreinte_agregats(agregats, famille=famille, dpi=dpi)
+            chemin = None if forcer else cache.lire(empreintes[famille])
+            if chemin is not None:
+                cache.publier(chemin, os.path.join(dossier, FICHIERS_FIGURES[famille]))
+                statuts[famille] = 'en cache'
+                print(f"⏭️ {FICHIERS_FIGURES[famille]}: agrégats inchangés")
+            else:
+                taches[famille] = partial(rendre_figure, famille, agregats, dpi=dpi)
+
+        def _publier(famille, chemin):
+            cache.publier(chemin, os.path.join(dossier, FICHIERS_FIGURES[famille]))
+            statuts[famille] = 'rendue'
+            print(f"✅ {FICHIERS_FIGURES[famille]}")
+
+        if len(taches) == 1 or processus == 1:
+            # Un pool ne se justifie pas : rendu sur place, sur le backend Agg
+            backend = matplotlib.get_backend()
+            plt.switch_backend('Agg')
+            try:
+                for famille, tache in taches.items():
+                    _publier(famille, cache.ecrire(empreintes[famille], tache))
+            finally:
+                plt.switch_backend(backend)
+        elif taches:
+            with ProcessPoolExecutor(max_workers=processus, initializer=_initialiser_processus) as pool:
+                futurs = {pool.submit(cache.ecrire, empreintes[famille], tache): famille
+                          for famille, tache in taches.items()}
+                for futur in as_completed(futurs):
+                    _publier(futurs[futur], futur.result())
+
+        cache.evincer()
+        return statuts
+
+    def generer_toutes_visualisations(self, headless=False, processus=None, dossier=DOSSIER_FIGURES):
+        """Génère toutes les visualisations
+
+        En mode headless, les figures sont rendues par lot en parallèle, sans
+        affichage. Dans les deux modes, une figure dont les agrégats sont déjà
+        dans le cache de figures n'est pas réenregistrée.
+        """
         print("🚀 DÉBUT DE LA GÉNÉRATION DES VISUALISATIONS")
         print("="*60)
-        
+
         try:
-            self.visualiser_performance_soins()
-            self.visualiser_praticiens()
-            self.visualiser_patients()
-            self.visualiser_paiements()
-            self.visualiser_geographie()
-            self.visualiser_temporel()
-            
+            if headless:
+                self.rendre_lot(dossier=dossier, processus=processus)
+            else:
+                self.visualiser_performance_soins(dossier)
+                self.visualiser_praticiens(dossier)
+                self.visualiser_patients(dossier)
+                self.visualiser_paiements(dossier)
+                self.visualiser_geographie(dossier)
+                self.visualiser_temporel(dossier)
+                self.cache_figures(dossier).evincer()
+
+            stats = self.cache_figures(dossier).statistiques()
+            print(f"\n💾 Cache des figures: {stats['succes']} succès, {stats['echecs']} échec(s), "
+                  f"{stats['entrees']} entrée(s), {stats['occupation_mo']:.1f} Mo")
+
             print("\n" + "="*60)
             print("✅ TOUTES LES VISUALISATIONS ONT ÉTÉ GÉNÉRÉES")
-            print("📁 Les fichiers PNG ont été sauvegardés dans le répertoire courant")
+            print(f"📁 Les fichiers PNG ont été sauvegardés dans {dossier}/")
             print("="*60)
-            
+
         except Exception as e:
             print(f"❌ Erreur lors de la génération des visualisations: {e}")
 
 # Exécution des visualisations
 if __name__ == "__main__":
+    headless = '--headless' in sys.argv
+    processus = int(sys.argv[sys.argv.index('--processus') + 1]) if '--processus' in sys.argv else None
+    if headless:
+        matplotlib.use('Agg', force=True)
     try:
         visu = VisualisationsDentaire()
-        visu.generer_toutes_visualisations()
+        visu.generer_toutes_visualisations(headless=headless, processus=processus)
     except Exception as e:
         print(f"❌ Erreur lors de l'analyse: {e}")
-        print("🔍 Vérifiez que le fichier 'patients_mis_a_jour.xlsx' est présent dans le répertoire") 
\ No newline at end of file
+        print("🔍 Vérifiez que le fichier 'patients_mis_a_jour.xlsx' est présent dans le répertoire")
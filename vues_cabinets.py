@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Vues filtrées par cabinet, sans copie des données
+Auteur: Assistant IA
+Date: 2024
+
+Les lignes sont regroupées par cabinet une seule fois au chargement (tri
+stable : l'ordre d'origine est conservé à l'intérieur d'un cabinet). Chaque
+cabinet occupe alors une plage contiguë, et le filtre d'un cabinet est une
+tranche iloc : une vue sur les mêmes tableaux, pas une copie.
+
+Les vues partagent la mémoire du DataFrame complet : elles sont en lecture
+seule. Une page qui veut ajouter une colonne doit travailler sur une copie.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class VuesParCabinet:
+    """DataFrame regroupé par cabinet et plages de lignes de chaque cabinet"""
+
+    def __init__(self, df, colonne='cabinet'):
+        codes, valeurs = pd.factorize(df[colonne], sort=True)
+        # Les lignes sans cabinet (code -1) sont placées à la fin
+        codes = np.where(codes < 0, len(valeurs), codes)
+        ordre = np.argsort(codes, kind='stable')
+
+        self.colonne = colonne
+        self.df = df.take(ordre).reset_index(drop=True)
+        bornes = np.searchsorted(codes[ordre], np.arange(len(valeurs) + 1))
+        self.tranches = {
+            valeur: slice(int(bornes[i]), int(bornes[i + 1]))
+            for i, valeur in enumerate(valeurs)
+        }
+
+    def valeurs(self):
+        """Cabinets présents, triés"""
+        return list(self.tranches)
+
+    def vue(self, cabinet=None):
+        """Lignes d'un cabinet (toutes les lignes si cabinet vaut None), sans copie"""
+        if cabinet is None:
+            return self.df
+        return self.df.iloc[self.tranches[cabinet]]